@@ -2,16 +2,29 @@
 import streamlit as st
 import pandas as pd
 import json
+import asyncio
+import uuid
 from langchain_community.chat_models import ChatTongyi
 from langchain.agents import create_agent
-from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
+from langchain.agents.middleware import dynamic_prompt, ModelRequest
+from langchain_core.messages import HumanMessage, AIMessage, AIMessageChunk, ToolMessage
 from streamlit_agraph import agraph, Node, Edge, Config
 
 # --- 导入解耦的模块 ---
-from config import GRAPH_NAME, LLM_MODEL_NAME
-from tools import execute_cypher_query, generate_graph_from_data, search_knowledge_base
-from prompts import get_system_prompt       
-from memory import build_chat_context       
+from config import (GRAPH_NAME, LLM_MODEL_NAME, SUMMARY_MODEL_NAME, MEMORY_TOKEN_BUDGET, ANSWER_CACHE_ENABLED, ANSWER_CACHE_THRESHOLD,
+                    ANSWER_CACHE_MAX_ENTRIES, EXAMPLE_QUESTIONS, WARMUP_ENABLED, WARMUP_RUN_AGENT,
+                    SCHEMA_SELECTION_ENABLED, SCHEMA_SELECT_THRESHOLD, SCHEMA_MIN_CONFIDENCE, SCHEMA_FULL_MAX_LABELS,
+                    ENTITY_LINKING_ENABLED, INTENT_ROUTER_ENABLED)
+from tools import (execute_cypher_query, generate_graph_from_data, search_knowledge_base, hybrid_search, recall_tool_result,
+                   is_tool_error, RETRIEVER, ENTITY_LINKER, INTENT_ROUTER)
+from db import data_version
+from cache import SemanticAnswerCache
+from warmup import build_warmup
+from prompts import get_system_prompt, generate_schema_description
+from schema_provider import get_schema
+from schema_selector import SchemaSelector
+from entity_linker import format_entity_hints
+from memory import build_chat_context, make_llm_summarizer
 
 # ================== 1. 页面配置 ==================
 st.set_page_config(page_title="地灾数据助手", page_icon="🌍", layout="centered")
@@ -24,37 +37,43 @@ with st.sidebar:
     st.subheader("🧠 记忆设置")
     memory_type = st.radio(
         "记忆模式",
-        ("滑动窗口 (推荐)", "全量记忆 (Token消耗大)", "不记忆 (单轮对话)"),
+        ("滑动窗口 (推荐)", "Token 预算 + 滚动摘要", "全量记忆 (Token消耗大)", "不记忆 (单轮对话)"),
         index=0
     )
     
     # 映射 UI 选项到代码策略 key
     strategy_map = {
         "滑动窗口 (推荐)": "window",
+        "Token 预算 + 滚动摘要": "budget",
         "全量记忆 (Token消耗大)": "full",
         "不记忆 (单轮对话)": "none"
     }
     selected_strategy = strategy_map[memory_type]
     
-    # 只有选滑动窗口时才显示滑块
+    # 只有选滑动窗口时才显示滑块 (窗口按整轮保留，k 为消息条数 = 轮数 * 2)
     window_k = 6
     if selected_strategy == "window":
-        window_k = st.slider("记忆轮数 (消息条数)", min_value=2, max_value=20, value=6, step=2)
+        window_k = 2 * st.slider("记忆轮数 (最近几轮问答)", min_value=1, max_value=10, value=3)
+
+    # Token 预算策略：超出预算的早期轮次折叠为摘要
+    token_budget = MEMORY_TOKEN_BUDGET
+    if selected_strategy == "budget":
+        token_budget = st.slider("历史 Token 预算", min_value=500, max_value=8000, value=MEMORY_TOKEN_BUDGET, step=500)
+        summary = st.session_state.get("memory_summary", {}).get("summary")
+        if summary:
+            with st.expander("📝 早期对话摘要"):
+                st.markdown(summary)
 
     st.divider()
     
     # --- 常用功能 ---
     if st.button("🗑️ 清空对话历史", width='stretch'):
         st.session_state.messages = []
+        st.session_state.memory_summary = {}
         st.rerun()
 
     st.markdown("### 💡 快捷提问")
-    example_questions = ["朱炳湖负责的防御区中面积最大的是哪个？",
-                         "哪些防御区风险等级是中级？",
-                         "承灾体里威胁财产最多的前5个？",
-                         "哪些防御区是坡度较缓",
-                         "人工切坡高2米的防御区具体信息，以及对应的负责人是谁"]
-    for q in example_questions:
+    for q in EXAMPLE_QUESTIONS:
         if st.button(q, width='stretch'):
             st.session_state.current_prompt = q
 
@@ -62,26 +81,265 @@ with st.sidebar:
 st.title(f"🌍 地灾数据智能助手")
 st.caption(f"当前连接图谱: `{GRAPH_NAME}` | 记忆模式: `{memory_type}`")
 
+def build_schema_selector(snapshot):
+    """按问题挑选 Schema 子集 (复用 bge-small 编码标签描述)"""
+    encoder = (lambda texts: RETRIEVER.encode(texts, normalize_embeddings=True)) if RETRIEVER is not None else None
+    return SchemaSelector(snapshot.schema, snapshot.relationships, encoder=encoder,
+                          threshold=SCHEMA_SELECT_THRESHOLD, min_confidence=SCHEMA_MIN_CONFIDENCE,
+                          full_max_labels=SCHEMA_FULL_MAX_LABELS)
+
+
+def latest_question(messages: list) -> str:
+    """取最后一条用户消息 (即当前问题)"""
+    for msg in reversed(messages):
+        if isinstance(msg, HumanMessage):
+            return msg.content if isinstance(msg.content, str) else ""
+    return ""
+
+
 @st.cache_resource
 def get_agent_instance():
     # 初始化模型
     llm = ChatTongyi(model_name=LLM_MODEL_NAME, temperature=0)
-    tools = [execute_cypher_query, search_knowledge_base]
-    
-    # 从 prompts.py 获取提示词
-    system_prompt = get_system_prompt()
-    print(f"[app] 提示词： {system_prompt}")
-    
-    return create_agent(model=llm, tools=tools, system_prompt=system_prompt)
+    tools = [execute_cypher_query, search_knowledge_base, hybrid_search, recall_tool_result]
+
+    # (数据版本, SchemaSelector)：Schema 随数据版本刷新。多个会话线程共用，整体替换元组而不是修改字典，
+    # 避免一个线程清空时另一个线程查找失败
+    selector_entry = None
+
+    @dynamic_prompt
+    def schema_aware_prompt(request: ModelRequest) -> str:
+        """
+        每次调用模型前取当前 Schema (按数据版本缓存)，识别问题中的实体作为提示，
+        并按问题与命中实体的标签挑选 Schema 子集 (结果按问题缓存)
+        """
+        nonlocal selector_entry
+        question = latest_question(request.state["messages"])
+        matches = ENTITY_LINKER.link(question) if ENTITY_LINKING_ENABLED else []
+        hints = format_entity_hints(matches)
+        if hints:
+            print(f"[app] 实体链接: {[(m.text, m.how) for m in matches]}")
+
+        snapshot = get_schema()
+        if not SCHEMA_SELECTION_ENABLED:
+            return get_system_prompt(entity_hints=hints)
+        entry = selector_entry
+        if entry is None or entry[0] != snapshot.version:
+            entry = (snapshot.version, build_schema_selector(snapshot))
+            selector_entry = entry
+        entity_labels = {e.label for m in matches for e in m.entities}
+        selection = entry[1].select(question, entity_hits=entity_labels)
+        if selection.full:
+            return get_system_prompt(entity_hints=hints)
+        print(f"[app] Schema 子集: {list(selection.schema)} ({selection.reason})")
+        return get_system_prompt(generate_schema_description(selection.schema, selection.relationships), hints)
+
+    return create_agent(model=llm, tools=tools, middleware=[schema_aware_prompt])
 
 agent = get_agent_instance()
 
+
+@st.cache_resource
+def get_summarizer():
+    """滚动摘要使用的小模型 (比主模型便宜、快)"""
+    return make_llm_summarizer(ChatTongyi(model_name=SUMMARY_MODEL_NAME, temperature=0))
+
+
+@st.cache_resource
+def get_answer_cache():
+    """进程内共享的语义答案缓存 (复用 bge-small 检索模型编码问题)；模型未加载时不启用"""
+    if not ANSWER_CACHE_ENABLED or RETRIEVER is None:
+        return None
+    return SemanticAnswerCache(
+        encoder=lambda texts: RETRIEVER.encode(texts, normalize_embeddings=True),
+        threshold=ANSWER_CACHE_THRESHOLD,
+        max_entries=ANSWER_CACHE_MAX_ENTRIES,
+        version_provider=data_version
+    )
+
+answer_cache = get_answer_cache()
+
+if answer_cache is not None:
+    with st.sidebar:
+        st.divider()
+        cache_stats = answer_cache.stats()
+        st.caption(f"⚡ 答案缓存: {cache_stats['entries']} 条 | 命中 {cache_stats['hits']}/{cache_stats['lookups']}")
+        if st.button("清空答案缓存", width='stretch'):
+            answer_cache.clear()
+
+
+@st.cache_resource
+def get_warmup():
+    """进程启动时只执行一次的后台预热 (模型、连接池、快捷问题答案)"""
+    return build_warmup(agent, answer_cache, EXAMPLE_QUESTIONS, run_agent=WARMUP_RUN_AGENT).start()
+
+
+def render_warmup_status():
+    """侧边栏预热进度 (预热期间每 2 秒局部刷新)"""
+    snapshot = warmup.snapshot()
+    if snapshot["done"]:
+        failed = [s["name"] for s in snapshot["steps"] if s["status"] == "failed"]
+        if failed:
+            st.caption(f"🔥 预热完成，{len(failed)} 项失败: {', '.join(failed)}")
+        else:
+            st.caption("🔥 预热完成")
+        return
+    st.progress(snapshot["progress"], text=f"🔥 预热中: {snapshot['current'] or '准备中'}")
+    with st.expander("预热详情", expanded=False):
+        icons = {"pending": "⏳", "running": "🔄", "done": "✅", "failed": "❌"}
+        for s in snapshot["steps"]:
+            st.caption(f"{icons[s['status']]} {s['name']} {s['detail']}")
+
+
+if WARMUP_ENABLED:
+    warmup = get_warmup()
+    with st.sidebar:
+        st.fragment(run_every=None if warmup.done else 2)(render_warmup_status)()
+
+
+def extract_tool_rows(content: str) -> list:
+    """
+    从工具返回中提取可展示为表格的数据行
+
+    Args:
+        content (str): 工具返回的原始文本
+
+    Returns:
+        list: 数据行列表 (无法解析时为空列表)
+    """
+    try:
+        # 1. 解析 JSON
+        data = json.loads(content)
+    except Exception as e:
+        print(f"数据解析失败: {e}")
+        return []
+
+    # 2. 情况 A: 图谱查询 (直接返回 List)
+    if isinstance(data, list):
+        return data
+
+    # 3. 情况 B: 语义检索 (返回 Dict，数据在 'search_results' 里)
+    if isinstance(data, dict) and isinstance(data.get('search_results'), list):
+        return data['search_results']
+
+    # 4. 情况 C: 图谱查询零结果后自动改写命中 (数据在 'results' 里，改写说明在 'rewrite' 里)
+    if isinstance(data, dict) and isinstance(data.get('results'), list):
+        return data['results']
+    return []
+
+
+def extract_rewrite(content: str):
+    """图谱查询零结果后自动改写命中时，返回改写说明 {"step", "description", "cypher"}"""
+    try:
+        data = json.loads(content)
+    except Exception:
+        return None
+    return data.get('rewrite') if isinstance(data, dict) else None
+
+
+async def stream_agent_turn(input_payload: dict, status, msg_placeholder) -> tuple:
+    """
+    以流式方式执行一轮 Agent 对话
+
+    使用异步接口 astream：模型在同一步中发出多个工具调用时 (如语义检索 + 图谱查询)，
+    工具的异步实现并发执行，单步耗时取决于最慢的调用而不是各调用之和。
+
+    同时订阅两种流:
+    - messages: 模型输出的 token，逐个追加到 msg_placeholder
+    - updates : 每个节点执行完的状态增量，用于在 status 中显示工具调用的开始/结束，
+                并在每个 ToolMessage 到达时立即渲染数据表格
+
+    Args:
+        input_payload (dict): build_chat_context 构建的输入
+        status: st.status 容器
+        msg_placeholder: 回答占位符 (st.empty)
+
+    Returns:
+        tuple: (最终回答, 工具返回列表 [{"name", "content"}], 本轮 Agent 产生的全部消息)
+    """
+    streamed_text = ""
+    final_response = ""
+    tool_payloads = []
+    turn_messages = []
+
+    async for mode, chunk in agent.astream(input_payload, stream_mode=["messages", "updates"]):
+        if mode == "messages":
+            token, metadata = chunk
+            # 只显示模型的文本 token，工具调用参数的增量片段不显示
+            if isinstance(token, AIMessageChunk) and isinstance(token.content, str) \
+                    and token.content and not token.tool_call_chunks:
+                streamed_text += token.content
+                msg_placeholder.markdown(streamed_text + "▌")
+            continue
+
+        # mode == "updates": {节点名: 状态增量}
+        for node_name, update in chunk.items():
+            for msg in (update or {}).get("messages", []):
+                turn_messages.append(msg)
+                if isinstance(msg, AIMessage) and msg.tool_calls:
+                    # 调用工具前模型输出的文字只是中间思考，不作为最终回答
+                    streamed_text = ""
+                    msg_placeholder.empty()
+                    for call in msg.tool_calls:
+                        status.write(f"🔧 调用工具 `{call['name']}`: `{json.dumps(call['args'], ensure_ascii=False)}`")
+                elif isinstance(msg, ToolMessage):
+                    tool_payloads.append({"name": msg.name, "content": msg.content})
+                    rows = extract_tool_rows(msg.content)
+                    status.write(f"✅ 工具 `{msg.name}` 返回 {len(rows)} 条数据")
+                    rewrite = extract_rewrite(msg.content)
+                    if rewrite:
+                        status.write(f"↪️ 原查询无结果，已自动改写 ({rewrite['description']}): `{rewrite['cypher']}`")
+                    if rows:
+                        # 图谱可视化 (待启用)：数据含 source/target 结构时可用 generate_graph_from_data + agraph 绘制
+                        st.dataframe(pd.json_normalize(rows))
+                elif isinstance(msg, AIMessage):
+                    final_response = msg.content
+
+    print(f"[App] Agent 最终回复：{final_response}")
+    return final_response or streamed_text, tool_payloads, turn_messages
+
+
+def render_cache_hit(hit, status, msg_placeholder):
+    """展示缓存命中的回答与当时的工具数据，并标注来源"""
+    status.update(label=f"⚡ 命中答案缓存 (相似度 {hit.similarity:.2f})", state="complete", expanded=False)
+    status.write(f"复用问题「{hit.question}」的回答，未调用模型与工具")
+    for payload in hit.tool_payloads:
+        rows = extract_tool_rows(payload["content"])
+        if rows:
+            st.dataframe(pd.json_normalize(rows))
+    msg_placeholder.markdown(hit.answer)
+    st.caption(f"⚡ 来自答案缓存：与「{hit.question}」相似 (数据版本未变化)")
+
+
+def render_route_result(routed, status, msg_placeholder) -> list:
+    """
+    展示模板直达的回答，并返回写入历史的消息
+    (按一次 execute_cypher_query 调用记录，后续追问可以引用这次的查询结果)
+    """
+    status.update(label=f"⚡ 模板直达: {routed.intent}", state="complete", expanded=False)
+    status.write(f"`{routed.cypher}`")
+    st.dataframe(pd.json_normalize(routed.rows))
+    msg_placeholder.markdown(routed.answer)
+    st.caption("⚡ 常见问题模板直达，未调用模型")
+
+    call_id = f"route-{uuid.uuid4().hex[:8]}"
+    return [
+        AIMessage(content="", tool_calls=[{"name": "execute_cypher_query",
+                                           "args": {"cypher_query": routed.cypher}, "id": call_id}]),
+        ToolMessage(content=routed.tool_payloads[0]["content"], tool_call_id=call_id, name="execute_cypher_query"),
+        AIMessage(content=routed.answer),
+    ]
+
 # ================== 4. 渲染历史与处理输入 ==================
 if "messages" not in st.session_state:
     st.session_state.messages = []
+if "memory_summary" not in st.session_state:
+    st.session_state.memory_summary = {}   # budget 策略的滚动摘要 {"summary", "covered"}
 
-# 渲染历史
+# 渲染历史 (工具调用与工具返回只作为上下文保存，不显示)
 for msg in st.session_state.messages:
+    if isinstance(msg, ToolMessage) or (isinstance(msg, AIMessage) and (msg.tool_calls or not msg.content)):
+        continue
     avatar = "🧑‍💻" if isinstance(msg, HumanMessage) else "🤖"
     with st.chat_message(msg.type, avatar=avatar):
         st.markdown(msg.content)
@@ -107,91 +365,60 @@ if user_input:
     with st.chat_message("user", avatar="🧑‍💻"):
         st.markdown(user_input)
 
-    # 2. 调用 Agent
+    # 2. 调用 Agent (流式：工具调用进度写入 status，回答逐 token 写入 msg_placeholder)
     with st.chat_message("assistant", avatar="🤖"):
         msg_placeholder = st.empty()
         status = st.status("🧠 思考中...", expanded=True)
         
         try:
-            status.write(f"正在构建上下文 (策略: {selected_strategy})...")
-            
-            # [新] 调用 memory.py 构建上下文
-            input_payload = build_chat_context(
-                current_prompt=user_input,
-                history=st.session_state.messages,
-                strategy=selected_strategy,
-                k=window_k
-            )
-
-            # 
-            # input_data = {
-            #     "messages": [
-            #         {"role": "user", "content": user_input}
-            #     ]
-            # }
-            
-            # Agent 执行
-            result = agent.invoke(input_payload)
-            # result = agent.invoke(input_data)
-
-            final_response = result['messages'][-1].content
-
-            # --- 数据提取逻辑 ---
-            raw_data_json = None # 保存原始 JSON 列表
-            raw_data_df = None   # 保存表格 DF
-
-            print(f"[App] Agent回复的信息：{result['messages']}")
-
-            # 提取数据
-            raw_data_list = []
-            for msg in result['messages']:
-                if isinstance(msg, ToolMessage):
-                    try:
-                        # 1. 解析 JSON
-                        data = json.loads(msg.content)
-                        
-                        # 2. 情况 A: 图谱查询 (直接返回 List)
-                        if isinstance(data, list):
-                            raw_data_list.extend(data) # 建议用 extend 而不是 =，防止被覆盖
-                        
-                        # 3. 情况 B: 语义检索 (返回 Dict，数据在 'search_results' 里)
-                        elif isinstance(data, dict):
-                            # 优先找 search_results
-                            if 'search_results' in data and isinstance(data['search_results'], list):
-                                raw_data_list.extend(data['search_results'])
-                            # 兼容性兜底: 如果以后有其他返回 dict 的工具，也可以在这里处理
-                            
-                    except Exception as e:
-                        print(f"数据解析失败: {e}")
-                        pass
-            
-            # === 1. 展示图谱 (新增功能) ===
-            # if raw_data_jPson is not None:
-            #     # 只有当数据里包含 source/target 结构时才画图，防止纯节点查询报错
-            #     # 简单的判断逻辑：看第一条数据有没有 'source' 键
-            #     if "source" in raw_data_json[0] and "target" in raw_data_json[0]:
-            #         with st.expander("🕸️ 知识图谱可视化", expanded=True):
-            #             nodes, edges, config = generate_graph_from_data(raw_data_json)
-            #             # 渲染图谱
-            #             agraph(nodes=nodes, edges=edges, config=config)
-            
-            # === 2. 展示表格 (原有功能) ===
-            print(f'展示表格数据: {raw_data_df}')
-            # 显示表格
-            if raw_data_list:
-                df = pd.json_normalize(raw_data_list)
-                st.dataframe(df)
-
-            status.update(label="✅ 完成", state="complete", expanded=False)
+            # 0. 语义答案缓存：相同/近似问题且数据未更新时直接复用
+            #    缓存只按问题索引，带历史上下文的回答可能依赖前文，此时不查也不写
+            use_cache = answer_cache is not None and (selected_strategy == "none" or not st.session_state.messages)
+            cache_hit = answer_cache.lookup(user_input) if use_cache else None
+            # 1. 常见问题模板直达：完整匹配固定句式时不调用大模型
+            routed = INTENT_ROUTER.route(user_input) if cache_hit is None and INTENT_ROUTER_ENABLED else None
+            if cache_hit is not None:
+                render_cache_hit(cache_hit, status, msg_placeholder)
+                turn_messages = [AIMessage(content=cache_hit.answer)]
+            elif routed is not None:
+                turn_messages = render_route_result(routed, status, msg_placeholder)
+                # 模板直达只依据问题本身，与历史无关，可以缓存
+                if answer_cache is not None:
+                    answer_cache.store(user_input, routed.answer, routed.tool_payloads)
+            else:
+                status.write(f"正在构建上下文 (策略: {selected_strategy})...")
             
+                # [新] 调用 memory.py 构建上下文
+                input_payload = build_chat_context(
+                    current_prompt=user_input,
+                    history=st.session_state.messages,
+                    strategy=selected_strategy,
+                    k=window_k,
+                    token_budget=token_budget,
+                    summary_state=st.session_state.memory_summary,
+                    summarizer=get_summarizer()
+                )
+
+                final_response, tool_payloads, turn_messages = asyncio.run(
+                    stream_agent_turn(input_payload, status, msg_placeholder))
+
+                status.update(label="✅ 完成", state="complete", expanded=False)
             
-            # 显示文本回复
-            msg_placeholder.markdown(final_response)
+                # 显示文本回复 (去掉流式光标)
+                msg_placeholder.markdown(final_response)
+
+                # 写入答案缓存 (工具失败/超时的回答不缓存)
+                if use_cache and not any(is_tool_error(p["content"]) for p in tool_payloads):
+                    answer_cache.store(user_input, final_response, tool_payloads)
             
+                # 保留完整的工具调用链，早期轮次的工具返回在构建上下文时压缩 (见 memory.compact_history)
+                if not turn_messages or turn_messages[-1].content != final_response:
+                    turn_messages.append(AIMessage(content=final_response))
+
             # 3. 更新历史 (成功后才存入)
-            # st.session_state.messages.append(HumanMessage(content=user_input))
-            # st.session_state.messages.append(AIMessage(content=final_response))
+            st.session_state.messages.append(HumanMessage(content=user_input))
+            st.session_state.messages.extend(turn_messages)
             
         except Exception as e:
             status.update(label="❌ 出错", state="error")
-            msg_placeholder.error(f"Error: {str(e)}")
\ No newline at end of file
+            msg_placeholder.error(f"Error: {str(e)}")
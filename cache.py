@@ -0,0 +1,180 @@
+# cache.py
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+import numpy as np
+
+# 比较问题时可以忽略的虚词 (两个问题只在这些字上不同，视为同一个问题)
+FILLER_CHARS = set("的是了吗呢吧啊呀么请问帮我下一看查询找出列都所有全部哪些什个")
+# 指代上文的词：这类问题依赖对话上下文，不能脱离历史复用答案
+CONTEXT_WORDS = ("它", "他们", "她们", "他", "她", "这些", "那些", "上述", "上面", "刚才", "其中", "该", "这个", "那个")
+
+_PUNCT_RE = re.compile(r"[\s　-〿＀-／：-＠,.!?;:'\"()\[\]{}<>]+")
+_TOKEN_RE = re.compile(r"[0-9]+(?:\.[0-9]+)?|[A-Za-z]+")
+
+
+def normalize_question(question: str) -> str:
+    """去掉空白与标点，统一小写"""
+    return _PUNCT_RE.sub("", question).lower()
+
+
+def is_context_dependent(question: str) -> bool:
+    """问题是否指代上文 (如 "它的负责人是谁")"""
+    return any(word in question for word in CONTEXT_WORDS)
+
+
+def lexically_compatible(a: str, b: str) -> bool:
+    """
+    两个问题是否只在虚词上有差别
+
+    向量相似度对 "风险等级是中级" / "风险等级是高级"、不同编号的问题区分不开，
+    因此命中还要求数字/字母串完全相同，且去掉 FILLER_CHARS 后其余字符的顺序与次数完全一致
+    (按字符集合比较会把 "北区是否属于南区" / "南区是否属于北区" 视为同一个问题)。
+    """
+    a, b = normalize_question(a), normalize_question(b)
+    if _TOKEN_RE.findall(a) != _TOKEN_RE.findall(b):
+        return False
+    # 数字/字母串替换为占位符，保留其在句中的位置
+    return _content_chars(a) == _content_chars(b)
+
+
+def _content_chars(question: str) -> List[str]:
+    return [c for c in _TOKEN_RE.sub("#", question) if c not in FILLER_CHARS]
+
+
+@dataclass
+class CacheEntry:
+    question: str
+    answer: str
+    tool_payloads: List[dict]          # [{"name": 工具名, "content": 工具原始返回}]
+    version: str
+    embedding: np.ndarray
+    created_at: float = field(default_factory=time.time)
+    hits: int = 0
+
+
+@dataclass
+class CacheHit:
+    question: str                      # 缓存中的原问题
+    answer: str
+    tool_payloads: List[dict]
+    similarity: float
+
+
+class SemanticAnswerCache:
+    """
+    语义答案缓存：按问题向量查找相近的已答问题，复用最终回答与工具返回
+
+    - 精确匹配 (规范化文本相同) 不需要计算向量
+    - 近似匹配要求余弦相似度 >= threshold 且 lexically_compatible
+    - 每条记录带数据版本戳，版本变化后旧记录不再命中 (并在下次写入时清理)
+    - 超过 max_entries 时按最近最少使用淘汰
+    """
+
+    def __init__(self, encoder: Callable[[List[str]], np.ndarray], threshold: float = 0.93,
+                 max_entries: int = 512, version_provider: Optional[Callable[[], str]] = None):
+        """
+        Args:
+            encoder: 文本列表 -> 归一化向量矩阵 (如 bge-small 的 encode(normalize_embeddings=True))
+            threshold: 余弦相似度阈值
+            max_entries: 最大条目数
+            version_provider: 返回当前数据版本戳的函数，缺省时不做版本失效
+        """
+        self.encoder = encoder
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.version_provider = version_provider or (lambda: "")
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()  # 规范化问题 -> 记录
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+
+    def _encode(self, question: str) -> np.ndarray:
+        return np.asarray(self.encoder([question]), dtype="float32")[0]
+
+    def lookup(self, question: str) -> Optional[CacheHit]:
+        """
+        查找可复用的答案
+
+        Args:
+            question (str): 用户问题
+
+        Returns:
+            CacheHit | None: 命中时返回原问题、答案、工具返回与相似度
+        """
+        if is_context_dependent(question):
+            return None
+        key = normalize_question(question)
+        version = self.version_provider()
+        with self._lock:
+            self.lookups += 1
+            entry = self._entries.get(key)
+            if entry is not None and entry.version == version:
+                return self._hit(entry, 1.0)
+            if not any(e.version == version for e in self._entries.values()):
+                return None
+
+        # 向量编码在锁外进行，不阻塞其他会话
+        query = self._encode(question)
+        with self._lock:
+            entry, similarity = self._nearest(question, query, version)
+            return None if entry is None else self._hit(entry, similarity)
+
+    def _hit(self, entry: CacheEntry, similarity: float) -> CacheHit:
+        entry.hits += 1
+        self.hits += 1
+        self._entries.move_to_end(normalize_question(entry.question))
+        return CacheHit(entry.question, entry.answer, entry.tool_payloads, similarity)
+
+    def _nearest(self, question: str, query: np.ndarray, version: str):
+        candidates = [e for e in self._entries.values() if e.version == version]
+        if not candidates:
+            return None, 0.0
+        scores = np.stack([e.embedding for e in candidates]) @ query
+        for i in np.argsort(-scores):
+            if scores[i] < self.threshold:
+                break
+            if lexically_compatible(question, candidates[i].question):
+                return candidates[i], float(scores[i])
+        return None, 0.0
+
+    def store(self, question: str, answer: str, tool_payloads: List[dict]):
+        """
+        写入一条已答问题 (依赖上下文的问题不写入)
+
+        Args:
+            question (str): 用户问题
+            answer (str): 最终回答
+            tool_payloads (list): 本轮工具返回 [{"name", "content"}]
+        """
+        if not answer or is_context_dependent(question):
+            return
+        version = self.version_provider()
+        entry = CacheEntry(question, answer, list(tool_payloads), version, self._encode(question))
+        with self._lock:
+            # 顺带清理旧版本记录
+            for key in [k for k, e in self._entries.items() if e.version != version]:
+                del self._entries[key]
+            key = normalize_question(question)
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """条目数、查询次数、命中次数与命中率"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+            }
@@ -15,11 +15,75 @@ DB_CONFIG = {
     "password": os.getenv("DB_PASSWORD", "postgres")
 }
 
+# 连接池大小与单条语句超时 (毫秒)
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "8"))
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "20000"))
+
+# 单次工具调用超时 (秒)，超时后返回提示文本，不阻塞同一步中的其他工具调用
+TOOL_TIMEOUT_SECONDS = float(os.getenv("TOOL_TIMEOUT_SECONDS", "30"))
+# 模型推理 (向量编码 / 重排序) 线程池大小
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "2"))
+
+# 数据版本戳：留空时按图谱/向量表的写入统计自动计算 (缓存 TTL 秒)，发布数据时也可手动指定
+DATA_VERSION = os.getenv("DATA_VERSION", "")
+DATA_VERSION_TTL_SECONDS = float(os.getenv("DATA_VERSION_TTL_SECONDS", "60"))
+
+# 语义答案缓存：问题向量相似度阈值与最大条目数 (ANSWER_CACHE_ENABLED=0 关闭)
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.93"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "512"))
+
 GRAPH_NAME = os.getenv("GRAPH_NAME", "kg_graph2")
 ORIGIN_NAME = os.getenv("ORIGIN_NAME", "kg2_stg")
 
 LLM_MODEL_NAME = os.getenv("LLM_MODEL_NAME", "qwen-max")
 
+# 对话记忆 (Token 预算策略)：历史消息的 token 上限；移出窗口的轮次用小模型滚动摘要
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "3000"))
+SUMMARY_MODEL_NAME = os.getenv("SUMMARY_MODEL_NAME", "qwen-turbo")
+
+# Cypher 零结果时在工具内自动改写重试 (CYPHER_FALLBACK_ENABLED=0 关闭)；取值字典每个属性最多缓存的取值数
+CYPHER_FALLBACK_ENABLED = os.getenv("CYPHER_FALLBACK_ENABLED", "1") == "1"
+CYPHER_FALLBACK_MAX_VALUES = int(os.getenv("CYPHER_FALLBACK_MAX_VALUES", "5000"))
+
+# 图谱 Schema 来源：live 从 AGE 目录实时读取 (schema.py 与 Excel 映射表作为说明/ID 键的覆盖来源)；static 只用 schema.py
+SCHEMA_SOURCE = os.getenv("SCHEMA_SOURCE", "live")
+SCHEMA_EXCEL_PATH = os.getenv("SCHEMA_EXCEL_PATH", "")
+SCHEMA_SAMPLE_SIZE = int(os.getenv("SCHEMA_SAMPLE_SIZE", "200"))
+
+# 混合检索工具 (hybrid_search)：每条语义命中最多返回的图谱邻居数
+HYBRID_MAX_NEIGHBOURS = int(os.getenv("HYBRID_MAX_NEIGHBOURS", "20"))
+
+# 实体链接：从图谱的 ID/名称属性构建词典，识别问题中的人名、编号、单位名并作为提示注入 (ENTITY_LINKING_ENABLED=0 关闭)
+# 数据版本变化时增量读取新增节点，每隔 ENTITY_FULL_REFRESH_SECONDS 全量重建
+ENTITY_LINKING_ENABLED = os.getenv("ENTITY_LINKING_ENABLED", "1") == "1"
+ENTITY_FULL_REFRESH_SECONDS = float(os.getenv("ENTITY_FULL_REFRESH_SECONDS", "3600"))
+
+# 系统提示词中的 Schema 按问题挑选子集 (SCHEMA_SELECTION_ENABLED=0 时始终使用完整 Schema)
+# 标签数不超过 SCHEMA_FULL_MAX_LABELS 的图谱不做裁剪；无直接命中且相似度低于 SCHEMA_MIN_CONFIDENCE 时回退为完整 Schema
+SCHEMA_SELECTION_ENABLED = os.getenv("SCHEMA_SELECTION_ENABLED", "1") == "1"
+SCHEMA_SELECT_THRESHOLD = float(os.getenv("SCHEMA_SELECT_THRESHOLD", "0.55"))
+SCHEMA_MIN_CONFIDENCE = float(os.getenv("SCHEMA_MIN_CONFIDENCE", "0.6"))
+SCHEMA_FULL_MAX_LABELS = int(os.getenv("SCHEMA_FULL_MAX_LABELS", "6"))
+
+# 常见问题模板直达：问题完整匹配固定句式 (谁核查某防御区 / 某人核查哪些防御区 / 威胁财产前 N 的承灾体 / 某风险等级的防御区) 时
+# 直接执行参数化 Cypher 并格式化回答，不调用大模型 (INTENT_ROUTER_ENABLED=0 关闭)
+INTENT_ROUTER_ENABLED = os.getenv("INTENT_ROUTER_ENABLED", "1") == "1"
+
+# 侧边栏快捷提问 (启动预热时会预先执行并写入答案缓存)
+EXAMPLE_QUESTIONS = [
+    "朱炳湖负责的防御区中面积最大的是哪个？",
+    "哪些防御区风险等级是中级？",
+    "承灾体里威胁财产最多的前5个？",
+    "哪些防御区是坡度较缓",
+    "人工切坡高2米的防御区具体信息，以及对应的负责人是谁"
+]
+
+# 启动预热：WARMUP_ENABLED=0 关闭；WARMUP_RUN_AGENT=0 时只预热模型与连接，不执行快捷问题
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1") == "1"
+WARMUP_RUN_AGENT = os.getenv("WARMUP_RUN_AGENT", "1") == "1"
+
 # 简单检查
 if not DASHSCOPE_API_KEY:
     raise ValueError("❌ 未找到 DASHSCOPE_API_KEY，请检查 .env 文件！")
\ No newline at end of file
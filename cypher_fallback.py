@@ -0,0 +1,328 @@
+# cypher_fallback.py
+import difflib
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+# 属性名：普通标识符 (含中文) 或反引号包裹
+_KEY = r"(?:\w+|`[^`]+`)"
+# 字面量：单/双引号字符串或数字
+_LITERAL = r"(?:'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|-?\d+(?:\.\d+)?)"
+
+# WHERE 中的等值条件: n.key = 'value'
+_WHERE_EQ_RE = re.compile(rf"\b(\w+)\.({_KEY})\s*=\s*({_LITERAL})")
+# 节点上的属性 Map: (n:Label {{key: 'value', ...}})
+_NODE_MAP_RE = re.compile(r"\((\w*)\s*(?::\s*(\w+|`[^`]+`))?\s*\{([^{}]*)\}\s*\)")
+_MAP_ENTRY_RE = re.compile(rf"\s*({_KEY})\s*:\s*({_LITERAL})\s*")
+# 模式中的 "变量:标签"
+_VAR_LABEL_RE = re.compile(r"\((\w+)\s*:\s*(\w+|`[^`]+`)")
+# 子句关键字 (用于定位 MATCH 模式与 WHERE 表达式的结束位置)
+_CLAUSE_RE = re.compile(r"\b(WHERE|RETURN|WITH|OPTIONAL\s+MATCH|MATCH|ORDER\s+BY|UNWIND|SKIP|LIMIT)\b", re.IGNORECASE)
+# 有方向的关系
+_RIGHT_ARROW_RE = re.compile(r"(-\[[^\]]*\])->")
+_LEFT_ARROW_RE = re.compile(r"<-(\[[^\]]*\]-)")
+
+_PLACEHOLDER = "__FALLBACK_COND_{}__"
+
+# 编号类属性名：id / xxx_id / 编号 / 代码 / 编码 / 拼音缩写 bh (编号)、dm (代码) 结尾
+_ID_KEY_RE = re.compile(r"(?:^|_)id$|^id_|编号|代码|编码|bh$|dm$", re.IGNORECASE)
+
+
+@dataclass
+class Predicate:
+    var: str
+    key: str                           # 不含反引号的属性名
+    value: object                      # 字面量的 Python 值
+    label: Optional[str] = None
+
+
+@dataclass
+class FallbackResult:
+    rows: list
+    rewrite: Optional[dict] = None     # {"step", "description", "cypher"}
+    tried: List[str] = field(default_factory=list)
+
+    def tried_note(self) -> str:
+        """零结果提示后附加的说明，避免模型重复尝试同样的改写"""
+        if not self.tried:
+            return ""
+        return "\n(系统已自动尝试以下改写，均无结果: " + "；".join(self.tried) + ")"
+
+
+def _strip_ticks(name: str) -> str:
+    return name[1:-1].replace("``", "`") if name.startswith("`") else name
+
+
+def _quote_key(key: str) -> str:
+    return key if re.fullmatch(r"\w+", key) else "`" + key.replace("`", "``") + "`"
+
+
+def parse_literal(text: str):
+    """Cypher 字面量 -> Python 值"""
+    if text[0] in "'\"":
+        return re.sub(r"\\(.)", r"\1", text[1:-1])
+    return float(text) if "." in text else int(text)
+
+
+def to_literal(value) -> str:
+    """Python 值 -> Cypher 字面量"""
+    if isinstance(value, bool) or value is None:
+        return str(value).lower() if value is not None else "null"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return "'" + str(value).replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def normalize_value(value) -> str:
+    """统一大小写并去掉空白 (含全角空格)"""
+    return re.sub(r"\s+", "", str(value)).lower()
+
+
+def normalized_pattern(value) -> str:
+    """
+    与 normalize_value 等价的正则：规范化后的每个字符之间允许任意空白，整串匹配
+
+    用于 toLower(toString(n.key)) =~ pattern，Cypher 侧无需逐个 replace 各种空白字符
+    """
+    return "^\\s*" + "\\s*".join(re.escape(ch) for ch in normalize_value(value)) + "\\s*$"
+
+
+def is_identifier(key: str, value) -> bool:
+    """编号类条件 (属性名像编号，或取值为数字/纯数字串)：只允许规范化后完全相等，不做包含/相似改写"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return True
+    return bool(_ID_KEY_RE.search(key)) or normalize_value(value).lstrip("-").isdigit()
+
+
+def variable_labels(cypher: str) -> Dict[str, str]:
+    """模式中声明了标签的变量: {变量: 标签}"""
+    return {var: _strip_ticks(label) for var, label in _VAR_LABEL_RE.findall(cypher)}
+
+
+def _clause_end(cypher: str, start: int) -> int:
+    """start 之后第一个子句关键字的位置 (没有时为末尾)"""
+    m = _CLAUSE_RE.search(cypher, start)
+    return m.start() if m else len(cypher)
+
+
+def lift_predicates(cypher: str):
+    """
+    把等值条件提取为占位符，便于逐级改写
+
+    - WHERE 中的 n.key = 'v' 原位替换为占位符
+    - 节点 Map 中的 {key: 'v'} 移出模式，作为占位符并入该 MATCH 的 WHERE (没有 WHERE 时新建)；
+      匿名节点补一个变量名
+    Map 中只要有一项不是字面量，该 Map 保持原样。
+
+    Returns:
+        tuple: (带占位符的模板, [Predicate])
+    """
+    labels = variable_labels(cypher)
+    predicates: List[Predicate] = []
+    edits = []                         # (start, end, replacement)
+
+    # 1. WHERE 等值条件
+    for m in _WHERE_EQ_RE.finditer(cypher):
+        var = m.group(1)
+        predicates.append(Predicate(var, _strip_ticks(m.group(2)), parse_literal(m.group(3)), labels.get(var)))
+        edits.append((m.start(), m.end(), _PLACEHOLDER.format(len(predicates) - 1)))
+
+    # 2. 节点属性 Map
+    inserts: Dict[int, List[str]] = {}
+    for i, m in enumerate(_NODE_MAP_RE.finditer(cypher)):
+        entries = list(_MAP_ENTRY_RE.finditer(m.group(3)))
+        if not entries or ",".join(e.group(0) for e in entries).strip() != m.group(3).strip():
+            continue
+        var = m.group(1) or f"_fb{i}"
+        label = _strip_ticks(m.group(2)) if m.group(2) else labels.get(var)
+        conds = []
+        for e in entries:
+            predicates.append(Predicate(var, _strip_ticks(e.group(1)), parse_literal(e.group(2)), label))
+            conds.append(_PLACEHOLDER.format(len(predicates) - 1))
+        node = f"({var}:{m.group(2)})" if m.group(2) else f"({var})"
+        edits.append((m.start(), m.end(), node))
+        inserts.setdefault(_clause_end(cypher, m.end()), []).extend(conds)
+
+    for pos, conds in inserts.items():
+        clause = _CLAUSE_RE.match(cypher, pos)
+        if clause and clause.group(1).upper() == "WHERE":
+            # 已有 WHERE：原表达式加括号后与新条件 AND
+            expr_end = _clause_end(cypher, clause.end())
+            edits.append((clause.end(), clause.end(), " " + " AND ".join(conds) + " AND ("))
+            edits.append((expr_end, expr_end, ") "))
+        else:
+            edits.append((pos, pos, "WHERE " + " AND ".join(conds) + " "))
+
+    template = cypher
+    for start, end, text in sorted(edits, key=lambda e: (e[0], e[1]), reverse=True):
+        template = template[:start] + text + template[end:]
+    return template, predicates
+
+
+def render(template: str, conditions: List[str]) -> str:
+    for i, cond in enumerate(conditions):
+        template = template.replace(_PLACEHOLDER.format(i), cond)
+    return template
+
+
+def relax_directions(cypher: str) -> str:
+    """去掉关系方向: -[r:X]-> / <-[r:X]- 改为 -[r:X]-"""
+    return _LEFT_ARROW_RE.sub(r"-\1", _RIGHT_ARROW_RE.sub(r"\1-", cypher))
+
+
+def match_values(value, candidates: list, limit: int = 5, cutoff: float = 0.6, exact: bool = False) -> list:
+    """
+    在属性取值字典中查找与 value 相近的值
+
+    依次尝试：规范化后相等 -> 互相包含 -> difflib 相似度 >= cutoff
+
+    Args:
+        exact (bool): 只做规范化后相等的匹配 (编号类属性，避免改写成另一个编号)
+
+    Returns:
+        list: 最多 limit 个候选原值
+    """
+    target = normalize_value(value)
+    if not target:
+        return []
+    normalized = {}
+    for c in candidates:
+        normalized.setdefault(normalize_value(c), c)
+    if target in normalized:
+        return [normalized[target]]
+    if exact:
+        return []
+    contained = [n for n in normalized if len(n) >= 2 and (target in n or n in target)]
+    if contained:
+        contained.sort(key=lambda n: abs(len(n) - len(target)))
+        return [normalized[n] for n in contained[:limit]]
+    return [normalized[n] for n in difflib.get_close_matches(target, list(normalized), n=limit, cutoff=cutoff)]
+
+
+class ValueDictionary:
+    """
+    属性取值字典：按 (标签, 属性) 缓存 DISTINCT 取值，数据版本变化后重新查询
+    """
+
+    def __init__(self, run_query: Callable[[str], list], max_values: int = 5000,
+                 version_provider: Optional[Callable[[], str]] = None):
+        self.run_query = run_query
+        self.max_values = max_values
+        self.version_provider = version_provider or (lambda: "")
+        self._values: Dict[tuple, list] = {}
+        self._version = None
+        self._lock = threading.Lock()
+
+    def values(self, label: str, key: str) -> list:
+        version = self.version_provider()
+        with self._lock:
+            if version != self._version:
+                self._values.clear()
+                self._version = version
+            if (label, key) in self._values:
+                return self._values[(label, key)]
+        k = _quote_key(key)
+        rows = self.run_query(
+            f"MATCH (n:{_quote_key(label)}) WHERE n.{k} IS NOT NULL RETURN DISTINCT n.{k} LIMIT {int(self.max_values)}"
+        )
+        values = [r for r in rows if r is not None and not isinstance(r, (dict, list))]
+        with self._lock:
+            self._values[(label, key)] = values
+        return values
+
+
+class FallbackLadder:
+    """
+    零结果自动改写：原查询无结果时按顺序尝试，返回第一个有结果的改写
+
+    1. normalized: 属性值忽略大小写与空白 (同时兼容数字/字符串类型不一致)
+    2. dictionary: 在该属性的取值字典中查找包含/相似的值，改写为 IN [...]；
+                   变量没有标签、无法查字典时改写为 CONTAINS；
+                   编号类条件 (见 is_identifier) 只接受规范化后相等的值，否则保持第 1 步的条件
+    3. relaxed   : 在上一步的基础上去掉关系方向
+    """
+
+    def __init__(self, run_query: Callable[[str], list], dictionary: Optional[ValueDictionary] = None,
+                 max_candidates: int = 5, fuzzy_cutoff: float = 0.6):
+        """
+        Args:
+            run_query: Cypher -> 结果行列表 (出错时抛异常)
+            dictionary: 属性取值字典 (为 None 时 dictionary 步骤只做 CONTAINS)
+            max_candidates: 每个条件最多替换为几个候选值
+            fuzzy_cutoff: difflib 相似度阈值
+        """
+        self.run_query = run_query
+        self.dictionary = dictionary
+        self.max_candidates = max_candidates
+        self.fuzzy_cutoff = fuzzy_cutoff
+
+    @staticmethod
+    def _normalized_condition(p: Predicate) -> str:
+        return f"toLower(toString({p.var}.{_quote_key(p.key)})) =~ {to_literal(normalized_pattern(p.value))}"
+
+    def _normalized(self, template: str, predicates: List[Predicate]):
+        conds = [self._normalized_condition(p) for p in predicates]
+        return render(template, conds), "属性值忽略大小写与空白"
+
+    def _dictionary(self, template: str, predicates: List[Predicate]):
+        conds, notes = [], []
+        for p in predicates:
+            prop = f"{p.var}.{_quote_key(p.key)}"
+            values = []
+            if self.dictionary is not None and p.label:
+                try:
+                    values = self.dictionary.values(p.label, p.key)
+                except Exception as e:
+                    print(f"[Fallback] ⚠️ 查询取值字典失败 ({p.label}.{p.key}): {e}")
+            identifier = is_identifier(p.key, p.value)
+            matches = match_values(p.value, values, self.max_candidates, self.fuzzy_cutoff,
+                                   exact=identifier) if values else []
+            if matches:
+                conds.append(f"{prop} IN [{', '.join(to_literal(v) for v in matches)}]")
+                notes.append(f"{p.key} '{p.value}' -> {matches}")
+            elif identifier:
+                conds.append(self._normalized_condition(p))
+                notes.append(f"{p.key} 为编号，不做模糊匹配")
+            else:
+                conds.append(f"toString({prop}) CONTAINS {to_literal(str(p.value).strip())}")
+                notes.append(f"{p.key} CONTAINS '{p.value}'")
+        return render(template, conds), "模糊匹配: " + "，".join(notes)
+
+    def retry(self, cypher: str) -> FallbackResult:
+        """
+        原查询结果为空时调用
+
+        Args:
+            cypher (str): 原 Cypher
+
+        Returns:
+            FallbackResult: rows 为第一个非空结果 (都为空时为 [])，rewrite 记录改写步骤与改写后的 Cypher
+        """
+        template, predicates = lift_predicates(cypher)
+        steps = []
+        if predicates:
+            steps.append(("normalized", lambda: self._normalized(template, predicates)))
+            steps.append(("dictionary", lambda: self._dictionary(template, predicates)))
+        if relax_directions(cypher) != cypher:
+            # 在上一步 (模糊匹配) 的基础上去掉关系方向
+            steps.append(("relaxed", lambda: (relax_directions(previous), "去掉关系方向")))
+
+        result = FallbackResult([])
+        previous = cypher
+        for step, build in steps:
+            rewritten, description = build()
+            previous = rewritten
+            try:
+                rows = self.run_query(rewritten)
+            except Exception as e:
+                print(f"[Fallback] ⚠️ 改写 {step} 执行失败: {e}")
+                result.tried.append(f"{description} (执行失败)")
+                continue
+            if rows:
+                print(f"[Fallback] ✅ 改写 {step} 命中 {len(rows)} 条: {rewritten}")
+                result.rows = rows
+                result.rewrite = {"step": step, "description": description, "cypher": rewritten}
+                return result
+            result.tried.append(description)
+        return result
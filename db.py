@@ -0,0 +1,133 @@
+# db.py
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+from psycopg2.pool import ThreadedConnectionPool
+
+from config import (DB_CONFIG, DB_POOL_MIN, DB_POOL_MAX, DB_STATEMENT_TIMEOUT_MS, GRAPH_NAME, ORIGIN_NAME,
+                    DATA_VERSION, DATA_VERSION_TTL_SECONDS)
+
+# 全局连接池 (进程内共享，首次使用时创建；工具并发调用时各线程各取一个连接)
+_POOL = None
+_POOL_LOCK = threading.Lock()
+# 已完成会话初始化的连接 (连接对象不支持附加属性，用弱引用集合记录)
+_PREPARED = weakref.WeakSet()
+
+
+def get_pool() -> ThreadedConnectionPool:
+    """获取 (必要时创建) 全局连接池"""
+    global _POOL
+    if _POOL is None:
+        with _POOL_LOCK:
+            if _POOL is None:
+                _POOL = ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, **DB_CONFIG)
+                print(f"[DB] ✅ 连接池已创建 ({DB_POOL_MIN}-{DB_POOL_MAX})")
+    return _POOL
+
+
+def _prepare_connection(conn):
+    """
+    初始化新连接的会话状态 (每个连接只做一次)：
+    自动提交 (只读查询不留空闲事务)、加载 AGE、设置 search_path 与语句超时
+    """
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute("LOAD 'age';")
+        cursor.execute("SET search_path = ag_catalog, '$user', public;")
+        # 语句超时让数据库主动取消慢查询，工具超时返回后后台线程不会一直占着连接
+        cursor.execute("SET statement_timeout = %s;", (DB_STATEMENT_TIMEOUT_MS,))
+    _PREPARED.add(conn)
+
+
+@contextmanager
+def pooled_connection():
+    """
+    从连接池借出一个已初始化 AGE 的连接，用完归还
+
+    连接已断开 (服务端重启、网络中断等) 时关闭并丢弃，不放回池中；
+    语句超时被取消的连接仍可用，照常归还。
+
+    Yields:
+        psycopg2 connection
+    """
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        if conn not in _PREPARED:
+            _prepare_connection(conn)
+        yield conn
+    finally:
+        pool.putconn(conn, close=conn.closed != 0)
+
+
+def warm_pool(n: int = DB_POOL_MIN) -> int:
+    """
+    预先建立并初始化 n 个连接 (用于启动预热)
+
+    Returns:
+        int: 成功初始化的连接数
+    """
+    pool = get_pool()
+    conns = []
+    try:
+        for _ in range(n):
+            conn = pool.getconn()
+            conns.append(conn)
+            if conn not in _PREPARED:
+                _prepare_connection(conn)
+    finally:
+        for conn in conns:
+            pool.putconn(conn)
+    return len(conns)
+
+
+def close_pool():
+    """关闭全部连接"""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.closeall()
+            _POOL = None
+
+
+# 数据版本戳缓存: (版本, 获取时间)
+_VERSION_CACHE = {"value": None, "at": 0.0}
+
+
+def data_version(ttl: float = DATA_VERSION_TTL_SECONDS) -> str:
+    """
+    图谱与向量库的数据版本戳，数据发生写入后改变，用于使缓存失效
+
+    取图 schema (GRAPH_NAME) 与向量 schema (ORIGIN_NAME) 下各表的累计增删改行数，
+    ttl 秒内复用上次结果；可用环境变量 DATA_VERSION 手动指定 (例如每次发布数据时更新)。
+
+    Args:
+        ttl (float): 结果复用时间 (秒)
+
+    Returns:
+        str: 版本戳 (查询失败时为 "unknown"，此时缓存照常使用)
+    """
+    if DATA_VERSION:
+        return DATA_VERSION
+    now = time.monotonic()
+    if _VERSION_CACHE["value"] is not None and now - _VERSION_CACHE["at"] < ttl:
+        return _VERSION_CACHE["value"]
+    try:
+        with pooled_connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT schemaname, sum(n_tup_ins + n_tup_upd + n_tup_del), count(*)
+                FROM pg_stat_user_tables
+                WHERE schemaname IN (%s, %s)
+                GROUP BY schemaname ORDER BY schemaname
+                """,
+                (GRAPH_NAME, ORIGIN_NAME),
+            )
+            version = ";".join(f"{schema}:{changes}:{tables}" for schema, changes, tables in cursor.fetchall())
+    except Exception as e:
+        print(f"[DB] ⚠️ 获取数据版本失败: {e}")
+        version = "unknown"
+    _VERSION_CACHE.update(value=version, at=now)
+    return version
@@ -0,0 +1,342 @@
+# entity_linker.py
+import re
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Sequence
+
+# 可选依赖：pypinyin 用于拼音变体 (同音错字、直接输入拼音)，缺失时只做精确与编号模糊匹配
+try:
+    from pypinyin import lazy_pinyin
+except ImportError:
+    lazy_pinyin = None
+
+_CJK_RE = re.compile(r"[㐀-鿿]")
+_ALNUM_RE = re.compile(r"[0-9a-z]")
+_DIGITS_RE = re.compile(r"\d+")
+
+# 参与链接的最短长度：中文 2 字，字母/数字 4 位 (过短的值在问题中到处都能匹配到)
+MIN_CJK_LENGTH = 2
+MIN_ALNUM_LENGTH = 4
+# 拼音匹配的最少音节数 (两字同音词太多)
+MIN_PINYIN_SYLLABLES = 3
+# 编号模糊匹配 (允许 1 位错漏) 的最短长度
+MIN_FUZZY_DIGITS = 8
+
+
+@dataclass(frozen=True)
+class Entity:
+    label: str
+    key: str                           # 属性名 (id_key / query_key)
+    value: str
+    node_id: Optional[int] = None      # AGE 内部节点 id (id(n))
+
+
+@dataclass
+class EntityMatch:
+    text: str                          # 问题中的原文片段
+    start: int
+    end: int
+    entities: List[Entity]
+    how: str                           # exact | pinyin | fuzzy
+
+
+def normalize_text(text: str) -> str:
+    """统一小写并去掉空白"""
+    return re.sub(r"\s+", "", str(text)).lower()
+
+
+def _char_pinyin(ch: str) -> str:
+    return lazy_pinyin(ch)[0] if _CJK_RE.match(ch) else ch
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick 自动机：一次扫描找出文本中出现的全部模式
+
+    模式与文本都是序列 (字符串或音节列表)，payload 为匹配到的模式对应的任意对象。
+    """
+
+    def __init__(self, patterns: Dict[tuple, object]):
+        self._goto: List[Dict[Hashable, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[tuple]] = [[]]    # [(模式长度, payload)]
+        for pattern, payload in patterns.items():
+            self._insert(pattern, payload)
+        self._build()
+
+    def __len__(self):
+        return sum(len(out) for out in self._out)
+
+    def _insert(self, pattern: Sequence, payload):
+        node = 0
+        for item in pattern:
+            nxt = self._goto[node].get(item)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][item] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append((len(pattern), payload))
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for item, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and item not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(item, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def search(self, seq: Sequence) -> List[tuple]:
+        """
+        Returns:
+            list: [(起始位置, 结束位置, payload)]
+        """
+        matches = []
+        node = 0
+        for i, item in enumerate(seq):
+            while node and item not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(item, 0)
+            for length, payload in self._out[node]:
+                matches.append((i + 1 - length, i + 1, payload))
+        return matches
+
+
+def _deletions(text: str) -> set:
+    return {text[:i] + text[i + 1:] for i in range(len(text))}
+
+
+class EntityIndex:
+    """
+    实体词典：精确 (规范化文本)、拼音与编号模糊三种匹配
+
+    - 精确：规范化后的实体值建 Aho-Corasick 自动机，拼音全拼作为别名一并加入 (支持直接输入拼音)
+    - 拼音：纯中文实体按逐字拼音建第二个自动机，问题同样转为逐字拼音后扫描 (支持同音错字)
+    - 模糊：长数字编号建删除变体索引 (SymSpell 思路)，问题中未精确命中的数字串允许 1 位错漏
+    """
+
+    def __init__(self, entities: Iterable[Entity] = ()):
+        self._by_text: Dict[str, List[Entity]] = {}
+        for entity in entities:
+            self._add(entity)
+        self._build()
+
+    def __len__(self):
+        return sum(len(v) for v in self._by_text.values())
+
+    def _add(self, entity: Entity) -> bool:
+        text = normalize_text(entity.value)
+        cjk = len(_CJK_RE.findall(text))
+        if cjk < MIN_CJK_LENGTH and len(text) < MIN_ALNUM_LENGTH:
+            return False
+        bucket = self._by_text.setdefault(text, [])
+        if entity not in bucket:
+            bucket.append(entity)
+        return True
+
+    def add(self, entities: Iterable[Entity]) -> int:
+        """增量加入实体并重建自动机，返回加入的个数"""
+        added = sum(self._add(e) for e in entities)
+        if added:
+            self._build()
+        return added
+
+    def _build(self):
+        exact = {}
+        pinyin = {}
+        fuzzy: Dict[str, set] = {}
+        for text, entities in self._by_text.items():
+            exact[tuple(text)] = (text, "exact")
+            if lazy_pinyin is not None and len(text) >= MIN_PINYIN_SYLLABLES and _CJK_RE.fullmatch(text[0]) \
+                    and len(_CJK_RE.findall(text)) == len(text):
+                syllables = tuple(_char_pinyin(ch) for ch in text)
+                pinyin[syllables] = (text, "pinyin")
+                exact.setdefault(tuple("".join(syllables)), (text, "pinyin"))
+            if text.isdigit() and len(text) >= MIN_FUZZY_DIGITS:
+                for variant in _deletions(text) | {text}:
+                    fuzzy.setdefault(variant, set()).add(text)
+        # 一次性替换，link 在其他线程中不会看到新旧混合的状态
+        self._automata = (AhoCorasick(exact), AhoCorasick(pinyin) if pinyin else None, fuzzy)
+
+    @staticmethod
+    def _on_boundary(text: str, start: int, end: int) -> bool:
+        """字母/数字实体不能嵌在更长的字母/数字串中 (如编号 12345 不应命中 441323123456)"""
+        if _ALNUM_RE.match(text[start]) and start > 0 and _ALNUM_RE.match(text[start - 1]):
+            return False
+        if _ALNUM_RE.match(text[end - 1]) and end < len(text) and _ALNUM_RE.match(text[end]):
+            return False
+        return True
+
+    def link(self, question: str) -> List[EntityMatch]:
+        """
+        扫描问题中出现的实体 (重叠时保留较长的匹配)
+
+        Args:
+            question (str): 用户问题
+
+        Returns:
+            list: EntityMatch 列表，按出现位置排序
+        """
+        # 规范化后的位置 -> 原文位置
+        positions = [i for i, ch in enumerate(question) if not ch.isspace()]
+        text = "".join(question[i] for i in positions).lower()
+        if not text:
+            return []
+
+        exact, pinyin, fuzzy = self._automata
+        candidates = []
+        for start, end, (key, how) in exact.search(text):
+            if self._on_boundary(text, start, end):
+                candidates.append((start, end, key, how))
+        if pinyin is not None:
+            syllables = [_char_pinyin(ch) for ch in text]
+            for start, end, (key, how) in pinyin.search(syllables):
+                candidates.append((start, end, key, how))
+        if fuzzy:
+            for m in _DIGITS_RE.finditer(text):
+                run = m.group()
+                if len(run) < MIN_FUZZY_DIGITS - 1 or run in self._by_text:
+                    continue
+                keys = set()
+                for variant in _deletions(run) | {run}:
+                    keys |= fuzzy.get(variant, set())
+                for key in sorted(keys):
+                    candidates.append((m.start(), m.end(), key, "fuzzy"))
+
+        # 精确优先，其次更长的片段
+        rank = {"exact": 0, "pinyin": 1, "fuzzy": 2}
+        candidates.sort(key=lambda c: (rank[c[3]], -(c[1] - c[0]), c[0]))
+        taken = [False] * len(text)
+        matches = []
+        for start, end, key, how in candidates:
+            if any(taken[start:end]):
+                continue
+            taken[start:end] = [True] * (end - start)
+            o_start, o_end = positions[start], positions[end - 1] + 1
+            matches.append(EntityMatch(question[o_start:o_end], o_start, o_end, list(self._by_text[key]), how))
+        return sorted(matches, key=lambda m: m.start)
+
+
+def format_entity_hints(matches: List[EntityMatch], max_per_mention: int = 3) -> str:
+    """
+    把链接结果整理为提示词中的提示段落
+
+    Returns:
+        str: 提示文本 (没有匹配时为空字符串)
+    """
+    if not matches:
+        return ""
+    how_text = {"exact": "", "pinyin": " (按拼音匹配)", "fuzzy": " (编号近似匹配)"}
+    lines = ["问题中识别到以下图谱实体，可直接用作 Cypher 条件："]
+    for m in matches:
+        targets = []
+        for e in m.entities[:max_per_mention]:
+            target = f":{e.label} {{{e.key}: '{e.value}'}}"
+            if e.node_id is not None:
+                target += f" (id(n) = {e.node_id})"
+            targets.append(target)
+        more = f" 等 {len(m.entities)} 个" if len(m.entities) > max_per_mention else ""
+        lines.append(f"- 「{m.text}」→ {'；'.join(targets)}{more}{how_text[m.how]}")
+    return "\n".join(lines)
+
+
+def load_entities(run_query: Callable[[str], list], schema: Dict[str, dict], after: Dict[str, int] = None):
+    """
+    从图谱读取实体 (各标签的 id_key 与 query_key 属性)
+
+    Args:
+        run_query: Cypher -> 结果行列表
+        schema: GRAPH_SCHEMA 格式的 Schema
+        after: {标签: 节点 id}，只读取 id(n) 大于该值的节点 (增量刷新)
+
+    Returns:
+        tuple: (实体列表, {标签: 已读取的最大节点 id})
+    """
+    after = after or {}
+    entities, max_ids = [], dict(after)
+    for label, config in schema.items():
+        keys = [k for k in dict.fromkeys((config.get("id_key"), config.get("query_key"))) if k]
+        for key in keys:
+            quoted_label = label if re.fullmatch(r"\w+", label) else f"`{label}`"
+            quoted_key = key if re.fullmatch(r"\w+", key) else f"`{key}`"
+            rows = run_query(
+                f"MATCH (n:{quoted_label}) WHERE id(n) > {int(after.get(label, -1))} AND n.{quoted_key} IS NOT NULL "
+                f"RETURN {{gid: id(n), value: n.{quoted_key}}}"
+            )
+            for row in rows:
+                if not isinstance(row, dict) or row.get("value") is None:
+                    continue
+                entities.append(Entity(label, key, str(row["value"]), row.get("gid")))
+                max_ids[label] = max(max_ids.get(label, -1), row.get("gid") or -1)
+    return entities, max_ids
+
+
+class EntityLinker:
+    """
+    基于图谱数据的实体链接器
+
+    - 首次使用时全量构建；之后数据版本变化时只读取新增节点 (节点 id 递增) 并入词典
+    - 每隔 full_refresh_seconds 全量重建一次，清掉已删除/修改的实体
+    - 刷新在调用线程中进行，其他线程同时调用 link 时不等待，直接使用当前词典
+    """
+
+    def __init__(self, run_query: Callable[[str], list], schema_provider: Callable[[], object],
+                 version_provider: Callable[[], str] = None, full_refresh_seconds: float = 3600):
+        """
+        Args:
+            run_query: Cypher -> 结果行列表
+            schema_provider: 返回当前 Schema 快照 (含 schema 属性)，见 schema_provider.get_schema
+            version_provider: 返回数据版本戳
+            full_refresh_seconds: 全量重建间隔
+        """
+        self.run_query = run_query
+        self.schema_provider = schema_provider
+        self.version_provider = version_provider or (lambda: "")
+        self.full_refresh_seconds = full_refresh_seconds
+        self.index: Optional[EntityIndex] = None
+        self._max_ids: Dict[str, int] = {}
+        self._version = None
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self, full: bool = False) -> str:
+        """按需刷新词典，返回说明文字"""
+        version = self.version_provider()
+        if not full and self.index is not None and version == self._version \
+                and time.monotonic() - self._built_at < self.full_refresh_seconds:
+            return "无需刷新"
+        if not self._lock.acquire(blocking=self.index is None):
+            return "其他线程正在刷新"
+        try:
+            start = time.perf_counter()
+            schema = self.schema_provider().schema
+            if full or self.index is None or time.monotonic() - self._built_at >= self.full_refresh_seconds:
+                entities, self._max_ids = load_entities(self.run_query, schema)
+                self.index = EntityIndex(entities)
+                self._built_at = time.monotonic()
+                detail = f"全量构建 {len(self.index)} 个实体"
+            else:
+                entities, self._max_ids = load_entities(self.run_query, schema, after=self._max_ids)
+                detail = f"增量加入 {self.index.add(entities)} 个实体"
+            self._version = version
+            print(f"[Entity] ✅ {detail}，耗时 {time.perf_counter() - start:.2f}s")
+            return detail
+        finally:
+            self._lock.release()
+
+    def link(self, question: str) -> List[EntityMatch]:
+        """刷新 (如需要) 后扫描问题；词典不可用时返回空列表"""
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f"[Entity] ⚠️ 刷新实体词典失败: {e}")
+        return self.index.link(question) if self.index is not None else []
@@ -0,0 +1,458 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+ETL引擎性能基准 - 基于合成图层对比不同执行方式的耗时与结果一致性
+
+用法:
+    python etl_benchmark.py vectorized --rows 100000
+    python etl_benchmark.py projection --rows 100000
+    python etl_benchmark.py fanout --rows 20000 --fanout 2000
+    python etl_benchmark.py sinks --rows 100000
+    python etl_benchmark.py geometry --rows 20000
+    python etl_benchmark.py spatial --rows 1000000
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, List, Tuple, Callable, Any
+
+import numpy as np
+import geopandas as gpd
+import shapely
+from shapely.geometry import Point, box
+
+from etl_engine import ETLEngine, EntityMerger
+from etl_plan import GeometryEncoding, compile_spatial
+from etl_sinks import SINKS, open_sink, pq
+
+DEFAULT_CONFIG = str(Path(__file__).parent / 'config' / 'test.yaml')
+
+
+def make_synthetic_layers(rows: int, seed: int = 42) -> Dict[str, gpd.GeoDataFrame]:
+    """
+    生成与 test.yaml 字段一致的合成图层
+
+    Args:
+        rows: 承灾体图层的要素数 (防御区为其 1/10)
+        seed: 随机种子
+
+    Returns:
+        图层名 -> GeoDataFrame
+    """
+    rng = np.random.default_rng(seed)
+    zone_count = max(1, rows // 10)
+
+    zone_ids = np.array([f"4413231030{i:05d}" for i in range(zone_count)], dtype=object)
+    slopes = rng.uniform(0, 60, zone_count)
+    slopes[rng.random(zone_count) < 0.05] = np.nan
+    zones = gpd.GeoDataFrame({
+        'tybh': zone_ids,
+        'fyqdj': rng.choice(['低', '中', '高'], zone_count),
+        'xppd': slopes,
+        'geometry': [box(i, 0, i + 1, 1) for i in range(zone_count)]
+    }, crs='EPSG:4326')
+
+    # 受灾家庭按联系人+电话去重，让同一户关联多个承灾体
+    households = max(1, rows // 3)
+    owner_idx = rng.integers(0, households, rows)
+    ages = rng.integers(0, 5, (rows, 3)).astype(float)
+    ages[rng.random(rows) < 0.05, 1] = np.nan
+    elements = gpd.GeoDataFrame({
+        'id': [f"E{i:08d}" for i in range(rows)],
+        'jzmj': rng.uniform(20, 500, rows),
+        'ysfyqtybh': np.where(rng.random(rows) < 0.1, None, zone_ids[rng.integers(0, zone_count, rows)]),
+        'lxr': [f"户主{i}" for i in owner_idx],
+        'lxfs': [f"138{i:08d}" for i in owner_idx],
+        'nljg1': ages[:, 0],
+        'nljg2': ages[:, 1],
+        'nljg3': ages[:, 2],
+        'sffzijgtw': rng.integers(0, 2, rows),
+        'geometry': [Point(x, y) for x, y in rng.uniform(0, zone_count, (rows, 2))]
+    }, crs='EPSG:4326')
+
+    return {'防御区': zones, '承灾体': elements}
+
+
+def write_synthetic_gdb(layers: Dict[str, gpd.GeoDataFrame], gdb_path: str, extra_columns: int = 0):
+    """
+    将合成图层写入 FileGDB，可追加若干映射不引用的宽表字段
+
+    Args:
+        layers: 图层名 -> GeoDataFrame
+        gdb_path: 输出 .gdb 目录
+        extra_columns: 每个图层追加的无关字段数
+    """
+    for name, gdf in layers.items():
+        gdf = gdf.copy()
+        for i in range(extra_columns):
+            gdf[f'extra_{i}'] = f'无关字段{i}'
+        gdf.to_file(gdb_path, layer=name, driver='OpenFileGDB', engine='pyogrio')
+
+
+def make_engine(layers: Dict[str, gpd.GeoDataFrame], config_path: str = DEFAULT_CONFIG,
+                **kwargs) -> ETLEngine:
+    """创建预先填充图层缓存的引擎，基准测试不依赖真实 GDB"""
+    engine = ETLEngine(config_path, **kwargs)
+    engine.gdf_cache.update(layers)
+    return engine
+
+
+def _timed(func: Callable[[], Any]):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def bench_vectorized(rows: int, config_path: str = DEFAULT_CONFIG) -> Dict[str, Any]:
+    """
+    对比向量化执行与逐行 iterrows 执行的耗时，并校验结果完全一致
+
+    Args:
+        rows: 承灾体要素数
+        config_path: 映射配置
+
+    Returns:
+        基准结果
+    """
+    layers = make_synthetic_layers(rows)
+
+    row_results, row_time = _timed(make_engine(layers, config_path, vectorized=False).run)
+    vec_results, vec_time = _timed(make_engine(layers, config_path, vectorized=True).run)
+
+    identical = row_results == vec_results
+    print(f"\n[向量化基准] 承灾体 {rows} 行")
+    print(f"  逐行 iterrows : {row_time:8.3f}s")
+    print(f"  按列向量化    : {vec_time:8.3f}s  (加速 {row_time / max(vec_time, 1e-9):.1f}x)")
+    print(f"  结果一致      : {'✅' if identical else '❌'}")
+
+    return {'rows': rows, 'rowwise_seconds': row_time, 'vectorized_seconds': vec_time,
+            'identical': identical}
+
+
+def bench_projection(rows: int, config_path: str = DEFAULT_CONFIG, extra_columns: int = 40) -> Dict[str, Any]:
+    """
+    对比全量读取与列裁剪读取宽图层的耗时和 Python 侧峰值内存
+
+    Args:
+        rows: 承灾体要素数
+        config_path: 映射配置
+        extra_columns: 每个图层追加的无关字段数
+
+    Returns:
+        基准结果
+    """
+    layers = make_synthetic_layers(rows)
+    result = {'rows': rows, 'extra_columns': extra_columns}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        gdb_path = str(Path(tmp_dir) / 'synthetic.gdb')
+        write_synthetic_gdb(layers, gdb_path, extra_columns)
+
+        outputs = {}
+        for label, projection in (('full', False), ('projected', True)):
+            engine = ETLEngine(config_path, projection=projection)
+            engine.gdb_path = gdb_path
+            tracemalloc.start()
+            start = time.perf_counter()
+            for layer_name in layers:
+                engine._read_gdb_layer(layer_name)
+            read_time = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            outputs[label] = engine.run()
+            result[f'{label}_read_seconds'] = read_time
+            result[f'{label}_peak_mb'] = peak / 1024 / 1024
+
+    result['identical'] = outputs['full'] == outputs['projected']
+    print(f"\n[列裁剪基准] 承灾体 {rows} 行, 额外字段 {extra_columns} 个")
+    print(f"  全量读取 : {result['full_read_seconds']:8.3f}s  峰值 {result['full_peak_mb']:8.1f} MB")
+    print(f"  列裁剪   : {result['projected_read_seconds']:8.3f}s  峰值 {result['projected_peak_mb']:8.1f} MB")
+    print(f"  结果一致 : {'✅' if result['identical'] else '❌'}")
+    return result
+
+
+def _merge_linear(records: List[Tuple[str, Dict, List[Dict]]], entity_type: str) -> List[Dict]:
+    """merge_relation 的原始实现：逐个线性比对已有关系，作为基准对照"""
+    entities_dict = {}
+    for key, attrs, rels in records:
+        if key in entities_dict:
+            existing_rels = entities_dict[key]['relationships']
+            for new_rel in rels:
+                is_duplicate = False
+                for existing_rel in existing_rels:
+                    if (existing_rel.get('relation') == new_rel.get('relation') and
+                            existing_rel.get('target_type') == new_rel.get('target_type') and
+                            existing_rel.get('target_id') == new_rel.get('target_id')):
+                        is_duplicate = True
+                        break
+                if not is_duplicate:
+                    existing_rels.append(new_rel)
+        else:
+            entities_dict[key] = {'id': key, 'type': entity_type, 'attributes': attrs, 'relationships': rels}
+    return list(entities_dict.values())
+
+
+def make_fanout_records(rows: int, fanout: int, seed: int = 42) -> List[Tuple[str, Dict, List[Dict]]]:
+    """
+    生成高扇出的受灾家庭记录：每户关联约 fanout 个承灾体，并带有一定比例的重复关系
+
+    Args:
+        rows: 记录数
+        fanout: 每个主键平均关联的承灾体数
+
+    Returns:
+        (主键, 属性, 关系) 记录列表
+    """
+    rng = np.random.default_rng(seed)
+    households = max(1, rows // fanout)
+    owners = rng.integers(0, households, rows)
+    # 约 20% 的关系是重复出现的
+    targets = rng.integers(0, int(rows * 0.8) + 1, rows)
+    relations = np.where(rng.random(rows) < 0.5, '拥有', '居住于')
+    return [(f"family_{o}", {'户主姓名': f"户主{o}"},
+             [{'relation': r, 'target_type': '承灾体', 'target_id': f"E{t:08d}"}])
+            for o, t, r in zip(owners.tolist(), targets.tolist(), relations.tolist())]
+
+
+def bench_fanout(rows: int, fanout: int, workers: int = 4) -> Dict[str, Any]:
+    """
+    对比线性比对与哈希索引两种 merge_relation 合并方式，并验证分片合并结果一致
+
+    Args:
+        rows: 记录数
+        fanout: 每个主键平均关联的承灾体数
+        workers: 模拟分片 (批次/工作进程) 数
+
+    Returns:
+        基准结果
+    """
+    records = make_fanout_records(rows, fanout)
+
+    linear, linear_time = _timed(lambda: _merge_linear(records, '受灾家庭'))
+
+    def hashed_merge():
+        merger = EntityMerger('受灾家庭', 'merge_relation')
+        merger.add_records(records)
+        return merger.to_list()
+    hashed, hashed_time = _timed(hashed_merge)
+
+    def sharded_merge():
+        chunk = -(-len(records) // workers)
+        partials = []
+        for i in range(workers):
+            partial = EntityMerger('受灾家庭', 'merge_relation')
+            partial.add_records(records[i * chunk:(i + 1) * chunk])
+            partials.append(partial)
+        merged = partials[0]
+        for partial in partials[1:]:
+            merged.merge(partial)
+        return merged.to_list()
+    sharded, sharded_time = _timed(sharded_merge)
+
+    identical = linear == hashed == sharded
+    print(f"\n[关系合并基准] {rows} 条记录, 每户约 {fanout} 个承灾体")
+    print(f"  线性比对   : {linear_time:8.3f}s")
+    print(f"  哈希索引   : {hashed_time:8.3f}s  (加速 {linear_time / max(hashed_time, 1e-9):.1f}x)")
+    print(f"  {workers} 分片合并 : {sharded_time:8.3f}s")
+    print(f"  结果一致   : {'✅' if identical else '❌'}")
+    return {'rows': rows, 'fanout': fanout, 'linear_seconds': linear_time,
+            'hashed_seconds': hashed_time, 'sharded_seconds': sharded_time, 'identical': identical}
+
+
+def _read_back(fmt: str, path: Path) -> int:
+    """读回输出文件 (模拟下游解析)，返回实体数"""
+    if fmt == 'json':
+        with open(path, encoding='utf-8') as f:
+            return len(json.load(f)['entities'])
+    if fmt == 'jsonl':
+        with open(path, encoding='utf-8') as f:
+            return sum(1 for line in f if json.loads(line))
+    return pq.read_table(path).num_rows
+
+
+def bench_sinks(rows: int, config_path: str = DEFAULT_CONFIG) -> Dict[str, Any]:
+    """
+    对比各输出格式的写出耗时、文件大小与下游读回耗时
+
+    Args:
+        rows: 承灾体要素数
+        config_path: 映射配置
+
+    Returns:
+        格式 -> 基准结果
+    """
+    engine = make_engine(make_synthetic_layers(rows), config_path)
+    results = engine.run()
+    formats = [fmt for fmt in SINKS if fmt != 'parquet' or pq is not None]
+    report = {}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for fmt in formats:
+            output_dir = os.path.join(tmp_dir, fmt)
+            size = 0
+            entities = 0
+
+            def write_all():
+                paths = []
+                for mapping_name, data in results.items():
+                    mapping_config = engine.config[mapping_name]
+                    geometry_columns = [a.get('target') for a in mapping_config.get('attributes', [])
+                                        if a.get('dtype') == 'wkt']
+                    with open_sink(fmt, output_dir, mapping_name, data['entity_type'], geometry_columns) as sink:
+                        sink.write_many(data['entities'])
+                    paths.append(sink.path)
+                return paths
+            paths, write_time = _timed(write_all)
+
+            start = time.perf_counter()
+            for path in paths:
+                size += path.stat().st_size
+                entities += _read_back(fmt, path)
+            read_time = time.perf_counter() - start
+            report[fmt] = {'write_seconds': write_time, 'read_seconds': read_time,
+                           'size_mb': size / 1024 / 1024, 'entities': entities}
+
+    print(f"\n[输出格式基准] 承灾体 {rows} 行")
+    print(f"  {'格式':<8} {'写出(s)':>8} {'读回(s)':>8} {'大小(MB)':>9} {'实体/秒(写)':>12}")
+    for fmt, item in report.items():
+        throughput = item['entities'] / max(item['write_seconds'], 1e-9)
+        print(f"  {fmt:<8} {item['write_seconds']:8.3f} {item['read_seconds']:8.3f} "
+              f"{item['size_mb']:9.2f} {throughput:12.0f}")
+    return report
+
+
+def make_detailed_polygons(rows: int, vertices: int = 256, seed: int = 42) -> np.ndarray:
+    """生成顶点较多、边界带扰动的多边形 (模拟精细的防御区边界)"""
+    rng = np.random.default_rng(seed)
+    angles = np.linspace(0, 2 * np.pi, vertices, endpoint=False)
+    centers = rng.uniform([114.0, 22.5], [115.5, 23.5], size=(rows, 2))
+    radius = 0.01 * (1 + 0.05 * rng.standard_normal((rows, vertices)))
+    rings = np.stack([centers[:, :1] + radius * np.cos(angles),
+                      centers[:, 1:] + radius * np.sin(angles)], axis=-1)
+    return shapely.polygons(np.concatenate([rings, rings[:, :1]], axis=1))
+
+
+def bench_geometry(rows: int, config_path: str = DEFAULT_CONFIG) -> Dict[str, Any]:
+    """
+    对比逐个 .wkt 与整列编码 (不同精度 / 简化 / WKB) 的耗时和输出体积
+
+    Args:
+        rows: 多边形数量
+        config_path: 映射配置
+
+    Returns:
+        基准结果
+    """
+    geoms = make_detailed_polygons(rows)
+    engine = ETLEngine(config_path)
+
+    variants = {
+        '逐个 .wkt': None,
+        'wkt 全精度': GeometryEncoding('wkt'),
+        'wkt precision=6': GeometryEncoding('wkt', precision=6),
+        'wkt simplify': GeometryEncoding('wkt', precision=6, simplify=0.0005),
+        'wkb precision=6': GeometryEncoding('wkb', precision=6),
+    }
+    report = {}
+    print(f"\n[几何编码基准] {rows} 个多边形 (每个 {shapely.get_num_coordinates(geoms[0])} 个坐标)")
+    print(f"  {'方式':<18} {'耗时(s)':>8} {'体积(MB)':>9}")
+    for name, options in variants.items():
+        if options is None:
+            encoded, elapsed = _timed(lambda: [g.wkt for g in geoms])
+        else:
+            encoded, elapsed = _timed(lambda: engine._encode_geometries(geoms, options).tolist())
+        size = sum(len(v) for v in encoded) / 1024 / 1024
+        report[name] = {'seconds': elapsed, 'size_mb': size}
+        print(f"  {name:<18} {elapsed:8.3f} {size:9.2f}")
+    return report
+
+
+def make_grid_layers(rows: int, cells_per_side: int = 100, seed: int = 42) -> Dict[str, gpd.GeoDataFrame]:
+    """生成 cells_per_side^2 个网格防御区与 rows 个随机分布的承灾体点 (不带外键)"""
+    rng = np.random.default_rng(seed)
+    xs, ys = np.meshgrid(np.arange(cells_per_side), np.arange(cells_per_side))
+    zones = gpd.GeoDataFrame({
+        'tybh': [f"Z{i:06d}" for i in range(cells_per_side ** 2)],
+        'geometry': shapely.box(xs.ravel(), ys.ravel(), xs.ravel() + 1, ys.ravel() + 1)
+    })
+    coords = rng.uniform(0, cells_per_side, (rows, 2))
+    elements = gpd.GeoDataFrame({
+        'id': [f"E{i:08d}" for i in range(rows)],
+        'geometry': shapely.points(coords)
+    })
+    return {'防御区': zones, '承灾体': elements}
+
+
+def bench_spatial(rows: int, config_path: str = DEFAULT_CONFIG, sample: int = 2000) -> Dict[str, Any]:
+    """
+    对比 STRtree 批量空间关联与逐个要素对全部多边形做几何判断的耗时
+
+    逐个判断的耗时按 sample 个要素外推，并在样本上校验两者结果一致。
+
+    Args:
+        rows: 承灾体要素数
+        config_path: 映射配置
+        sample: 逐个判断方式实际执行的要素数
+
+    Returns:
+        基准结果
+    """
+    layers = make_grid_layers(rows)
+    engine = make_engine(layers, config_path)
+    zone_geoms = layers['防御区'].geometry.to_numpy()
+    zone_ids = ('zone_' + layers['防御区']['tybh']).to_numpy()
+    point_geoms = layers['承灾体'].geometry.to_numpy()
+
+    report = {'rows': rows, 'zones': len(zone_geoms)}
+    print(f"\n[空间关联基准] 承灾体 {rows} 个点，防御区 {len(zone_geoms)} 个多边形")
+    for mode in ('within', 'nearest'):
+        spatial = compile_spatial({'spatial': mode, 'target_layer': '防御区', 'target_key_field': 'tybh',
+                                   'target_key_prefix': 'zone_', 'max_distance': 1.0})
+        engine._spatial_indexes.clear()
+        matches, tree_time = _timed(lambda: engine._spatial_targets(spatial, point_geoms))
+
+        def pairwise():
+            if mode == 'within':
+                return [zone_ids[shapely.within(p, zone_geoms)].tolist() for p in point_geoms[:sample]]
+            return [[zone_ids[int(np.argmin(shapely.distance(p, zone_geoms)))]] for p in point_geoms[:sample]]
+        expected, pair_time = _timed(pairwise)
+        pair_estimate = pair_time * rows / min(sample, rows)
+        # 点落在网格线上时最近多边形不唯一，只比较 within
+        identical = mode != 'within' or matches[:sample] == expected
+
+        report[mode] = {'strtree_seconds': tree_time, 'pairwise_estimate_seconds': pair_estimate,
+                        'identical': identical}
+        print(f"  {mode:<8} STRtree {tree_time:8.3f}s   逐个判断(外推) {pair_estimate:10.1f}s   "
+              f"加速 {pair_estimate / max(tree_time, 1e-9):8.0f}x   样本一致 {'✅' if identical else '❌'}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ETL引擎性能基准')
+    parser.add_argument('benchmark', choices=['vectorized', 'projection', 'fanout', 'sinks', 'geometry', 'spatial'])
+    parser.add_argument('--rows', type=int, default=100000, help='合成承灾体要素数')
+    parser.add_argument('--fanout', type=int, default=2000, help='fanout 基准中每个主键关联的承灾体数')
+    parser.add_argument('--config', default=DEFAULT_CONFIG, help='映射配置文件')
+    args = parser.parse_args()
+
+    if args.benchmark == 'vectorized':
+        bench_vectorized(args.rows, args.config)
+    elif args.benchmark == 'projection':
+        bench_projection(args.rows, args.config)
+    elif args.benchmark == 'fanout':
+        bench_fanout(args.rows, args.fanout)
+    elif args.benchmark == 'sinks':
+        bench_sinks(args.rows, args.config)
+    elif args.benchmark == 'geometry':
+        bench_geometry(args.rows, args.config)
+    elif args.benchmark == 'spatial':
+        bench_spatial(args.rows, args.config)
+
+
+if __name__ == '__main__':
+    main()
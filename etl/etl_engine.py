@@ -7,57 +7,384 @@ ETL引擎 - 根据YAML配置自动执行数据转换
 
 import yaml
 import json
+import argparse
 import hashlib
+import importlib
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from contextlib import contextmanager
+from typing import Dict, List, Any, Optional, Tuple, Iterator, Callable
+import numpy as np
+import pandas as pd
 import geopandas as gpd
+import shapely
 from shapely.geometry import mapping
 import warnings
+from dataclasses import replace
 
 warnings.filterwarnings('ignore')
 
+# 可选依赖：pyogrio (+ pyarrow) 提供按列读取的快速读取器，缺失时回退到 geopandas 默认引擎
+try:
+    import pyogrio
+except ImportError:
+    pyogrio = None
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_ARROW = True
+except ImportError:
+    HAS_ARROW = False
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from etl_sinks import BaseSink, JsonSink, open_sink
+from etl_manifest import MappingManifest, write_delta
+from etl_transforms import apply_transform
+from etl_profiler import StageProfiler, ProfilerHook, PyinstrumentHook
+from etl_plan import (GEOMETRY_COLUMN, GEOMETRY_DTYPES, SPATIAL_PREDICATES, MappingConfigError, MappingPlan,
+                      KeyPlan, AttributePlan, RelationshipPlan, SpatialPlan, GeometryEncoding,
+                      compile_mapping, compile_geometry, compile_spatial, check_columns)
+
+
+class EntityMerger:
+    """
+    按去重策略累积实体
+    
+    merge_relation 模式下，每个实体的关系额外用 (relation, target_type, target_id)
+    集合做索引，去重判断为 O(1)，高扇出主键不再退化为平方复杂度。
+    多个批次或多个工作进程的部分结果可通过 merge() 合并。
+    """
+    
+    def __init__(self, entity_type: str, dedup_policy: Optional[str] = None):
+        """
+        Args:
+            entity_type: 实体类型
+            dedup_policy: 去重策略 (merge_relation 或 None)
+        """
+        self.entity_type = entity_type
+        self.dedup_policy = dedup_policy
+        self.entities: Dict[str, Dict] = {}  # 主键 -> 实体，保持首次出现的顺序
+        self._rel_index: Dict[str, set] = {}  # 主键 -> 已有关系的键集合
+    
+    @staticmethod
+    def _rel_key(rel: Dict) -> Tuple:
+        return rel.get('relation'), rel.get('target_type'), rel.get('target_id')
+    
+    def add(self, key: str, attrs: Dict, rels: List[Dict]):
+        """
+        合并一条 (主键, 属性, 关系) 记录
+        
+        Args:
+            key: 主键
+            attrs: 属性
+            rels: 关系列表
+        """
+        if self.dedup_policy == 'merge_relation':
+            # 合并关系模式
+            existing = self.entities.get(key)
+            if existing is not None:
+                index = self._rel_index[key]
+                existing_rels = existing['relationships']
+                for new_rel in rels:
+                    rel_key = self._rel_key(new_rel)
+                    if rel_key not in index:
+                        index.add(rel_key)
+                        existing_rels.append(new_rel)
+                return
+            self._rel_index[key] = {self._rel_key(r) for r in rels}
+        
+        # 默认模式：每行一个实体 (重复主键后者覆盖前者)
+        self.entities[key] = {
+            'id': key,
+            'type': self.entity_type,
+            'attributes': attrs,
+            'relationships': rels
+        }
+    
+    def add_records(self, records: List[Tuple[str, Dict, List[Dict]]]):
+        """批量合并记录"""
+        for key, attrs, rels in records:
+            self.add(key, attrs, rels)
+    
+    def add_entities(self, entities: List[Dict]):
+        """合并已生成的实体列表 (例如其他工作进程的输出)"""
+        for entity in entities:
+            self.add(entity['id'], entity['attributes'], list(entity['relationships']))
+    
+    def merge(self, other: 'EntityMerger'):
+        """
+        合并另一个部分结果，other 视为在当前结果之后处理的数据
+        
+        Args:
+            other: 同一映射的另一个部分结果
+        """
+        self.add_entities(list(other.entities.values()))
+    
+    def to_list(self) -> List[Dict]:
+        """按首次出现顺序返回实体列表"""
+        return list(self.entities.values())
+
 
 class ETLEngine:
     """ETL引擎类"""
     
-    def __init__(self, config_path: str):
+    def __init__(self, config_path: str, vectorized: bool = True, projection: bool = True,
+                 trace_memory: bool = False, profiler_hook: Optional[ProfilerHook] = None):
         """
         初始化ETL引擎
         
         Args:
             config_path: YAML配置文件路径
+            vectorized: 是否按列向量化执行映射 (False 时退回逐行 iterrows 模式，仅用于对比验证)
+            projection: 是否只读取映射用到的列 (列裁剪下推)
+            trace_memory: 是否用 tracemalloc 统计各阶段峰值内存 (明显拖慢运行)
+            profiler_hook: 可选的采样分析钩子，在每个 (映射, 阶段) 外层调用
         """
         self.config_path = config_path
+        self.vectorized = vectorized
+        self.projection = projection
+        self.trace_memory = trace_memory
+        self.profiler_hook = profiler_hook
         self.config = self._load_config()
         self.gdb_path = self.config.get('global_config', {}).get('database_path', '')
         self.gdf_cache = {}  # 缓存GDB图层数据
+        self.timings: Dict[str, float] = {}  # 映射名 -> 处理耗时 (秒)
+        self.profiler = StageProfiler(trace_memory, profiler_hook)  # (映射, 阶段) -> 耗时/行数/峰值内存
+        self._spatial_indexes: Dict[Tuple, Tuple] = {}  # (目标图层, 主键字段, 前缀) -> (STRtree, 目标主键)
+        self.plans: Optional[Dict[str, MappingPlan]] = None  # 映射名 -> 编译后的执行计划
+        self.binary_geometry: set = set()  # 几何属性直接输出二进制 WKB 的映射 (导出为 Parquet 时设置)
+        self._load_transform_modules()
         
     def _load_config(self) -> Dict:
         """加载YAML配置文件"""
         with open(self.config_path, 'r', encoding='utf-8') as f:
             return yaml.safe_load(f)
     
-    def _read_gdb_layer(self, layer_name: str) -> gpd.GeoDataFrame:
+    def _load_transform_modules(self):
+        """
+        导入 global_config.transform_modules 中的模块，注册其中的自定义转换
+        
+        模块按配置文件所在目录与常规 sys.path 查找；进程池中的子进程构造引擎时同样会导入。
+        """
+        modules = self.config.get('global_config', {}).get('transform_modules', []) or []
+        if not modules:
+            return
+        config_dir = os.path.dirname(os.path.abspath(self.config_path))
+        if config_dir not in sys.path:
+            sys.path.append(config_dir)
+        for module in modules:
+            importlib.import_module(module)
+    
+    def _iter_mappings(self):
+        """遍历配置中的映射 (跳过全局配置)，产出 (映射名, 映射配置)"""
+        for key, value in self.config.items():
+            if key == 'global_config':
+                continue
+            if isinstance(value, dict) and 'source_layer' in value:
+                yield key, value
+    
+    def compile(self) -> Dict[str, MappingPlan]:
+        """
+        将配置中的全部映射编译为执行计划，结果缓存在 self.plans
+        
+        Returns:
+            映射名 -> 映射计划 (按配置顺序)
+            
+        Raises:
+            MappingConfigError: 配置有误 (汇总所有映射的全部问题)
+        """
+        plans = {}
+        errors = []
+        for key, value in self._iter_mappings():
+            try:
+                plans[key] = compile_mapping(key, value)
+                if key in self.binary_geometry:
+                    plans[key] = self._with_binary_geometry(plans[key])
+            except MappingConfigError as e:
+                errors.extend(e.errors)
+        if errors:
+            raise MappingConfigError(errors)
+        self.plans = plans
+        return plans
+    
+    @staticmethod
+    def _with_binary_geometry(plan: MappingPlan) -> MappingPlan:
+        """把映射顶层的几何属性改为输出二进制 WKB (Parquet 几何列)"""
+        attributes = tuple(replace(attr, geometry=replace(attr.geometry, binary=True))
+                           if attr.geometry is not None else attr for attr in plan.attributes)
+        return replace(plan, attributes=attributes)
+    
+    def _plans(self) -> Dict[str, MappingPlan]:
+        """已编译的计划，尚未编译时先编译"""
+        return self.plans if self.plans is not None else self.compile()
+    
+    def _layer_columns(self, layer_name: str) -> Optional[List[str]]:
+        """图层的实际字段：已缓存的图层取列名，否则读取元数据"""
+        if layer_name in self.gdf_cache:
+            return list(self.gdf_cache[layer_name].columns)
+        return self._layer_fields(layer_name)
+    
+    def validate(self) -> List[str]:
+        """
+        编译映射并对照图层实际字段检查引用的字段
+        
+        Returns:
+            问题描述列表 (缺失字段在执行时按 None / default 处理，不会中断运行)
+            
+        Raises:
+            MappingConfigError: 配置结构有误
+        """
+        plans = self.compile()
+        issues = []
+        for plan in plans.values():
+            fields = self._layer_columns(plan.source_layer)
+            if fields is None:
+                # 没有 pyogrio 时无法只读元数据，跳过字段检查
+                if pyogrio is not None:
+                    issues.append(f"{plan.name}: 无法读取图层 {plan.source_layer} 的字段")
+                continue
+            issues.extend(check_columns(plan, fields))
+            for rel in plan.relationships:
+                if rel.spatial is None:
+                    continue
+                target_fields = self._layer_columns(rel.spatial.target_layer)
+                if target_fields is not None and rel.spatial.target_key_field not in target_fields:
+                    issues.append(f"{plan.name}: 图层 {rel.spatial.target_layer} 中没有字段 "
+                                  f"'{rel.spatial.target_key_field}'")
+        return issues
+    
+    def _prepare(self) -> Dict[str, MappingPlan]:
+        """运行前编译并检查映射，字段问题打印为警告"""
+        issues = self.validate()
+        for issue in issues:
+            print(f"⚠️ {issue}")
+        return self.plans
+    
+    def _layer_projection(self, layer_name: str) -> Tuple[List[str], bool]:
+        """
+        汇总所有读取同一图层的映射所需的字段 (列裁剪下推)
+        
+        Args:
+            layer_name: 图层名称
+            
+        Returns:
+            (需要读取的字段列表, 是否需要几何列)
+        """
+        columns = set()
+        needs_geometry = False
+        for plan in self._plans().values():
+            if plan.source_layer == layer_name:
+                columns.update(plan.columns)
+                needs_geometry = needs_geometry or plan.needs_geometry
+            # 作为空间关系目标的图层需要几何列与目标主键字段
+            for rel in plan.relationships:
+                if rel.spatial and rel.spatial.target_layer == layer_name:
+                    columns.add(rel.spatial.target_key_field)
+                    needs_geometry = True
+        return sorted(columns), needs_geometry
+    
+    def _layer_fields(self, layer_name: str) -> Optional[List[str]]:
+        """读取图层的字段列表 (仅元数据，不读取要素)；无法获取时返回 None"""
+        if pyogrio is None:
+            return None
+        try:
+            return list(pyogrio.read_info(self.gdb_path, layer=layer_name)['fields'])
+        except Exception:
+            return None
+    
+    def _read_kwargs(self, layer_name: str) -> Dict:
+        """
+        构造读取图层的参数 (列裁剪 + 读取引擎)
+        
+        Args:
+            layer_name: 图层名称
+            
+        Returns:
+            传给 gpd.read_file 的关键字参数
+        """
+        read_kwargs = {'layer': layer_name}
+        if self.projection:
+            columns, needs_geometry = self._layer_projection(layer_name)
+            fields = self._layer_fields(layer_name)
+            if fields is not None:
+                # 只保留图层中真实存在的字段，缺失字段在映射中按 None 处理
+                columns = [c for c in columns if c in fields]
+            read_kwargs['columns'] = columns
+            read_kwargs['ignore_geometry'] = not needs_geometry and bool(columns)
+        
+        if pyogrio is not None:
+            read_kwargs['engine'] = 'pyogrio'
+            read_kwargs['use_arrow'] = HAS_ARROW
+        return read_kwargs
+    
+    def _read_gdb_layer(self, layer_name: str) -> pd.DataFrame:
         """
         读取GDB图层
         
+        开启列裁剪时只读取映射引用到的字段，无映射需要几何时跳过几何列
+        (此时返回普通 DataFrame)。安装了 pyogrio + pyarrow 时使用 Arrow 按列读取。
+        
         Args:
             layer_name: 图层名称
             
         Returns:
-            GeoDataFrame对象
+            GeoDataFrame对象 (跳过几何时为 DataFrame)
         """
         if layer_name in self.gdf_cache:
             return self.gdf_cache[layer_name]
         
         try:
-            gdf = gpd.read_file(self.gdb_path, layer=layer_name)
+            gdf = gpd.read_file(self.gdb_path, **self._read_kwargs(layer_name))
             self.gdf_cache[layer_name] = gdf
             return gdf
         except Exception as e:
             print(f"读取图层 {layer_name} 失败: {e}")
             return gpd.GeoDataFrame()
     
+    def _iter_layer_batches(self, layer_name: str, batch_size: int) -> Iterator[pd.DataFrame]:
+        """
+        分批流式读取GDB图层，每批最多 batch_size 个要素，不写入 gdf_cache
+        
+        优先使用 pyogrio 的 Arrow 流 (一次打开、顺序读取)；
+        否则按 rows 切片多次读取。
+        
+        Args:
+            layer_name: 图层名称
+            batch_size: 每批要素数
+            
+        Yields:
+            每批数据 (GeoDataFrame，跳过几何时为 DataFrame)
+        """
+        read_kwargs = self._read_kwargs(layer_name)
+        
+        if pyogrio is not None and HAS_ARROW:
+            read_geometry = not read_kwargs.get('ignore_geometry', False)
+            with pyogrio.open_arrow(self.gdb_path, layer=layer_name,
+                                    columns=read_kwargs.get('columns'),
+                                    read_geometry=read_geometry,
+                                    batch_size=batch_size, use_pyarrow=True) as (meta, reader):
+                geometry_name = meta['geometry_name'] or 'wkb_geometry'
+                for batch in reader:
+                    df = batch.to_pandas()
+                    if read_geometry and geometry_name in df.columns:
+                        geometry = gpd.GeoSeries.from_wkb(df.pop(geometry_name), crs=meta['crs'])
+                        df = gpd.GeoDataFrame(df, geometry=geometry.values, crs=meta['crs'])
+                    yield df
+            return
+        
+        read_kwargs.pop('use_arrow', None)
+        offset = 0
+        while True:
+            batch = gpd.read_file(self.gdb_path, rows=slice(offset, offset + batch_size), **read_kwargs)
+            if len(batch):
+                yield batch
+            if len(batch) < batch_size:
+                break
+            offset += batch_size
+    
     def _generate_key(self, row: Dict, key_rule: Dict) -> str:
         """
         根据规则生成主键
@@ -112,6 +439,10 @@ class ETLEngine:
             if hasattr(value, 'wkt'):
                 return value.wkt
             return str(value)
+        elif dtype == 'wkb':
+            if hasattr(value, 'wkb_hex'):
+                return value.wkb_hex
+            return str(value)
         
         return value
     
@@ -136,6 +467,10 @@ class ETLEngine:
                     pass
         return total
     
+    def _apply_transform_row(self, row: Dict, name: str, params: Dict) -> Any:
+        """对单行执行注册的转换 (逐行模式下按一行的数据表调用)"""
+        return apply_transform(name, pd.DataFrame([row]), params)[0]
+    
     def _process_attributes(self, row: Dict, attributes: List[Dict]) -> Dict:
         """
         处理属性映射
@@ -172,6 +507,8 @@ class ETLEngine:
                     if child_transform == 'calc_sum_fields':
                         columns = child_params.get('columns', [])
                         nested_result[child_target] = self._calc_sum_fields(row, columns)
+                    elif child_transform:
+                        nested_result[child_target] = self._apply_transform_row(row, child_transform, child_params)
                     elif child_source:
                         value = row.get(child_source)
                         if value is None:
@@ -205,10 +542,16 @@ class ETLEngine:
                 columns = params.get('columns', [])
                 result[target] = self._calc_sum_fields(row, columns)
                 
+            elif transform_func:
+                result[target] = self._apply_transform_row(row, transform_func, attr.get('params', {}))
+                
             elif source:
                 value = row.get(source)
                 if value is None:
                     result[target] = default
+                elif dtype in GEOMETRY_DTYPES and isinstance(value, shapely.Geometry):
+                    result[target] = self._encode_geometries(np.array([value], dtype=object),
+                                                             compile_geometry(attr))[0]
                 else:
                     result[target] = self._transform_value(value, dtype)
             else:
@@ -236,7 +579,18 @@ class ETLEngine:
             target_key_prefix = rel.get('target_key_prefix', '')
             dynamic_relation = rel.get('dynamic_relation')
             
-            if dynamic_relation:
+            if rel.get('spatial'):
+                # 空间关系：fallback 时前面的规则已产生同名关系则跳过
+                if rel.get('fallback') and any(r['relation'] == relation for r in result):
+                    continue
+                geoms = np.array([row.get(GEOMETRY_COLUMN)], dtype=object)
+                for target_id in self._spatial_targets(compile_spatial(rel), geoms)[0]:
+                    result.append({
+                        'relation': relation,
+                        'target_type': target_type,
+                        'target_id': target_id
+                    })
+            elif dynamic_relation:
                 # 动态关系
                 source_column = dynamic_relation.get('source_column')
                 rules = dynamic_relation.get('rules', [])
@@ -270,112 +624,914 @@ class ETLEngine:
         
         return result
     
-    def _process_mapping(self, mapping_name: str, mapping_config: Dict) -> Dict:
+    # ==================== 向量化 (按列) 执行 ====================
+
+    def _get_column(self, gdf: pd.DataFrame, column: Optional[str]) -> Optional[pd.Series]:
+        """获取列，不存在时返回 None (等价于逐行模式下 row.get(column) 为 None)"""
+        if column is not None and column in gdf.columns:
+            return gdf[column]
+        return None
+
+    def _column_as_str(self, gdf: pd.DataFrame, column: Optional[str]) -> np.ndarray:
         """
-        处理单个映射配置
+        将列转换为字符串数组，与逐行模式下 str(row.get(column, '')) 结果一致
         
         Args:
-            mapping_name: 映射名称
+            gdf: 数据表
+            column: 列名
+            
+        Returns:
+            object 类型的字符串数组
+        """
+        series = self._get_column(gdf, column)
+        if series is None:
+            return np.full(len(gdf), '', dtype=object)
+        return np.array([str(v) for v in series.tolist()], dtype=object)
+
+    def _generate_keys(self, gdf: pd.DataFrame, key: KeyPlan) -> List[str]:
+        """
+        按列批量生成主键 (_generate_key 的向量化版本)
+        
+        Args:
+            gdf: 数据表
+            key: 主键规则
+            
+        Returns:
+            与数据行一一对应的主键列表
+        """
+        if key.method == 'md5':
+            # 先按列拼接字段，MD5 本身只能逐个计算
+            combined = np.full(len(gdf), '', dtype=object)
+            for field in key.fields:
+                combined = combined + self._column_as_str(gdf, field)
+            return [f"{key.prefix}{hashlib.md5(s.encode('utf-8')).hexdigest()}" for s in combined]
+        
+        return (key.prefix + self._column_as_str(gdf, key.field)).tolist()
+
+    def _encode_geometries(self, geoms: np.ndarray, encoding: GeometryEncoding) -> np.ndarray:
+        """
+        整列编码几何 (shapely 2 数组函数，不逐个调用 .wkt)
+        
+        属性配置中的可选项:
+            simplify: 简化容差 (坐标单位)，默认不简化
+            preserve_topology: 简化时是否保持拓扑，默认 true (false 时用 Douglas-Peucker，快数倍但可能自相交)
+            precision: 保留的小数位数，默认全精度
+        
+        Args:
+            geoms: 几何对象数组 (可含 None)
+            encoding: 编码选项，dtype 为 wkt 或 wkb；binary 时输出二进制 WKB
+            
+        Returns:
+            编码后的字符串数组 (binary 时为 bytes 数组，缺失几何为 None)
+        """
+        if encoding.simplify:
+            geoms = shapely.simplify(geoms, encoding.simplify, preserve_topology=encoding.preserve_topology)
+        
+        precision = encoding.precision
+        if encoding.dtype == 'wkb' or encoding.binary:
+            # 直接对坐标数组取整 (比 set_precision 的网格吸附快一个数量级)，十六进制在 Python 侧转换
+            if precision is not None:
+                geoms = shapely.transform(geoms, lambda coords: np.round(coords, precision))
+            if encoding.binary:
+                return shapely.to_wkb(geoms).astype(object)
+            return np.array([None if wkb is None else wkb.hex() for wkb in shapely.to_wkb(geoms)],
+                            dtype=object)
+        return shapely.to_wkt(geoms, rounding_precision=-1 if precision is None else precision).astype(object)
+    
+    def _transform_column(self, series: Optional[pd.Series], n: int,
+                          dtype: Optional[str] = None, default: Any = None,
+                          encoding: Optional[GeometryEncoding] = None) -> List[Any]:
+        """
+        按列转换数据类型 (_transform_value 的向量化版本)
+        
+        语义与逐行模式保持一致：缺失列或 None 取 default，NaN 转为 None，
+        数值列与几何列走向量化路径，其余类型逐个回退到 _transform_value。
+        
+        Args:
+            series: 原始列 (None 表示列不存在)
+            n: 行数
+            dtype: 目标数据类型
+            default: 默认值
+            encoding: 几何编码选项 (见 _encode_geometries)
+            
+        Returns:
+            转换后的值列表
+        """
+        if series is None:
+            return [default] * n
+        
+        kind = series.dtype.kind
+        
+        if dtype in GEOMETRY_DTYPES and isinstance(series.dtype, gpd.array.GeometryDtype):
+            geoms = series.to_numpy()
+            missing = shapely.is_missing(geoms)
+            encoded = self._encode_geometries(geoms, encoding or GeometryEncoding(dtype))
+            encoded[missing] = default
+            return encoded.tolist()
+        
+        if kind in 'iub' and dtype in (None, 'int', 'float'):
+            values = series.to_numpy()
+            if dtype == 'float':
+                return values.astype('float64').astype(object).tolist()
+            if dtype == 'int':
+                return values.astype('int64').astype(object).tolist()
+            return values.astype(object).tolist()
+        
+        if kind == 'f' and dtype in (None, 'int', 'float'):
+            values = series.to_numpy(dtype='float64')
+            if dtype == 'int':
+                invalid = ~np.isfinite(values)
+                out = np.trunc(np.where(invalid, 0.0, values)).astype('int64').astype(object)
+            else:
+                invalid = np.isnan(values)
+                out = values.astype(object)
+            out[invalid] = None
+            return out.tolist()
+        
+        # 字符串/混合类型：逐个回退
+        return [default if v is None else self._transform_value(v, dtype) for v in series.tolist()]
+
+    def _calc_sum_columns(self, gdf: pd.DataFrame, columns: List[str]) -> List[int]:
+        """
+        按列计算指定字段的总和 (_calc_sum_fields 的向量化版本)，非法值按 0 处理
+        
+        Args:
+            gdf: 数据表
+            columns: 要求和的字段列表
+            
+        Returns:
+            每行的总和
+        """
+        return apply_transform('calc_sum_fields', gdf, {'columns': columns})
+
+    def _attribute_column(self, gdf: pd.DataFrame, n: int, attr: AttributePlan) -> List[Any]:
+        """计算单个属性计划的整列取值"""
+        if attr.kind == 'column':
+            return self._transform_column(self._get_column(gdf, attr.source), n,
+                                          attr.dtype, attr.default, attr.geometry)
+        if attr.kind == 'transform':
+            return apply_transform(attr.transform, gdf, attr.params)
+        if attr.kind == 'nested':
+            if not attr.children:
+                return [{} for _ in range(n)]
+            targets = [child.target for child in attr.children]
+            columns = [self._attribute_column(gdf, n, child) for child in attr.children]
+            return [dict(zip(targets, vals)) for vals in zip(*columns)]
+        return [attr.default] * n
+
+    def _process_attributes_frame(self, gdf: pd.DataFrame, attributes: Tuple[AttributePlan, ...]) -> List[Dict]:
+        """
+        按列处理属性映射 (_process_attributes 的向量化版本)
+        
+        Args:
+            gdf: 数据表
+            attributes: 属性计划
+            
+        Returns:
+            与数据行一一对应的属性字典列表
+        """
+        n = len(gdf)
+        if not attributes:
+            return [{} for _ in range(n)]
+        targets = [attr.target for attr in attributes]
+        columns = [self._attribute_column(gdf, n, attr) for attr in attributes]
+        return [dict(zip(targets, vals)) for vals in zip(*columns)]
+
+    def _process_relationships_frame(self, gdf: pd.DataFrame,
+                                     relationships: Tuple[RelationshipPlan, ...]) -> List[List[Dict]]:
+        """
+        按列处理关系映射 (_process_relationships 的向量化版本)
+        
+        Args:
+            gdf: 数据表
+            relationships: 关系计划
+            
+        Returns:
+            与数据行一一对应的关系列表
+        """
+        n = len(gdf)
+        result = [[] for _ in range(n)]
+        
+        for rel in relationships:
+            target_type = rel.target_type
+            
+            if rel.spatial:
+                relation = rel.relation
+                geom_series = self._get_column(gdf, GEOMETRY_COLUMN)
+                geoms = geom_series.to_numpy() if geom_series is not None else np.full(n, None, dtype=object)
+                if rel.spatial.fallback:
+                    # 已通过外键等规则产生同名关系的行不做空间匹配
+                    linked = np.array([any(r['relation'] == relation for r in rels) for rels in result],
+                                      dtype=bool)
+                    geoms = np.where(linked, None, geoms)
+                for i, target_ids in enumerate(self._spatial_targets(rel.spatial, geoms)):
+                    for target_id in target_ids:
+                        result[i].append({
+                            'relation': relation,
+                            'target_type': target_type,
+                            'target_id': target_id
+                        })
+                continue
+            
+            fk_series = self._get_column(gdf, rel.foreign_key_field)
+            if fk_series is None:
+                continue
+            # 与逐行模式的 `if foreign_key:` 保持一致的真值判断
+            mask = fk_series.to_numpy(dtype=object).astype(bool)
+            target_ids = rel.target_key_prefix + self._column_as_str(gdf, rel.foreign_key_field)
+            
+            if rel.rules:
+                # 动态关系：按规则顺序为每行选定关系名，先命中者优先
+                source_series = self._get_column(gdf, rel.rule_source)
+                source_values = source_series.to_numpy(dtype=object) if source_series is not None \
+                    else np.full(n, None, dtype=object)
+                relation_names = np.full(n, None, dtype=object)
+                assigned = np.zeros(n, dtype=bool)
+                
+                for match_value, relation_name in rel.rules:
+                    if match_value == 'otherwise':
+                        hit = ~assigned
+                    else:
+                        hit = ~assigned & np.array([match_value == v for v in source_values], dtype=bool)
+                    relation_names[hit] = relation_name
+                    assigned |= hit
+                
+                mask &= relation_names.astype(bool)
+            else:
+                relation_names = np.full(n, rel.relation, dtype=object)
+            
+            for i in np.flatnonzero(mask):
+                result[i].append({
+                    'relation': relation_names[i],
+                    'target_type': target_type,
+                    'target_id': target_ids[i]
+                })
+        
+        return result
+
+    def _spatial_index(self, spatial: SpatialPlan) -> Tuple[shapely.STRtree, np.ndarray]:
+        """
+        为空间关系的目标图层建立 STRtree 索引 (同一目标图层与主键规则只建一次)
+        
+        Args:
+            spatial: 空间关系 (target_layer / target_key_field / target_key_prefix)
+            
+        Returns:
+            (STRtree, 与树中几何一一对应的目标主键数组，主键为空时为 None)
+        """
+        cache_key = (spatial.target_layer, spatial.target_key_field, spatial.target_key_prefix)
+        if cache_key in self._spatial_indexes:
+            return self._spatial_indexes[cache_key]
+        
+        target = self._read_gdb_layer(spatial.target_layer)
+        geom_series = self._get_column(target, GEOMETRY_COLUMN)
+        if geom_series is None:
+            print(f"⚠️ 空间关系的目标图层 {spatial.target_layer} 没有几何列")
+            geoms = np.array([], dtype=object)
+            target_ids = np.array([], dtype=object)
+        else:
+            geoms = geom_series.to_numpy()
+            key_series = self._get_column(target, spatial.target_key_field)
+            target_ids = spatial.target_key_prefix + self._column_as_str(target, spatial.target_key_field)
+            if key_series is None:
+                target_ids[:] = None
+            else:
+                # 与外键关系一致：主键值为假值的目标不产生关系
+                target_ids[~key_series.to_numpy(dtype=object).astype(bool)] = None
+        
+        self._spatial_indexes[cache_key] = (shapely.STRtree(geoms), target_ids)
+        return self._spatial_indexes[cache_key]
+    
+    def _spatial_targets(self, spatial: SpatialPlan, geoms: np.ndarray) -> List[List[str]]:
+        """
+        用 STRtree 批量查询每个源几何对应的目标主键
+        
+        关系配置:
+            spatial: within (源几何位于目标内) | intersects (相交) | nearest (最近的一个目标)
+            max_distance: nearest 的最大搜索距离；intersects 时表示距离不超过该值即匹配
+        
+        Args:
+            spatial: 空间关系
+            geoms: 源几何数组 (None 表示不参与匹配)
+            
+        Returns:
+            与源几何一一对应的目标主键列表 (多个命中时按目标图层顺序)
+        """
+        mode = spatial.predicate
+        if mode not in SPATIAL_PREDICATES:
+            raise ValueError(f"未知的空间关系: {mode}，可选: {', '.join(SPATIAL_PREDICATES)}")
+        
+        matches = [[] for _ in range(len(geoms))]
+        tree, target_ids = self._spatial_index(spatial)
+        if len(tree) == 0:
+            return matches
+        max_distance = spatial.max_distance
+        if mode == 'nearest':
+            source_idx, target_idx = tree.query_nearest(geoms, max_distance=max_distance, all_matches=False)
+        elif mode == 'intersects' and max_distance:
+            source_idx, target_idx = tree.query(geoms, predicate='dwithin', distance=max_distance)
+        else:
+            source_idx, target_idx = tree.query(geoms, predicate=mode)
+        
+        order = np.lexsort((target_idx, source_idx))
+        for i, j in zip(source_idx[order].tolist(), target_idx[order].tolist()):
+            target_id = target_ids[j]
+            if target_id is not None:
+                matches[i].append(target_id)
+        return matches
+
+    def _transform_frame(self, gdf: pd.DataFrame, plan: MappingPlan) -> List[Tuple[str, Dict, List[Dict]]]:
+        """
+        按列执行单个映射，返回 (主键, 属性, 关系) 记录列表
+        
+        Args:
+            gdf: 图层数据
+            plan: 映射计划
+            
+        Returns:
+            与数据行一一对应的记录列表
+        """
+        n = len(gdf)
+        with self.profiler.stage(plan.name, 'keys', n):
+            keys = self._generate_keys(gdf, plan.key)
+        with self.profiler.stage(plan.name, 'attributes', n):
+            attrs = self._process_attributes_frame(gdf, plan.attributes)
+        with self.profiler.stage(plan.name, 'relationships', n):
+            rels = self._process_relationships_frame(gdf, plan.relationships)
+        return list(zip(keys, attrs, rels))
+
+    def _transform_rows(self, gdf: pd.DataFrame, mapping_config: Dict) -> List[Tuple[str, Dict, List[Dict]]]:
+        """
+        逐行执行单个映射 (原始 iterrows 实现，直接读取配置字典，用于与向量化结果对比)
+        
+        Args:
+            gdf: 图层数据
             mapping_config: 映射配置
             
         Returns:
-            处理后的数据字典
+            与数据行一一对应的记录列表
         """
-        source_layer = mapping_config.get('source_layer')
-        entity_type = mapping_config.get('entity_type')
         key_rule = mapping_config.get('key_rule', {})
         attributes = mapping_config.get('attributes', [])
         relationships = mapping_config.get('relationships', [])
+        records = []
         
-        # 读取GDB图层
-        gdf = self._read_gdb_layer(source_layer)
+        for idx, row in gdf.iterrows():
+            # 将GeoDataFrame的Series转换为字典
+            row_dict = row.to_dict()
+            records.append((
+                self._generate_key(row_dict, key_rule),
+                self._process_attributes(row_dict, attributes),
+                self._process_relationships(row_dict, relationships)
+            ))
+        
+        return records
+
+    def _transform(self, gdf: pd.DataFrame, plan: MappingPlan) -> List[Tuple[str, Dict, List[Dict]]]:
+        """按引擎设置选择向量化或逐行方式执行映射"""
+        if self.vectorized:
+            return self._transform_frame(gdf, plan)
+        with self.profiler.stage(plan.name, 'transform', len(gdf)):
+            return self._transform_rows(gdf, plan.config)
+    
+    def _process_mapping(self, plan: MappingPlan) -> Dict:
+        """
+        处理单个映射
+        
+        Args:
+            plan: 映射计划
+            
+        Returns:
+            处理后的数据字典
+        """
+        # 读取GDB图层 (已缓存的图层不再计入读取阶段，共用图层的读取记在首个映射下)
+        if plan.source_layer in self.gdf_cache:
+            gdf = self._read_gdb_layer(plan.source_layer)
+        else:
+            with self.profiler.stage(plan.name, 'read') as stage:
+                gdf = self._read_gdb_layer(plan.source_layer)
+                stage.rows = len(gdf)
         
         if gdf.empty:
-            print(f"图层 {source_layer} 为空或不存在")
+            print(f"图层 {plan.source_layer} 为空或不存在")
             return {
-                'mapping_name': mapping_name,
-                'entity_type': entity_type,
+                'mapping_name': plan.name,
+                'entity_type': plan.entity_type,
                 'entities': []
             }
         
         # 处理去重策略
-        dedup_policy = key_rule.get('deduplication_policy')
-        entities_dict = {}  # 用于去重和合并
+        records = self._transform(gdf, plan)
+        with self.profiler.stage(plan.name, 'merge', len(records)):
+            merger = EntityMerger(plan.entity_type, plan.key.dedup_policy)
+            merger.add_records(records)
+            entities = merger.to_list()
         
-        for idx, row in gdf.iterrows():
-            # 将GeoDataFrame的Series转换为字典
-            row_dict = row.to_dict()
+        return {
+            'mapping_name': plan.name,
+            'entity_type': plan.entity_type,
+            'entities': entities
+        }
+    
+    def _run_streaming(self, batch_size: int, sinks: Optional[Dict[str, BaseSink]] = None,
+                       on_result: Optional[Callable[[str, Dict], None]] = None,
+                       keep_results: bool = True) -> Dict[str, Dict]:
+        """
+        流式运行ETL：按图层分批读取，每批依次执行所有读取该图层的映射后即丢弃
+        
+        图层数据的内存占用受 batch_size 约束，不再缓存整层数据；
+        同一图层只顺序读取一遍 (例如 ElementAtRisk_Mapping 与 Household_Mapping 共用承灾体)。
+        传入 sinks 时，无去重策略的映射每批直接写出、不在内存中保留实体
+        (重复主键会按出现顺序重复写出，由下游按 id 后者覆盖)；merge_relation
+        映射需要看到全部批次，结束后再写出。空间关系的目标图层需要整层建立索引，
+        仍整层读取并缓存。
+        
+        Args:
+            batch_size: 每批要素数
+            sinks: 映射名 -> 输出对象 (可选)
+            on_result: 单个映射完成时的回调 (映射名, 结果)；已由 sinks 边读边写出的映射不回调
+            keep_results: 是否在返回值中保留实体 (False 时回调后只保留 entity_count)
             
-            # 生成主键
-            key = self._generate_key(row_dict, key_rule)
-            
-            # 处理属性
-            attrs = self._process_attributes(row_dict, attributes)
-            
-            # 处理关系
-            rels = self._process_relationships(row_dict, relationships)
-            
-            if dedup_policy == 'merge_relation':
-                # 合并关系模式
-                if key in entities_dict:
-                    # 合并关系
-                    existing_rels = entities_dict[key].get('relationships', [])
-                    for new_rel in rels:
-                        # 检查关系是否已存在
-                        is_duplicate = False
-                        for existing_rel in existing_rels:
-                            if (existing_rel.get('relation') == new_rel.get('relation') and
-                                existing_rel.get('target_type') == new_rel.get('target_type') and
-                                existing_rel.get('target_id') == new_rel.get('target_id')):
-                                is_duplicate = True
-                                break
-                        if not is_duplicate:
-                            existing_rels.append(new_rel)
-                    entities_dict[key]['relationships'] = existing_rels
-                else:
-                    entities_dict[key] = {
-                        'id': key,
-                        'type': entity_type,
-                        'attributes': attrs,
-                        'relationships': rels
-                    }
+        Returns:
+            所有映射的结果字典 (已直接写出的映射只包含 entity_count)
+        """
+        sinks = sinks or {}
+        plans = self._plans()
+        # 按图层分组，保持配置中的出现顺序
+        layer_mappings: Dict[str, List[MappingPlan]] = {}
+        for plan in plans.values():
+            layer_mappings.setdefault(plan.source_layer, []).append(plan)
+        
+        mergers = {key: EntityMerger(plan.entity_type, plan.key.dedup_policy) for key, plan in plans.items()}
+        # 边读边写的映射只记录已写出的主键，用于统计数量与重复
+        written_keys = {key: set() for key in plans if key in sinks and not mergers[key].dedup_policy}
+        
+        for layer_name, mappings in layer_mappings.items():
+            print(f"正在流式读取图层: {layer_name} (映射: {', '.join(plan.name for plan in mappings)})")
+            feature_count = 0
+            batches = self._iter_layer_batches(layer_name, batch_size)
+            while True:
+                # 只有打开/读取图层的错误按读取失败处理 (跳过该图层)；
+                # 转换与写出的错误直接抛出，避免留下看似成功的残缺输出
+                try:
+                    # 图层读取记在首个读取该图层的映射下
+                    with self.profiler.stage(mappings[0].name, 'read') as stage:
+                        batch = next(batches, None)
+                        stage.rows = 0 if batch is None else len(batch)
+                except Exception as e:
+                    print(f"读取图层 {layer_name} 失败: {e}")
+                    break
+                if batch is None:
+                    break
+                feature_count += len(batch)
+                for plan in mappings:
+                    key = plan.name
+                    records = self._transform(batch, plan)
+                    if key in written_keys:
+                        with self.profiler.stage(key, 'merge', len(records)):
+                            batch_merger = EntityMerger(plan.entity_type)
+                            batch_merger.add_records(records)
+                            entities = batch_merger.to_list()
+                        with self.profiler.stage(key, 'write', len(entities)):
+                            sinks[key].write_many(entities)
+                        written_keys[key].update(batch_merger.entities)
+                    else:
+                        with self.profiler.stage(key, 'merge', len(records)):
+                            mergers[key].add_records(records)
+                del batch
+            print(f"  - 共读取 {feature_count} 个要素")
+        
+        results = {}
+        for key, plan in plans.items():
+            result = {'mapping_name': key, 'entity_type': plan.entity_type}
+            if key in written_keys:
+                result['entity_count'] = len(written_keys[key])
+                duplicates = sinks[key].count - result['entity_count']
+                if duplicates:
+                    print(f"⚠️ 映射 {key} 有 {duplicates} 条重复主键记录，已按出现顺序写出")
             else:
-                # 默认模式：每行一个实体
-                entities_dict[key] = {
-                    'id': key,
-                    'type': entity_type,
-                    'attributes': attrs,
-                    'relationships': rels
-                }
+                result['entities'] = mergers.pop(key).to_list()
+                if key in sinks:
+                    with self.profiler.stage(key, 'write', len(result['entities'])):
+                        sinks[key].write_many(result['entities'])
+                    result = self._summarize(result)
+                else:
+                    if on_result:
+                        with self.profiler.stage(key, 'write', len(result['entities'])):
+                            on_result(key, result)
+                    if not keep_results:
+                        result = self._summarize(result)
+            results[key] = result
+            count = result.get('entity_count', len(result.get('entities', [])))
+            print(f"映射 {key} 完成，共生成 {count} 个实体")
+        return results
+    
+    def build_plan(self) -> Dict[str, Dict[str, List[str]]]:
+        """
+        根据配置构建执行计划
         
-        return {
-            'mapping_name': mapping_name,
-            'entity_type': entity_type,
-            'entities': list(entities_dict.values())
-        }
+        映射之间除共享图层外互不依赖，因此计划只记录每个映射依赖的图层 (源图层及空间关系的目标图层)，
+        以及每个图层被哪些映射读取 (保证每个图层只读取一次)。
+        
+        Returns:
+            {'layers': 图层 -> 映射列表, 'dependencies': 映射 -> 依赖图层列表}
+        """
+        layers: Dict[str, List[str]] = {}
+        dependencies: Dict[str, List[str]] = {}
+        for key, plan in self._plans().items():
+            # 空间关系还依赖目标图层 (用于建立空间索引)
+            required = [plan.source_layer] + [name for name in plan.target_layers if name != plan.source_layer]
+            dependencies[key] = required
+            for layer_name in required:
+                layers.setdefault(layer_name, []).append(key)
+        return {'layers': layers, 'dependencies': dependencies}
+    
+    def _run_parallel(self, workers: int, on_result: Optional[Callable[[str, Dict], None]] = None,
+                      keep_results: bool = True) -> Dict[str, Dict]:
+        """
+        使用进程池并行执行相互独立的映射
+        
+        主进程按计划逐个读取图层 (每个图层只读一次)，某映射依赖的图层全部就绪后
+        立即提交给进程池；每读取一个图层前以及全部提交后，按完成顺序回调 on_result (例如立即写出结果)。
+        
+        Args:
+            workers: 进程数
+            on_result: 单个映射完成时的回调 (映射名, 结果)
+            keep_results: 是否保留实体 (False 时回调后只保留 entity_count)
+            
+        Returns:
+            所有映射的结果字典 (按配置顺序)
+        """
+        plan = self.build_plan()
+        mapping_plans = self._plans()
+        pending_layers = {key: set(layers) for key, layers in plan['dependencies'].items()}
+        # 图层 -> 还有多少映射没提交，降为 0 后从主进程缓存中释放
+        layer_refs = {layer_name: len(keys) for layer_name, keys in plan['layers'].items()}
+        options = {'vectorized': self.vectorized, 'projection': self.projection,
+                   'trace_memory': self.trace_memory, 'profiler_hook': self.profiler_hook}
+        
+        results = {}
+        frames = {}
+        
+        def deliver(done):
+            for future in done:
+                key = futures.pop(future)
+                result, elapsed, stats = future.result()
+                self.timings[key] = elapsed
+                self.profiler.merge(stats)
+                print(f"  - 映射 {key} 完成，共生成 {len(result['entities'])} 个实体，耗时 {elapsed:.2f}s")
+                if on_result:
+                    with self.profiler.stage(key, 'write', len(result['entities'])):
+                        on_result(key, result)
+                results[key] = result if keep_results else self._summarize(result)
+        
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {}
+            for layer_name, keys in plan['layers'].items():
+                # 读取下一个图层前先交付已完成的映射，结果不在主进程中堆积
+                deliver(wait(futures, timeout=0).done if futures else [])
+                with self.profiler.stage(keys[0], 'read') as stage:
+                    frames[layer_name] = self._read_gdb_layer(layer_name)
+                    stage.rows = len(frames[layer_name])
+                for key in keys:
+                    pending_layers[key].discard(layer_name)
+                    if pending_layers[key]:
+                        continue
+                    layers = {name: frames[name] for name in plan['dependencies'][key]}
+                    print(f"提交映射: {key}")
+                    futures[executor.submit(_mapping_worker, self.config_path, options,
+                                            mapping_plans[key], layers)] = key
+                    for name in plan['dependencies'][key]:
+                        layer_refs[name] -= 1
+                        if layer_refs[name] == 0:
+                            frames.pop(name, None)
+                            self.gdf_cache.pop(name, None)
+            
+            for future in as_completed(list(futures)):
+                deliver([future])
+        
+        return {key: results[key] for key in mapping_plans}
+    
+    def _layer_count(self, layer_name: str) -> Optional[int]:
+        """图层要素数 (已缓存时取行数，否则读取元数据)；无法获取时返回 None"""
+        if layer_name in self.gdf_cache:
+            return len(self.gdf_cache[layer_name])
+        if pyogrio is None:
+            return None
+        try:
+            count = pyogrio.read_info(self.gdb_path, layer=layer_name)['features']
+        except Exception:
+            return None
+        return count if count >= 0 else None
     
-    def run(self) -> Dict[str, Dict]:
+    def _read_sample(self, layer_name: str, sample_rows: int) -> pd.DataFrame:
+        """读取图层前 sample_rows 个要素 (列裁剪与正式运行一致，不写入 gdf_cache)"""
+        if layer_name in self.gdf_cache:
+            return self.gdf_cache[layer_name].head(sample_rows)
+        read_kwargs = self._read_kwargs(layer_name)
+        read_kwargs.pop('use_arrow', None)
+        try:
+            return gpd.read_file(self.gdb_path, rows=slice(0, sample_rows), **read_kwargs)
+        except Exception as e:
+            print(f"读取图层 {layer_name} 失败: {e}")
+            return gpd.GeoDataFrame()
+    
+    def dry_run(self, sample_rows: int = 1000) -> Dict[str, Dict]:
+        """
+        试运行：检查配置，统计每个映射的源图层行数，并用前 sample_rows 行估算正式运行耗时
+        
+        估算 = (样本读取 + 转换 + 合并耗时) / 样本行数 * 图层行数 + 空间索引建立耗时，不写出结果。
+        
+        Args:
+            sample_rows: 每个图层的样本行数
+            
+        Returns:
+            映射名 -> {'source_layer', 'rows', 'sample_rows', 'estimated_seconds'}
+        """
+        plans = self._prepare()
+        samples = {}
+        report = {}
+        
+        for key, plan in plans.items():
+            if plan.source_layer not in samples:
+                sample, read_time = self._timed(lambda: self._read_sample(plan.source_layer, sample_rows))
+                samples[plan.source_layer] = (sample, read_time)
+            sample, read_time = samples[plan.source_layer]
+            
+            # 空间索引在正式运行中只建立一次，不按行数外推
+            index_time = 0.0
+            for rel in plan.relationships:
+                if rel.spatial:
+                    index_time += self._timed(lambda: self._spatial_index(rel.spatial))[1]
+            
+            def transform():
+                merger = EntityMerger(plan.entity_type, plan.key.dedup_policy)
+                merger.add_records(self._transform(sample, plan))
+            transform_time = self._timed(transform)[1] if len(sample) else 0.0
+            
+            rows = self._layer_count(plan.source_layer)
+            estimated = None
+            if rows is not None and len(sample):
+                estimated = (read_time + transform_time) / len(sample) * rows + index_time
+            report[key] = {'source_layer': plan.source_layer, 'rows': rows, 'sample_rows': len(sample),
+                           'estimated_seconds': estimated}
+        
+        print("\n试运行 (未写出结果):")
+        print(f"  {'映射':<30} {'图层':<10} {'行数':>10} {'预计耗时':>10}")
+        for key, item in report.items():
+            rows = '未知' if item['rows'] is None else item['rows']
+            estimated = '未知' if item['estimated_seconds'] is None else f"{item['estimated_seconds']:.2f}s"
+            print(f"  {key:<30} {item['source_layer']:<10} {rows:>10} {estimated:>10}")
+        return report
+    
+    @staticmethod
+    def _timed(func: Callable[[], Any]) -> Tuple[Any, float]:
+        start = time.perf_counter()
+        result = func()
+        return result, time.perf_counter() - start
+    
+    @contextmanager
+    def _profiling(self, mode: str):
+        """一次运行的统计范围：开始时清空阶段统计，结束时记录总耗时"""
+        self.profiler.reset(mode)
+        try:
+            yield self.profiler
+        finally:
+            self.profiler.finish()
+    
+    def report_profile(self, path: Optional[str] = None) -> Dict[str, Any]:
+        """
+        打印各阶段性能统计，并可写出 JSON 报告 (用于对比不同运行，见 etl_profiler.compare_reports)
+        
+        Args:
+            path: 报告路径，为 None 时只打印
+            
+        Returns:
+            报告字典
+        """
+        self.profiler.print_summary()
+        if path:
+            print(f"性能报告已保存: {self.profiler.save(path)}")
+        return self.profiler.report()
+    
+    def print_timings(self):
+        """打印每个映射的处理耗时"""
+        if not self.timings:
+            return
+        print("\n映射耗时统计:")
+        for key, elapsed in self.timings.items():
+            print(f"  {key:<30} {elapsed:8.2f}s")
+    
+    @staticmethod
+    def _summarize(result: Dict) -> Dict:
+        """去掉实体列表，只保留数量"""
+        summary = {k: v for k, v in result.items() if k != 'entities'}
+        summary['entity_count'] = len(result['entities'])
+        return summary
+    
+    def run(self, stream: bool = False, batch_size: int = 50000, workers: Optional[int] = None,
+            on_result: Optional[Callable[[str, Dict], None]] = None,
+            keep_results: bool = True) -> Dict[str, Dict]:
         """
         运行ETL流程
         
+        Args:
+            stream: 是否以流式分批模式运行 (适用于超出内存的大图层)
+            batch_size: 流式模式下每批要素数
+            workers: 并行进程数，默认取 global_config.max_workers，<= 1 时顺序执行
+            on_result: 单个映射完成时的回调 (映射名, 结果)，用于边跑边写出
+            keep_results: 是否在返回值中保留实体 (False 时只保留 entity_count，配合 on_result 降低内存)
+        
         Returns:
             所有映射的结果字典
         """
+        plans = self._prepare()
+        if stream:
+            with self._profiling('stream'):
+                return self._run_streaming(batch_size, on_result=on_result, keep_results=keep_results)
+        
+        if workers is None:
+            workers = self.config.get('global_config', {}).get('max_workers', 1)
+        if workers > 1:
+            with self._profiling('parallel'):
+                return self._run_parallel(workers, on_result, keep_results)
+        
         results = {}
         
-        # 跳过全局配置，只处理映射配置
-        for key, value in self.config.items():
-            if key == 'global_config':
-                continue
-            
-            if isinstance(value, dict) and 'source_layer' in value:
+        with self._profiling('sequential'):
+            for key, plan in plans.items():
                 print(f"正在处理映射: {key}")
-                result = self._process_mapping(key, value)
-                results[key] = result
+                start = time.perf_counter()
+                result = self._process_mapping(plan)
+                self.timings[key] = time.perf_counter() - start
                 print(f"  - 完成，共生成 {len(result['entities'])} 个实体")
+                if on_result:
+                    with self.profiler.stage(key, 'write', len(result['entities'])):
+                        on_result(key, result)
+                results[key] = result if keep_results else self._summarize(result)
         
         return results
     
+    def _output_format(self, mapping_name: str) -> str:
+        """
+        获取映射的输出格式
+        
+        在 global_config.output 中配置: format 为默认格式，
+        mappings 下可按映射名单独指定 (json | jsonl | parquet)。
+        """
+        output_config = self.config.get('global_config', {}).get('output', {}) or {}
+        return output_config.get('mappings', {}).get(mapping_name, output_config.get('format', 'json'))
+    
+    def open_sink(self, mapping_name: str, output_dir: str) -> BaseSink:
+        """
+        按配置为映射创建输出对象
+        
+        Args:
+            mapping_name: 映射名称
+            output_dir: 输出目录
+            
+        Returns:
+            输出对象
+        """
+        plan = self._plans()[mapping_name]
+        geometry_columns = [attr.target for attr in plan.attributes if attr.geometry is not None]
+        wkb_columns = [attr.target for attr in plan.attributes if attr.dtype == 'wkb']
+        crs = self._layer_crs(plan.source_layer) if geometry_columns else None
+        return open_sink(self._output_format(mapping_name), output_dir, mapping_name,
+                         plan.entity_type, geometry_columns, wkb_columns, crs=crs)
+    
+    def _layer_crs(self, layer_name: str) -> Optional[Dict]:
+        """
+        图层坐标系的 PROJJSON (写入 GeoParquet 元数据)
+        
+        Args:
+            layer_name: 图层名称
+            
+        Returns:
+            PROJJSON 字典；图层没有坐标系或无法获取时返回 None
+        """
+        crs = getattr(self.gdf_cache.get(layer_name), 'crs', None)
+        if crs is None and pyogrio is not None:
+            try:
+                crs = pyogrio.read_info(self.gdb_path, layer=layer_name)['crs']
+            except Exception:
+                crs = None
+        if crs is None:
+            return None
+        try:
+            from pyproj import CRS
+            return CRS.from_user_input(crs).to_json_dict()
+        except Exception as e:
+            print(f"⚠️ 无法解析图层 {layer_name} 的坐标系: {e}")
+            return None
+    
+    def save_results(self, results: Dict[str, Dict], output_dir: str = './output') -> Dict[str, Path]:
+        """
+        按各映射配置的输出格式保存结果
+        
+        Args:
+            results: ETL结果
+            output_dir: 输出目录
+            
+        Returns:
+            映射名 -> 输出文件路径
+        """
+        paths = {}
+        for mapping_name, data in results.items():
+            with self.open_sink(mapping_name, output_dir) as sink:
+                sink.write_many(data['entities'])
+            paths[mapping_name] = sink.path
+            print(f"已保存: {sink.path}")
+        return paths
+    
+    def export(self, output_dir: str = './output', stream: bool = False, batch_size: int = 50000,
+               workers: Optional[int] = None) -> Dict[str, Path]:
+        """
+        运行ETL并按配置格式写出，每个映射完成 (流式模式下每批完成) 即写出，不保留全部结果
+        
+        Args:
+            output_dir: 输出目录
+            stream: 是否流式分批读取图层
+            batch_size: 流式模式下每批要素数
+            workers: 并行进程数
+            
+        Returns:
+            映射名 -> 输出文件路径
+        """
+        # Parquet 输出的几何属性直接编码为二进制 WKB，不经 WKT 再解析
+        self.binary_geometry = {key for key, _ in self._iter_mappings() if self._output_format(key) == 'parquet'}
+        try:
+            if stream:
+                self._prepare()
+                sinks = {key: self.open_sink(key, output_dir) for key in self.plans}
+                try:
+                    with self._profiling('stream'):
+                        self._run_streaming(batch_size, sinks)
+                finally:
+                    for sink in sinks.values():
+                        sink.close()
+                for sink in sinks.values():
+                    print(f"已保存: {sink.path}")
+                return {key: sink.path for key, sink in sinks.items()}
+            
+            paths = {}
+            
+            def write(mapping_name: str, data: Dict):
+                paths.update(self.save_results({mapping_name: data}, output_dir))
+            
+            self.run(workers=workers, on_result=write, keep_results=False)
+            return paths
+        finally:
+            # 后续 run() 重新编译时恢复文本编码
+            self.binary_geometry = set()
+    
+    def export_delta(self, output_dir: str = './output', manifest_dir: Optional[str] = None,
+                     workers: Optional[int] = None, commit: bool = False) -> Dict[str, Dict]:
+        """
+        增量运行：与上次清单比对，每个映射只写出新增 / 更新 / 删除的实体 (<映射名>.delta.jsonl)
+        
+        默认不更新清单，而是把新清单作为待提交清单写在 delta 旁边，
+        由下游 (如 etl_graph_loader --delta) 成功消费后调用 commit_pending() 提交；
+        下游失败时清单不变，下次运行仍会输出这些变更。
+        
+        Args:
+            output_dir: delta 输出目录
+            manifest_dir: 清单目录，默认取 global_config.manifest_dir，未配置时为 <output_dir>/manifest
+            workers: 并行进程数
+            commit: 写出 delta 后是否立即更新清单 (没有下游消费步骤时使用)
+            
+        Returns:
+            映射名 -> {'path', 'pending', 'inserted', 'updated', 'deleted', 'unchanged', 'manifest'}
+        """
+        if manifest_dir is None:
+            manifest_dir = self.config.get('global_config', {}).get(
+                'manifest_dir', str(Path(output_dir) / 'manifest'))
+        deltas = {}
+        
+        def diff(mapping_name: str, data: Dict):
+            manifest = MappingManifest(manifest_dir, mapping_name)
+            delta = manifest.diff(data['entity_type'], data['entities'])
+            path = write_delta(delta, output_dir)
+            pending = None
+            if commit:
+                manifest.commit()
+            else:
+                pending = manifest.save_pending(output_dir)
+            deltas[mapping_name] = {
+                'path': path,
+                'pending': pending,
+                'inserted': len(delta['inserted']),
+                'updated': len(delta['updated']),
+                'deleted': len(delta['deleted']),
+                'unchanged': delta['unchanged'],
+                'manifest': manifest
+            }
+            print(f"  - 新增 {len(delta['inserted'])}，更新 {len(delta['updated'])}，"
+                  f"删除 {len(delta['deleted'])}，未变 {delta['unchanged']} -> {path}")
+        
+        self.run(workers=workers, on_result=diff, keep_results=False)
+        return deltas
+    
     def save_to_json(self, results: Dict[str, Dict], output_dir: str = './output'):
         """
         将结果保存为JSON文件
@@ -384,29 +1540,76 @@ class ETLEngine:
             results: ETL结果
             output_dir: 输出目录
         """
-        output_path = Path(output_dir)
-        output_path.mkdir(parents=True, exist_ok=True)
-        
         for mapping_name, data in results.items():
-            file_path = output_path / f"{mapping_name}.json"
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            print(f"已保存: {file_path}")
+            with JsonSink(output_dir, mapping_name, data['entity_type']) as sink:
+                sink.write_many(data['entities'])
+            print(f"已保存: {sink.path}")
+
+def _mapping_worker(config_path: str, options: Dict, plan: MappingPlan,
+                    layers: Dict[str, pd.DataFrame]) -> Tuple[Dict, float, Dict]:
+    """
+    进程池工作函数：在子进程中执行单个映射
+    
+    Args:
+        config_path: YAML配置文件路径
+        options: ETLEngine 构造参数
+        plan: 主进程编译好的映射计划
+        layers: 主进程已读取好的依赖图层
+        
+    Returns:
+        (映射结果, 耗时秒数, 分阶段统计)
+    """
+    start = time.perf_counter()
+    engine = ETLEngine(config_path, **options)
+    engine.gdf_cache.update(layers)
+    with engine._profiling('worker'):
+        result = engine._process_mapping(plan)
+    return result, time.perf_counter() - start, engine.profiler.stats
 
 
 def main():
     """主函数"""
-    # 配置文件路径
-    config_path = 'test.yaml'
+    parser = argparse.ArgumentParser(description='GDB -> Ontology ETL引擎')
+    parser.add_argument('--config', default='test.yaml', help='YAML配置文件路径')
+    parser.add_argument('--output', default='./output', help='输出目录')
+    parser.add_argument('--stream', action='store_true', help='流式分批读取图层 (适用于超出内存的大图层)')
+    parser.add_argument('--batch-size', type=int, default=50000, help='流式模式下每批要素数')
+    parser.add_argument('--workers', type=int, default=None,
+                        help=f'并行进程数 (默认取 global_config.max_workers，本机 CPU 数 {os.cpu_count()})')
+    parser.add_argument('--incremental', action='store_true', help='增量模式：只输出与上次运行相比变化的实体')
+    parser.add_argument('--manifest-dir', default=None, help='增量模式的清单目录')
+    parser.add_argument('--commit-manifest', action='store_true',
+                        help='增量模式下写出 delta 后立即更新清单 (默认由 etl_graph_loader --delta 加载成功后提交)')
+    parser.add_argument('--dry-run', action='store_true', help='只检查配置并估算各映射的行数与耗时，不写出结果')
+    parser.add_argument('--sample-rows', type=int, default=1000, help='试运行时每个图层的样本行数')
+    parser.add_argument('--profile', default=None,
+                        help='性能报告 JSON 路径 (默认 <输出目录>/etl_profile.json)')
+    parser.add_argument('--trace-memory', action='store_true', help='统计各阶段峰值内存 (tracemalloc，较慢)')
+    parser.add_argument('--sampling-profile', default=None, metavar='DIR',
+                        help='使用 pyinstrument 采样分析各阶段，调用栈报告写入该目录')
+    args = parser.parse_args()
     
     # 创建ETL引擎
-    engine = ETLEngine(config_path)
+    hook = PyinstrumentHook(args.sampling_profile) if args.sampling_profile else None
+    engine = ETLEngine(args.config, trace_memory=args.trace_memory, profiler_hook=hook)
+    profile_path = args.profile or os.path.join(args.output, 'etl_profile.json')
+    
+    if args.dry_run:
+        engine.dry_run(args.sample_rows)
+        return
     
-    # 运行ETL
-    results = engine.run()
+    if args.incremental:
+        engine.export_delta(args.output, manifest_dir=args.manifest_dir, workers=args.workers,
+                            commit=args.commit_manifest)
+        engine.report_profile(profile_path)
+        print("\n增量ETL完成！")
+        if not args.commit_manifest:
+            print(f"清单待提交：加载成功后提交 (python etl_graph_loader.py --delta {args.output})")
+        return
     
-    # 保存结果
-    engine.save_to_json(results)
+    # 运行ETL并按 global_config.output 配置的格式边跑边写出
+    engine.export(args.output, stream=args.stream, batch_size=args.batch_size, workers=args.workers)
+    engine.report_profile(profile_path)
     
     print("\nETL流程完成！")
 
@@ -0,0 +1,482 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+图谱批量加载 - 将 ETLEngine 的输出直接批量写入 Apache AGE 的标签表
+
+不经过逐条 Cypher CREATE，而是：
+1. 按需创建点/边标签 (create_vlabel / create_elabel)
+2. 从标签序列批量预留 graphid，在客户端建立 实体主键 -> graphid 映射
+3. 用 COPY 分批写入点表与边表 (边的 target_id 通过上述映射解析)
+4. 加载完成后再建立属性索引
+
+用法:
+    python etl_graph_loader.py --config config/test.yaml          # 运行 ETL 后直接加载
+    python etl_graph_loader.py --input ./output --truncate         # 加载已导出的 json/jsonl/parquet
+    python etl_graph_loader.py --delta ./output                    # 应用增量 ETL 输出的 *.delta.jsonl
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple, Optional, Iterable
+
+import psycopg2
+import shapely
+from psycopg2.extras import execute_values
+
+# 可选依赖：读取 Parquet 输出需要 pyarrow
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import DB_CONFIG, GRAPH_NAME
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from etl_manifest import DELTA_SUFFIX, PENDING_SUFFIX, commit_pending, read_delta
+
+# 实体主键写入点属性中的键名 (用于增量更新和跨批次解析关系)
+KEY_PROPERTY = 'etl_key'
+
+# AGE graphid 布局：高 16 位为标签 id，低 48 位为标签序列值
+ENTRY_ID_BITS = 48
+
+
+def make_graphid(label_id: int, entry_id: int) -> int:
+    """按 AGE 的布局拼出 graphid"""
+    return (label_id << ENTRY_ID_BITS) | entry_id
+
+
+class AGEBulkLoader:
+    """AGE 标签表批量加载器"""
+
+    def __init__(self, conn, graph_name: str = GRAPH_NAME, batch_size: int = 10000):
+        """
+        Args:
+            conn: psycopg2 连接
+            graph_name: 图名称
+            batch_size: 每次 COPY 的行数
+        """
+        self.conn = conn
+        self.cursor = conn.cursor()
+        self.graph_name = graph_name
+        self.batch_size = batch_size
+        self.key_map: Dict[Tuple[str, str], int] = {}  # (实体类型, 实体主键) -> graphid
+        self.report: Dict[str, Dict] = {}  # 标签 -> 加载统计
+        self._labels: Dict[str, Tuple[int, str]] = {}  # 标签 -> (标签 id, 序列名)
+        self._loaded_key_labels = set()  # 已从数据库补全主键映射的标签
+
+    # ==================== 标签 ====================
+
+    def prepare(self):
+        """加载 AGE 并确保图存在"""
+        self.cursor.execute("LOAD 'age';")
+        self.cursor.execute("SET search_path = ag_catalog, '$user', public;")
+        self.cursor.execute("SELECT count(*) FROM ag_catalog.ag_graph WHERE name = %s", (self.graph_name,))
+        if self.cursor.fetchone()[0] == 0:
+            self.cursor.execute("SELECT ag_catalog.create_graph(%s::cstring)", (self.graph_name,))
+        self.conn.commit()
+
+    def _lookup_label(self, label: str) -> Optional[Tuple[int, str]]:
+        self.cursor.execute("""
+            SELECT l.id, l.seq_name
+            FROM ag_catalog.ag_label l
+            JOIN ag_catalog.ag_graph g ON l.graph = g.graphid
+            WHERE g.name = %s AND l.name = %s
+        """, (self.graph_name, label))
+        return self.cursor.fetchone()
+
+    def ensure_label(self, label: str, kind: str = 'v') -> Tuple[int, str]:
+        """
+        确保标签存在，返回 (标签 id, 序列名)
+
+        Args:
+            label: 标签名
+            kind: 'v' 点标签 / 'e' 边标签
+        """
+        if label in self._labels:
+            return self._labels[label]
+
+        found = self._lookup_label(label)
+        if found is None:
+            create_func = 'create_vlabel' if kind == 'v' else 'create_elabel'
+            self.cursor.execute(f"SELECT ag_catalog.{create_func}(%s::cstring, %s::cstring)",
+                                (self.graph_name, label))
+            self.conn.commit()
+            found = self._lookup_label(label)
+
+        self._labels[label] = (found[0], found[1])
+        return self._labels[label]
+
+    def _reserve_graphids(self, label: str, count: int) -> List[int]:
+        """从标签序列中一次性预留 count 个 graphid"""
+        label_id, seq_name = self._labels[label]
+        self.cursor.execute(
+            "SELECT nextval(%s) FROM generate_series(1, %s)",
+            (f'"{self.graph_name}"."{seq_name}"', count))
+        return [make_graphid(label_id, row[0]) for row in self.cursor.fetchall()]
+
+    def _table(self, label: str) -> str:
+        return f'"{self.graph_name}"."{label}"'
+
+    def _copy(self, label: str, columns: str, rows: Iterable[Tuple]):
+        """用 CSV 格式 COPY 写入标签表"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerows(rows)
+        buffer.seek(0)
+        self.cursor.copy_expert(f"COPY {self._table(label)} ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+    def _record(self, label: str, kind: str, rows: int, seconds: float):
+        item = self.report.setdefault(label, {'kind': kind, 'rows': 0, 'seconds': 0.0})
+        item['rows'] += rows
+        item['seconds'] += seconds
+
+    # ==================== 点 ====================
+
+    def load_vertices(self, entity_type: str, entities: List[Dict]):
+        """
+        分批 COPY 写入某一实体类型的点
+
+        Args:
+            entity_type: 实体类型 (即点标签)
+            entities: ETL 实体列表
+        """
+        if not entities:
+            return
+        self.ensure_label(entity_type, 'v')
+        start = time.perf_counter()
+
+        for offset in range(0, len(entities), self.batch_size):
+            batch = entities[offset:offset + self.batch_size]
+            graphids = self._reserve_graphids(entity_type, len(batch))
+            rows = []
+            for graphid, entity in zip(graphids, batch):
+                properties = dict(entity.get('attributes', {}))
+                properties[KEY_PROPERTY] = entity['id']
+                self.key_map[(entity_type, entity['id'])] = graphid
+                rows.append((graphid, json.dumps(properties, ensure_ascii=False)))
+            self._copy(entity_type, 'id, properties', rows)
+
+        self.conn.commit()
+        self._record(entity_type, 'vertex', len(entities), time.perf_counter() - start)
+
+    def _resolve_existing_keys(self, entity_type: str):
+        """目标点不在本次加载中时，从已有标签表补全主键映射 (每个标签只查一次)"""
+        if entity_type in self._loaded_key_labels:
+            return
+        self._loaded_key_labels.add(entity_type)
+        if self._lookup_label(entity_type) is None:
+            return
+        self.cursor.execute(
+            f"SELECT id::text::bigint, (properties::text::jsonb) ->> %s FROM {self._table(entity_type)}",
+            (KEY_PROPERTY,))
+        for graphid, key in self.cursor.fetchall():
+            if key is not None:
+                self.key_map.setdefault((entity_type, key), graphid)
+
+    # ==================== 边 ====================
+
+    def load_edges(self, entities: List[Dict]) -> int:
+        """
+        将实体的关系解析为边并按关系名分批 COPY 写入
+
+        Args:
+            entities: ETL 实体列表 (其点必须已加载)
+
+        Returns:
+            无法解析 target_id 而跳过的关系数
+        """
+        edges: Dict[str, List[Tuple[int, int]]] = {}
+        unresolved = 0
+        for entity in entities:
+            start_id = self.key_map.get((entity['type'], entity['id']))
+            if start_id is None:
+                continue
+            for rel in entity.get('relationships', []):
+                target_type = rel.get('target_type')
+                if (target_type, rel.get('target_id')) not in self.key_map:
+                    self._resolve_existing_keys(target_type)
+                end_id = self.key_map.get((target_type, rel.get('target_id')))
+                if end_id is None:
+                    unresolved += 1
+                    continue
+                edges.setdefault(rel['relation'], []).append((start_id, end_id))
+
+        for relation, pairs in edges.items():
+            self.ensure_label(relation, 'e')
+            start = time.perf_counter()
+            for offset in range(0, len(pairs), self.batch_size):
+                batch = pairs[offset:offset + self.batch_size]
+                graphids = self._reserve_graphids(relation, len(batch))
+                self._copy(relation, 'id, start_id, end_id, properties',
+                           ((graphid, s, e, '{}') for graphid, (s, e) in zip(graphids, batch)))
+            self.conn.commit()
+            self._record(relation, 'edge', len(pairs), time.perf_counter() - start)
+
+        return unresolved
+
+    # ==================== 索引 ====================
+
+    def create_indexes(self):
+        """加载完成后建立索引：点表属性 GIN + 主键表达式索引，边表起止点索引"""
+        for label, item in self.report.items():
+            table = self._table(label)
+            if item['kind'] == 'vertex':
+                self.cursor.execute(
+                    f'CREATE INDEX IF NOT EXISTS "idx_{label}_properties" ON {table} USING gin (properties)')
+                self.cursor.execute(
+                    f'CREATE INDEX IF NOT EXISTS "idx_{label}_{KEY_PROPERTY}" ON {table} '
+                    f"(ag_catalog.agtype_access_operator(VARIADIC ARRAY[properties, '\"{KEY_PROPERTY}\"'::agtype]))")
+            else:
+                self.cursor.execute(f'CREATE INDEX IF NOT EXISTS "idx_{label}_start_id" ON {table} (start_id)')
+                self.cursor.execute(f'CREATE INDEX IF NOT EXISTS "idx_{label}_end_id" ON {table} (end_id)')
+        self.conn.commit()
+
+    def truncate(self, labels: Iterable[str]):
+        """清空已存在的标签表 (全量重载前使用)"""
+        for label in labels:
+            if self._lookup_label(label) is not None:
+                self.cursor.execute(f"TRUNCATE {self._table(label)}")
+        self.conn.commit()
+
+    # ==================== 入口 ====================
+
+    def load(self, results: Dict[str, Dict], truncate: bool = False) -> Dict[str, Dict]:
+        """
+        加载 ETLEngine.run() 的结果：先写入全部点，再写入边，最后建索引
+
+        Args:
+            results: 映射名 -> {'entity_type', 'entities'}
+            truncate: 加载前是否清空涉及的标签表
+
+        Returns:
+            标签 -> {'kind', 'rows', 'seconds', 'rows_per_sec'}
+        """
+        self.prepare()
+        if truncate:
+            labels = {data['entity_type'] for data in results.values()}
+            labels |= {rel['relation'] for data in results.values()
+                       for entity in data['entities'] for rel in entity.get('relationships', [])}
+            self.truncate(labels)
+
+        for mapping_name, data in results.items():
+            print(f"正在加载点: {mapping_name} -> :{data['entity_type']} ({len(data['entities'])} 个)")
+            self.load_vertices(data['entity_type'], data['entities'])
+
+        for mapping_name, data in results.items():
+            unresolved = self.load_edges(data['entities'])
+            if unresolved:
+                print(f"⚠️ {mapping_name}: {unresolved} 条关系的目标不存在，已跳过")
+
+        start = time.perf_counter()
+        self.create_indexes()
+        print(f"索引建立完成，耗时 {time.perf_counter() - start:.2f}s")
+
+        for item in self.report.values():
+            item['rows_per_sec'] = item['rows'] / max(item['seconds'], 1e-9)
+        self.print_report()
+        return self.report
+
+    # ==================== 增量 ====================
+
+    def _existing_ids(self, entity_type: str, keys: Iterable[str]) -> List[int]:
+        """按主键取已有点的 graphid (库中不存在的主键忽略)"""
+        self._resolve_existing_keys(entity_type)
+        return [self.key_map[(entity_type, key)] for key in keys if (entity_type, key) in self.key_map]
+
+    def _delete_edges(self, graphids: List[int], incoming: bool):
+        """删除以这些点为起点 (incoming=True 时也包括终点) 的边，通过边标签父表覆盖所有关系"""
+        if not graphids:
+            return
+        condition = "start_id::text::bigint = ANY(%s)"
+        params = (graphids,)
+        if incoming:
+            condition += " OR end_id::text::bigint = ANY(%s)"
+            params = (graphids, graphids)
+        self.cursor.execute(f'DELETE FROM "{self.graph_name}"._ag_label_edge WHERE {condition}', params)
+
+    def apply_delta(self, deltas: Dict[str, Dict]) -> Dict[str, Dict]:
+        """
+        应用增量 ETL 的变更集：删除点及其边，原地更新点属性并重建出边，写入新增的点和边
+
+        Args:
+            deltas: 映射名 -> MappingManifest.diff() 结构的变更集
+
+        Returns:
+            映射名 -> {'inserted', 'updated', 'deleted', 'unresolved'}
+        """
+        self.prepare()
+        summary = {}
+        changed: Dict[str, List[Dict]] = {}
+
+        for mapping_name, delta in deltas.items():
+            entity_type = delta['entity_type']
+            if entity_type is None:
+                continue
+            start = time.perf_counter()
+            deleted_ids = self._existing_ids(entity_type, delta['deleted'])
+            self._delete_edges(deleted_ids, incoming=True)
+            if deleted_ids:
+                self.cursor.execute(
+                    f"DELETE FROM {self._table(entity_type)} WHERE id::text::bigint = ANY(%s)", (deleted_ids,))
+            for key in delta['deleted']:
+                self.key_map.pop((entity_type, key), None)
+
+            # 更新：graphid 不变，其他映射指向它的入边保留，只重建本实体的出边；库中没有的按新增处理
+            inserted = list(delta['inserted'])
+            updated = []
+            updates = []
+            for entity in delta['updated']:
+                graphid = self.key_map.get((entity_type, entity['id']))
+                if graphid is None:
+                    inserted.append(entity)
+                    continue
+                properties = dict(entity.get('attributes', {}))
+                properties[KEY_PROPERTY] = entity['id']
+                updated.append(entity)
+                updates.append((graphid, json.dumps(properties, ensure_ascii=False)))
+            self._delete_edges([graphid for graphid, _ in updates], incoming=False)
+            for offset in range(0, len(updates), self.batch_size):
+                execute_values(
+                    self.cursor,
+                    f"UPDATE {self._table(entity_type)} AS t SET properties = v.properties::agtype "
+                    f"FROM (VALUES %s) AS v(id, properties) WHERE t.id::text::bigint = v.id",
+                    updates[offset:offset + self.batch_size])
+            self.conn.commit()
+            self._record(entity_type, 'vertex', len(updates) + len(deleted_ids), time.perf_counter() - start)
+
+            print(f"正在应用增量: {mapping_name} -> :{entity_type} "
+                  f"(新增 {len(inserted)}，更新 {len(updated)}，删除 {len(deleted_ids)})")
+            self.load_vertices(entity_type, inserted)
+            changed[mapping_name] = updated + inserted
+            summary[mapping_name] = {'inserted': len(inserted), 'updated': len(updated),
+                                     'deleted': len(deleted_ids), 'unresolved': 0}
+
+        # 所有点就位后再写边，跨映射的关系才能解析
+        for mapping_name, entities in changed.items():
+            summary[mapping_name]['unresolved'] = self.load_edges(entities)
+
+        for item in self.report.values():
+            item['rows_per_sec'] = item['rows'] / max(item['seconds'], 1e-9)
+        self.print_report()
+        return summary
+
+    def print_report(self):
+        """打印每个标签的加载吞吐"""
+        print("\n标签加载统计:")
+        for label, item in self.report.items():
+            print(f"  [{item['kind']:<6}] {label:<16} {item['rows']:>10} 行 "
+                  f"{item['seconds']:8.2f}s  {item.get('rows_per_sec', 0):12.0f} 行/秒")
+
+
+def read_parquet_entities(path: Path) -> List[Dict]:
+    """
+    读取 ParquetSink 写出的文件并还原为实体
+
+    id / type / relationships 以外的列还原为 attributes，
+    GeoParquet 元数据中的几何列由 WKB 转回 WKT (与 json 输出一致)。
+
+    Args:
+        path: Parquet 文件路径
+
+    Returns:
+        实体列表
+    """
+    if pq is None:
+        raise ImportError("读取 Parquet 输出需要安装 pyarrow")
+    table = pq.read_table(path)
+    geo = json.loads((table.schema.metadata or {}).get(b'geo', b'{}'))
+    rows = table.to_pylist()
+    for name in geo.get('columns', {}):
+        if name not in table.column_names:
+            continue
+        wkts = shapely.to_wkt(shapely.from_wkb([row[name] for row in rows]), rounding_precision=-1)
+        for row, wkt in zip(rows, wkts.tolist()):
+            row[name] = wkt
+    entities = []
+    for row in rows:
+        entity = {'id': row.pop('id'), 'type': row.pop('type')}
+        relationships = row.pop('relationships', None) or []
+        entity['attributes'] = row
+        entity['relationships'] = relationships
+        entities.append(entity)
+    return entities
+
+
+def read_results(input_dir: str) -> Dict[str, Dict]:
+    """
+    读取 ETLEngine 导出的 json / jsonl / parquet 文件
+
+    Args:
+        input_dir: 输出目录
+
+    Returns:
+        与 ETLEngine.run() 相同结构的结果字典
+
+    Raises:
+        ValueError: 目录中有无法识别格式的文件
+    """
+    results = {}
+    for path in sorted(Path(input_dir).iterdir()):
+        # 增量输出、待提交清单，以及 ParquetSink 的临时分片等隐藏文件
+        if path.name.endswith((DELTA_SUFFIX, PENDING_SUFFIX)) or path.name.startswith('.') or path.is_dir():
+            continue
+        if path.suffix == '.json':
+            with open(path, encoding='utf-8') as f:
+                results[path.stem] = json.load(f)
+        elif path.suffix == '.jsonl':
+            with open(path, encoding='utf-8') as f:
+                entities = [json.loads(line) for line in f if line.strip()]
+            entity_type = entities[0]['type'] if entities else None
+            results[path.stem] = {'mapping_name': path.stem, 'entity_type': entity_type, 'entities': entities}
+        elif path.suffix == '.parquet':
+            entities = read_parquet_entities(path)
+            entity_type = entities[0]['type'] if entities else None
+            results[path.stem] = {'mapping_name': path.stem, 'entity_type': entity_type, 'entities': entities}
+        else:
+            raise ValueError(f"无法识别的输出文件: {path.name}，支持 json / jsonl / parquet")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='将 ETL 输出批量加载到 AGE 图谱')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--config', help='运行 ETLEngine 的 YAML 配置并直接加载')
+    source.add_argument('--input', help='已导出的 json/jsonl/parquet 目录')
+    source.add_argument('--delta', help='增量 ETL 输出的 *.delta.jsonl 目录')
+    parser.add_argument('--graph', default=GRAPH_NAME, help='目标图名称')
+    parser.add_argument('--batch-size', type=int, default=10000, help='每次 COPY 的行数')
+    parser.add_argument('--truncate', action='store_true', help='加载前清空涉及的标签表')
+    args = parser.parse_args()
+
+    if args.config:
+        from etl_engine import ETLEngine
+        results = ETLEngine(args.config).run()
+    elif args.input:
+        results = read_results(args.input)
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        loader = AGEBulkLoader(conn, args.graph, args.batch_size)
+        if args.delta:
+            paths = sorted(Path(args.delta).glob(f'*{DELTA_SUFFIX}'))
+            deltas = {path.name[:-len(DELTA_SUFFIX)]: read_delta(path) for path in paths}
+            loader.apply_delta(deltas)
+            # 加载成功后才提交增量 ETL 的清单，失败时下次运行仍会输出这些变更
+            committed = sum(commit_pending(path) for path in paths)
+            print(f"已提交 {committed} 个映射的清单")
+        else:
+            loader.load(results, truncate=args.truncate)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
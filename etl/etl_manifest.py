@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+增量变更检测 - 为每个映射保存 实体主键 -> 内容哈希 的清单 (manifest)
+
+重跑 ETL 时与上次的清单比对，只输出新增 / 更新 / 删除的实体 (delta)，
+下游 (图谱加载、向量化) 只需处理变化的部分。
+
+delta 以 JSON Lines 写出，每行一条变更:
+    {"op": "insert", "entity": {...}}
+    {"op": "update", "entity": {...}}
+    {"op": "delete", "id": "...", "type": "..."}
+
+新清单先作为待提交清单 (<映射名>.manifest.pending.json) 写在 delta 旁边，
+下游成功消费 delta 后再调用 commit_pending() 替换正式清单；下游失败时清单不变，下次运行仍会输出这些变更。
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+DELTA_SUFFIX = '.delta.jsonl'
+PENDING_SUFFIX = '.manifest.pending.json'
+
+
+def entity_hash(entity: Dict) -> str:
+    """
+    计算实体内容 (属性 + 关系) 的哈希，关系顺序不影响结果
+
+    Args:
+        entity: ETL 实体
+
+    Returns:
+        md5 十六进制字符串
+    """
+    relationships = sorted(entity.get('relationships', []),
+                           key=lambda r: (str(r.get('relation')), str(r.get('target_type')),
+                                          str(r.get('target_id'))))
+    payload = json.dumps({'attributes': entity.get('attributes', {}), 'relationships': relationships},
+                         ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.md5(payload.encode('utf-8')).hexdigest()
+
+
+class MappingManifest:
+    """单个映射的清单：上次运行时每个实体主键对应的内容哈希"""
+
+    def __init__(self, manifest_dir: str, mapping_name: str):
+        """
+        Args:
+            manifest_dir: 清单目录
+            mapping_name: 映射名称
+        """
+        self.path = Path(manifest_dir) / f"{mapping_name}.manifest.json"
+        self.mapping_name = mapping_name
+        self.previous = self._load()
+        self._pending: Optional[Dict[str, str]] = None
+
+    def _load(self) -> Dict[str, str]:
+        if not self.path.exists():
+            return {}
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def diff(self, entity_type: str, entities: List[Dict]) -> Dict:
+        """
+        与上次清单比对，得到变更集；调用 commit() 前清单不会更新
+
+        Args:
+            entity_type: 实体类型
+            entities: 本次运行的全部实体
+
+        Returns:
+            {'mapping_name', 'entity_type', 'inserted', 'updated', 'deleted', 'unchanged'}
+        """
+        current = {}
+        inserted = []
+        updated = []
+        for entity in entities:
+            digest = entity_hash(entity)
+            current[entity['id']] = digest
+            previous = self.previous.get(entity['id'])
+            if previous is None:
+                inserted.append(entity)
+            elif previous != digest:
+                updated.append(entity)
+
+        deleted = [key for key in self.previous if key not in current]
+        self._pending = current
+        return {
+            'mapping_name': self.mapping_name,
+            'entity_type': entity_type,
+            'inserted': inserted,
+            'updated': updated,
+            'deleted': deleted,
+            'unchanged': len(current) - len(inserted) - len(updated)
+        }
+
+    def commit(self):
+        """下游成功消费 delta 后写入新清单"""
+        if self._pending is None:
+            return
+        _write_json(self.path, self._pending)
+        self.previous = self._pending
+        self._pending = None
+
+    def save_pending(self, output_dir: str) -> Optional[Path]:
+        """
+        把待提交的清单写在 delta 旁边，由下游消费 delta 成功后调用 commit_pending() 提交
+
+        Args:
+            output_dir: delta 输出目录
+
+        Returns:
+            待提交清单的路径 (未比对时为 None)
+        """
+        if self._pending is None:
+            return None
+        path = Path(output_dir) / f"{self.mapping_name}{PENDING_SUFFIX}"
+        _write_json(path, {'manifest': str(self.path.resolve()), 'hashes': self._pending})
+        return path
+
+
+def _write_json(path: Path, data: Dict):
+    """先写临时文件再替换，避免中断时损坏"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def commit_pending(delta_path: str) -> bool:
+    """
+    提交 delta 旁边的待提交清单 (下游成功消费该 delta 后调用)
+
+    Args:
+        delta_path: delta 文件路径
+
+    Returns:
+        是否提交了清单 (没有待提交清单时为 False)
+    """
+    delta_path = Path(delta_path)
+    pending_path = delta_path.with_name(delta_path.name[:-len(DELTA_SUFFIX)] + PENDING_SUFFIX)
+    if not pending_path.exists():
+        return False
+    with open(pending_path, 'r', encoding='utf-8') as f:
+        pending = json.load(f)
+    _write_json(Path(pending['manifest']), pending['hashes'])
+    pending_path.unlink()
+    return True
+
+
+def write_delta(delta: Dict, output_dir: str) -> Path:
+    """
+    将变更集写为 JSON Lines delta 流
+
+    Args:
+        delta: MappingManifest.diff() 的结果
+        output_dir: 输出目录
+
+    Returns:
+        delta 文件路径
+    """
+    output_path = Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+    path = output_path / f"{delta['mapping_name']}{DELTA_SUFFIX}"
+    with open(path, 'w', encoding='utf-8') as f:
+        for op, key in (('insert', 'inserted'), ('update', 'updated')):
+            for entity in delta[key]:
+                f.write(json.dumps({'op': op, 'entity': entity}, ensure_ascii=False) + '\n')
+        for entity_id in delta['deleted']:
+            f.write(json.dumps({'op': 'delete', 'id': entity_id, 'type': delta['entity_type']},
+                               ensure_ascii=False) + '\n')
+    return path
+
+
+def read_delta(path: str) -> Dict:
+    """
+    读取 write_delta 写出的 delta 流
+
+    Args:
+        path: delta 文件路径
+
+    Returns:
+        与 MappingManifest.diff() 相同结构的变更集
+    """
+    path = Path(path)
+    delta = {'mapping_name': path.name[:-len(DELTA_SUFFIX)], 'entity_type': None,
+             'inserted': [], 'updated': [], 'deleted': [], 'unchanged': None}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if item['op'] == 'delete':
+                delta['deleted'].append(item['id'])
+                delta['entity_type'] = item['type']
+            else:
+                delta['inserted' if item['op'] == 'insert' else 'updated'].append(item['entity'])
+                delta['entity_type'] = item['entity']['type']
+    return delta
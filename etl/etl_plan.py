@@ -0,0 +1,379 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+映射计划 - 将 YAML 映射配置一次性编译为不可变的执行计划
+
+编译时检查未知配置项、非法取值和缺失的必填项 (一次性列出全部问题)，
+执行时引擎只读取计划中已解析好的字段，不再反复 .get() 配置字典、按字符串分支。
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from etl_transforms import TRANSFORMS, transform_inputs
+
+GEOMETRY_COLUMN = 'geometry'
+
+# 几何属性的输出编码：wkt 文本 / wkb 十六进制字符串
+GEOMETRY_DTYPES = ('wkt', 'wkb')
+
+# 空间关系的匹配方式
+SPATIAL_PREDICATES = ('within', 'intersects', 'nearest')
+
+DTYPES = (None, 'float', 'int') + GEOMETRY_DTYPES
+KEY_METHODS = ('direct', 'md5')
+DEDUP_POLICIES = (None, 'merge_relation')
+
+# 各层级允许的配置项
+MAPPING_KEYS = {'source_layer', 'entity_type', 'key_rule', 'attributes', 'relationships'}
+KEY_RULE_KEYS = {'field', 'fields', 'prefix', 'method', 'deduplication_policy'}
+ATTRIBUTE_KEYS = {'target', 'source', 'dtype', 'default', 'transform_func', 'params', 'type', 'children',
+                  'precision', 'simplify', 'preserve_topology'}
+CHILD_KEYS = {'target', 'source', 'default', 'transform_func', 'params', 'subsets'}
+SUBSET_KEYS = {'target', 'source', 'default'}
+RELATIONSHIP_KEYS = {'relation', 'target_type', 'foreign_key_field', 'target_key_prefix', 'dynamic_relation',
+                     'spatial', 'target_layer', 'target_key_field', 'max_distance', 'fallback'}
+DYNAMIC_RELATION_KEYS = {'source_column', 'rules'}
+RULE_KEYS = {'match_value', 'relation_name'}
+
+
+class MappingConfigError(ValueError):
+    """映射配置不合法，errors 中为全部问题"""
+
+    def __init__(self, errors: List[str]):
+        self.errors = errors
+        super().__init__("映射配置有误:\n" + "\n".join(f"  - {e}" for e in errors))
+
+
+@dataclass(frozen=True)
+class KeyPlan:
+    """主键规则"""
+    method: str = 'direct'
+    field: str = ''
+    fields: Tuple[str, ...] = ()
+    prefix: str = ''
+    dedup_policy: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class GeometryEncoding:
+    """几何属性的编码选项"""
+    dtype: str = 'wkt'
+    precision: Optional[int] = None
+    simplify: Optional[float] = None
+    preserve_topology: bool = True
+    binary: bool = False  # 输出二进制 WKB (导出为 Parquet 时由引擎设置，输出端无需从文本重新解析)
+
+
+@dataclass(frozen=True)
+class AttributePlan:
+    """
+    属性计划
+
+    kind:
+        column   : 取 source 列并按 dtype 转换
+        transform: 调用注册的转换 transform(params)，columns 为其读取的字段
+        nested   : 复合对象，children 为展开后的子属性 (子级后紧跟其 subsets)
+        constant : 没有来源，取 default
+    """
+    target: str
+    kind: str
+    source: Optional[str] = None
+    dtype: Optional[str] = None
+    default: Any = None
+    columns: Tuple[str, ...] = ()
+    transform: Optional[str] = None
+    params: Optional[Dict] = None
+    children: Tuple['AttributePlan', ...] = ()
+    geometry: Optional[GeometryEncoding] = None
+
+
+@dataclass(frozen=True)
+class SpatialPlan:
+    """空间关系：按几何关系在目标图层中查找目标"""
+    predicate: str
+    target_layer: str
+    target_key_field: str
+    target_key_prefix: str = ''
+    max_distance: Optional[float] = None
+    fallback: bool = False
+
+
+@dataclass(frozen=True)
+class RelationshipPlan:
+    """
+    关系计划
+
+    rules 非空时为动态关系：按顺序匹配 rule_source 列的值 ('otherwise' 为兜底) 选定关系名；
+    spatial 非空时为空间关系，否则按 foreign_key_field 关联。
+    """
+    target_type: str
+    relation: Optional[str] = None
+    foreign_key_field: Optional[str] = None
+    target_key_prefix: str = ''
+    rule_source: Optional[str] = None
+    rules: Tuple[Tuple[Any, str], ...] = ()
+    spatial: Optional[SpatialPlan] = None
+
+
+@dataclass(frozen=True)
+class MappingPlan:
+    """单个映射的执行计划"""
+    name: str
+    source_layer: str
+    entity_type: str
+    key: KeyPlan
+    attributes: Tuple[AttributePlan, ...]
+    relationships: Tuple[RelationshipPlan, ...]
+    columns: Tuple[str, ...]  # 需要从源图层读取的字段 (不含几何)
+    needs_geometry: bool
+    config: Dict = field(default=None, compare=False, repr=False)  # 原始配置 (逐行对比模式使用)
+
+    @property
+    def target_layers(self) -> Tuple[str, ...]:
+        """空间关系依赖的目标图层"""
+        layers = []
+        for rel in self.relationships:
+            if rel.spatial and rel.spatial.target_layer not in layers:
+                layers.append(rel.spatial.target_layer)
+        return tuple(layers)
+
+
+# ==================== 编译 ====================
+
+def _check_keys(config: Any, allowed: set, where: str, errors: List[str]) -> bool:
+    if not isinstance(config, dict):
+        errors.append(f"{where}: 应为字典，实际为 {type(config).__name__}")
+        return False
+    for key in config:
+        if key not in allowed:
+            errors.append(f"{where}: 未知配置项 '{key}'")
+    return True
+
+
+def _check_choice(value: Any, choices: Tuple, what: str, where: str, errors: List[str]):
+    if value not in choices:
+        options = ', '.join(str(c) for c in choices if c is not None)
+        errors.append(f"{where}: 未知的 {what} '{value}'，可选: {options}")
+
+
+def compile_geometry(config: Dict) -> GeometryEncoding:
+    """从属性配置中取几何编码选项"""
+    return GeometryEncoding(dtype=config.get('dtype', 'wkt'), precision=config.get('precision'),
+                            simplify=config.get('simplify'),
+                            preserve_topology=config.get('preserve_topology', True))
+
+
+def compile_spatial(config: Dict) -> SpatialPlan:
+    """从关系配置中取空间关系选项"""
+    return SpatialPlan(predicate=config.get('spatial'), target_layer=config.get('target_layer'),
+                       target_key_field=config.get('target_key_field'),
+                       target_key_prefix=config.get('target_key_prefix', ''),
+                       max_distance=config.get('max_distance'), fallback=bool(config.get('fallback', False)))
+
+
+def compile_key_rule(config: Dict, where: str = 'key_rule',
+                     errors: Optional[List[str]] = None) -> KeyPlan:
+    """
+    编译主键规则
+
+    Args:
+        config: key_rule 配置
+        where: 出错时的位置描述
+        errors: 收集问题的列表 (为 None 时有问题直接抛出 MappingConfigError)
+    """
+    raise_now = errors is None
+    errors = [] if errors is None else errors
+    if not _check_keys(config, KEY_RULE_KEYS, where, errors):
+        config = {}
+
+    method = config.get('method', 'direct')
+    _check_choice(method, KEY_METHODS, '主键方法', where, errors)
+    _check_choice(config.get('deduplication_policy'), DEDUP_POLICIES, '去重策略', where, errors)
+    if method == 'md5' and not config.get('fields'):
+        errors.append(f"{where}: md5 主键需要 fields")
+    if method == 'direct' and not config.get('field'):
+        errors.append(f"{where}: direct 主键需要 field")
+
+    if raise_now and errors:
+        raise MappingConfigError(errors)
+    return KeyPlan(method=method, field=config.get('field', ''), fields=tuple(config.get('fields', [])),
+                   prefix=config.get('prefix', ''), dedup_policy=config.get('deduplication_policy'))
+
+
+def _compile_transform(config: Dict, target: str, where: str, errors: List[str]) -> AttributePlan:
+    name = config.get('transform_func')
+    params = config.get('params') or {}
+    if name not in TRANSFORMS:
+        errors.append(f"{where}: 未注册的 transform_func '{name}'，可选: {', '.join(sorted(TRANSFORMS))}")
+        return AttributePlan(target=target, kind='constant', default=config.get('default'))
+    missing = [key for key in TRANSFORMS[name].required if params.get(key) in (None, '', [], {})]
+    if missing:
+        errors.append(f"{where}: {name} 需要 params.{', params.'.join(missing)}")
+        return AttributePlan(target=target, kind='constant', default=config.get('default'))
+    validate = TRANSFORMS[name].validate
+    problems = validate(params) if validate else []
+    if problems:
+        errors.extend(f"{where}: {name} {problem}" for problem in problems)
+        return AttributePlan(target=target, kind='constant', default=config.get('default'))
+    return AttributePlan(target=target, kind='transform', transform=name, params=params,
+                         columns=tuple(transform_inputs(name, params)))
+
+
+def _compile_attribute(config: Dict, where: str, errors: List[str]) -> Optional[AttributePlan]:
+    if not _check_keys(config, ATTRIBUTE_KEYS, where, errors):
+        return None
+    target = config.get('target')
+    if not target:
+        errors.append(f"{where}: 缺少 target")
+
+    if config.get('type') == 'nested':
+        children = []
+        for i, child in enumerate(config.get('children', [])):
+            child_where = f"{where}.children[{i}]"
+            if not _check_keys(child, CHILD_KEYS, child_where, errors):
+                continue
+            # 子级与原实现一致：只取原值，不做 dtype 转换
+            if child.get('transform_func'):
+                children.append(_compile_transform(child, child.get('target'), child_where, errors))
+            elif child.get('source'):
+                children.append(AttributePlan(target=child.get('target'), kind='column',
+                                              source=child['source'], default=child.get('default')))
+            else:
+                children.append(AttributePlan(target=child.get('target'), kind='constant',
+                                              default=child.get('default')))
+            for j, subset in enumerate(child.get('subsets', [])):
+                subset_where = f"{child_where}.subsets[{j}]"
+                if not _check_keys(subset, SUBSET_KEYS, subset_where, errors):
+                    continue
+                kind = 'column' if subset.get('source') else 'constant'
+                children.append(AttributePlan(target=subset.get('target'), kind=kind,
+                                              source=subset.get('source'), default=subset.get('default')))
+        return AttributePlan(target=target, kind='nested', children=tuple(children))
+
+    if config.get('type') is not None:
+        errors.append(f"{where}: 未知的属性类型 '{config.get('type')}'，可选: nested")
+    if config.get('transform_func'):
+        return _compile_transform(config, target, where, errors)
+
+    dtype = config.get('dtype')
+    _check_choice(dtype, DTYPES, 'dtype', where, errors)
+    if not config.get('source'):
+        return AttributePlan(target=target, kind='constant', default=config.get('default'))
+    geometry = compile_geometry(config) if dtype in GEOMETRY_DTYPES else None
+    return AttributePlan(target=target, kind='column', source=config['source'], dtype=dtype,
+                         default=config.get('default'), geometry=geometry)
+
+
+def _compile_relationship(config: Dict, where: str, errors: List[str]) -> Optional[RelationshipPlan]:
+    if not _check_keys(config, RELATIONSHIP_KEYS, where, errors):
+        return None
+    if not config.get('target_type'):
+        errors.append(f"{where}: 缺少 target_type")
+
+    if config.get('spatial'):
+        spatial = compile_spatial(config)
+        _check_choice(spatial.predicate, SPATIAL_PREDICATES, '空间关系', where, errors)
+        if not spatial.target_layer or not spatial.target_key_field:
+            errors.append(f"{where}: 空间关系需要 target_layer 与 target_key_field")
+        if not config.get('relation'):
+            errors.append(f"{where}: 缺少 relation")
+        return RelationshipPlan(target_type=config.get('target_type'), relation=config.get('relation'),
+                                target_key_prefix=spatial.target_key_prefix, spatial=spatial)
+
+    if not config.get('foreign_key_field'):
+        errors.append(f"{where}: 缺少 foreign_key_field (或 spatial)")
+    rule_source = None
+    rules = []
+    dynamic = config.get('dynamic_relation')
+    if dynamic is not None and _check_keys(dynamic, DYNAMIC_RELATION_KEYS, f"{where}.dynamic_relation", errors):
+        rule_source = dynamic.get('source_column')
+        for i, rule in enumerate(dynamic.get('rules', [])):
+            if _check_keys(rule, RULE_KEYS, f"{where}.dynamic_relation.rules[{i}]", errors):
+                rules.append((rule.get('match_value'), rule.get('relation_name')))
+        if not rules:
+            errors.append(f"{where}: dynamic_relation 至少需要一条规则")
+    elif not config.get('relation'):
+        errors.append(f"{where}: 缺少 relation (或 dynamic_relation)")
+
+    return RelationshipPlan(target_type=config.get('target_type'), relation=config.get('relation'),
+                            foreign_key_field=config.get('foreign_key_field'),
+                            target_key_prefix=config.get('target_key_prefix', ''),
+                            rule_source=rule_source, rules=tuple(rules))
+
+
+def _collect_columns(key: KeyPlan, attributes: Tuple[AttributePlan, ...],
+                     relationships: Tuple[RelationshipPlan, ...]) -> Tuple[Tuple[str, ...], bool]:
+    columns = set(key.fields)
+    columns.add(key.field)
+    needs_geometry = False
+
+    def collect(attr: AttributePlan):
+        nonlocal needs_geometry
+        if attr.geometry is not None or GEOMETRY_COLUMN in (attr.source,) + attr.columns:
+            needs_geometry = True
+        columns.add(attr.source)
+        columns.update(attr.columns)
+        for child in attr.children:
+            collect(child)
+
+    for attr in attributes:
+        collect(attr)
+    for rel in relationships:
+        columns.add(rel.foreign_key_field)
+        columns.add(rel.rule_source)
+        if rel.spatial:
+            needs_geometry = True
+
+    columns -= {None, '', GEOMETRY_COLUMN}
+    return tuple(sorted(columns)), needs_geometry
+
+
+def compile_mapping(name: str, config: Dict) -> MappingPlan:
+    """
+    编译单个映射
+
+    Args:
+        name: 映射名称
+        config: 映射配置
+
+    Returns:
+        映射计划
+
+    Raises:
+        MappingConfigError: 配置有误 (包含该映射的全部问题)
+    """
+    errors: List[str] = []
+    _check_keys(config, MAPPING_KEYS, name, errors)
+    for required in ('source_layer', 'entity_type', 'key_rule'):
+        if not config.get(required):
+            errors.append(f"{name}: 缺少 {required}")
+
+    key = compile_key_rule(config.get('key_rule') or {}, f"{name}.key_rule", errors)
+    attributes = tuple(a for a in (_compile_attribute(attr, f"{name}.attributes[{i}]", errors)
+                                   for i, attr in enumerate(config.get('attributes', []))) if a is not None)
+    relationships = tuple(r for r in (_compile_relationship(rel, f"{name}.relationships[{i}]", errors)
+                                      for i, rel in enumerate(config.get('relationships', []))) if r is not None)
+    if errors:
+        raise MappingConfigError(errors)
+
+    columns, needs_geometry = _collect_columns(key, attributes, relationships)
+    return MappingPlan(name=name, source_layer=config['source_layer'], entity_type=config['entity_type'],
+                       key=key, attributes=attributes, relationships=relationships,
+                       columns=columns, needs_geometry=needs_geometry, config=config)
+
+
+def check_columns(plan: MappingPlan, fields: List[str]) -> List[str]:
+    """
+    检查计划引用的字段是否存在于源图层
+
+    Args:
+        plan: 映射计划
+        fields: 源图层的实际字段
+
+    Returns:
+        问题描述列表 (缺失的字段在执行时按 None / default 处理)
+    """
+    fields = set(fields)
+    return [f"{plan.name}: 图层 {plan.source_layer} 中没有字段 '{column}'"
+            for column in plan.columns if column not in fields]
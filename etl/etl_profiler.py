@@ -0,0 +1,333 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+ETL 分阶段性能统计 - 记录每个映射各阶段的耗时、行数、吞吐与峰值内存
+
+阶段:
+    read          : 读取图层 (同一图层被多个映射共用时记在首个映射下)
+    keys          : 生成主键
+    attributes    : 属性映射
+    relationships : 关系映射 (含空间索引构建)
+    transform     : 逐行模式下的整体映射 (主键/属性/关系交织执行，无法拆分)
+    merge         : 按去重策略合并实体
+    write         : 写出结果
+
+墙钟时间与行数始终记录 (开销可忽略)；峰值内存使用 tracemalloc，会明显拖慢运行，需显式开启。
+可选的采样分析钩子在每个阶段外层调用，例如 PyinstrumentHook 为每个 (映射, 阶段) 输出调用栈报告。
+
+比较两次运行的报告:
+    python etl_profiler.py old_profile.json new_profile.json --threshold 0.2
+"""
+
+import argparse
+import json
+import os
+import time
+import tracemalloc
+import unicodedata
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Optional, Tuple
+
+# 可选依赖：pyinstrument 提供采样分析
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+STAGES = ('read', 'keys', 'attributes', 'relationships', 'transform', 'merge', 'write')
+
+# 钩子签名: hook(映射名, 阶段名) -> 上下文管理器
+ProfilerHook = Callable[[str, str], ContextManager]
+
+
+@dataclass
+class StageStats:
+    """单个 (映射, 阶段) 的累计统计 (流式模式下同一阶段按批次多次累加)"""
+    seconds: float = 0.0
+    rows: int = 0
+    calls: int = 0
+    peak_bytes: Optional[int] = None  # 阶段内相对开始时的内存增量峰值，未开启内存统计时为 None
+
+    def add(self, seconds: float, rows: int, peak_bytes: Optional[int] = None):
+        self.seconds += seconds
+        self.rows += rows
+        self.calls += 1
+        if peak_bytes is not None:
+            self.peak_bytes = max(self.peak_bytes or 0, peak_bytes)
+
+    def merge(self, other: 'StageStats'):
+        self.seconds += other.seconds
+        self.rows += other.rows
+        self.calls += other.calls
+        if other.peak_bytes is not None:
+            self.peak_bytes = max(self.peak_bytes or 0, other.peak_bytes)
+
+
+class StageTimer:
+    """阶段上下文中产出的对象，在阶段内设置处理的行数"""
+
+    def __init__(self, rows: int = 0):
+        self.rows = rows
+
+
+def _rate(rows: int, seconds: float) -> Optional[float]:
+    return round(rows / seconds, 1) if seconds > 0 else None
+
+
+def _mb(peak_bytes: Optional[int]) -> Optional[float]:
+    return None if peak_bytes is None else round(peak_bytes / 1024 / 1024, 2)
+
+
+class StageProfiler:
+    """按 (映射, 阶段) 累计性能统计"""
+
+    def __init__(self, trace_memory: bool = False, hook: Optional[ProfilerHook] = None):
+        """
+        Args:
+            trace_memory: 是否用 tracemalloc 统计各阶段峰值内存
+            hook: 可选的采样分析钩子 hook(映射名, 阶段名) -> 上下文管理器
+        """
+        self.trace_memory = trace_memory
+        self.hook = hook
+        self.stats: Dict[Tuple[str, str], StageStats] = {}
+        self.mode: Optional[str] = None
+        self.started_at: Optional[str] = None
+        self._start: Optional[float] = None
+        self._elapsed: Optional[float] = None
+        self._peak_bytes: Optional[int] = None
+        self._owns_tracing = False
+
+    def reset(self, mode: str):
+        """开始一次新的运行，清空已有统计"""
+        self.stats = {}
+        self.mode = mode
+        self.started_at = datetime.now().isoformat(timespec='seconds')
+        self._start = time.perf_counter()
+        self._elapsed = None
+        self._peak_bytes = None
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._owns_tracing = True
+
+    def finish(self):
+        """结束本次运行，记录总耗时并停止由本对象开启的内存追踪"""
+        if self._start is not None:
+            self._elapsed = time.perf_counter() - self._start
+        if self._owns_tracing:
+            tracemalloc.stop()
+            self._owns_tracing = False
+
+    @contextmanager
+    def stage(self, mapping: str, stage: str, rows: int = 0) -> Iterator[StageTimer]:
+        """
+        统计一个阶段，阶段内可通过产出对象的 rows 设置处理行数
+
+        Args:
+            mapping: 映射名
+            stage: 阶段名 (见 STAGES)
+            rows: 处理行数 (事先已知时)
+        """
+        timer = StageTimer(rows)
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        with ExitStack() as stack:
+            if self.hook is not None:
+                stack.enter_context(self.hook(mapping, stage))
+            if tracing:
+                base = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+            start = time.perf_counter()
+            try:
+                yield timer
+            finally:
+                seconds = time.perf_counter() - start
+                peak = None
+                if tracing:
+                    peak = max(0, tracemalloc.get_traced_memory()[1] - base)
+                    self._peak_bytes = max(self._peak_bytes or 0, tracemalloc.get_traced_memory()[1])
+                self.stats.setdefault((mapping, stage), StageStats()).add(seconds, timer.rows, peak)
+
+    def merge(self, stats: Dict[Tuple[str, str], StageStats]):
+        """合并其他进程 (进程池工作进程) 的统计"""
+        for key, other in stats.items():
+            self.stats.setdefault(key, StageStats()).merge(other)
+
+    def report(self) -> Dict[str, Any]:
+        """
+        生成可序列化的报告
+
+        Returns:
+            {'started_at', 'mode', 'total_seconds', 'trace_memory', 'peak_memory_mb',
+             'mappings': {映射名: {'seconds', 'rows', 'rows_per_sec', 'peak_memory_mb',
+                                   'stages': {阶段: {'seconds', 'rows', 'rows_per_sec', 'calls', 'peak_memory_mb'}}}}}
+        """
+        mappings: Dict[str, Dict] = {}
+        for (mapping, stage), s in self.stats.items():
+            entry = mappings.setdefault(mapping, {'stages': {}})
+            entry['stages'][stage] = {
+                'seconds': round(s.seconds, 4),
+                'rows': s.rows,
+                'rows_per_sec': _rate(s.rows, s.seconds),
+                'calls': s.calls,
+                'peak_memory_mb': _mb(s.peak_bytes)
+            }
+        for mapping, entry in mappings.items():
+            stages = [self.stats[(mapping, stage)] for stage in entry['stages']]
+            seconds = sum(s.seconds for s in stages)
+            rows = max(s.rows for s in stages)
+            peaks = [s.peak_bytes for s in stages if s.peak_bytes is not None]
+            entry['stages'] = {stage: entry['stages'][stage] for stage in STAGES if stage in entry['stages']}
+            entry.update({
+                'seconds': round(seconds, 4),
+                'rows': rows,
+                'rows_per_sec': _rate(rows, seconds),
+                'peak_memory_mb': _mb(max(peaks)) if peaks else None
+            })
+            mappings[mapping] = {key: entry[key] for key in
+                                 ('seconds', 'rows', 'rows_per_sec', 'peak_memory_mb', 'stages')}
+
+        elapsed = self._elapsed
+        if elapsed is None and self._start is not None:
+            elapsed = time.perf_counter() - self._start
+        return {
+            'started_at': self.started_at,
+            'mode': self.mode,
+            'total_seconds': None if elapsed is None else round(elapsed, 4),
+            'trace_memory': self.trace_memory,
+            'peak_memory_mb': _mb(self._peak_bytes),
+            'mappings': mappings
+        }
+
+    def save(self, path: str) -> Path:
+        """将报告写出为 JSON"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
+        return path
+
+    def print_summary(self):
+        """打印各映射、各阶段的统计表"""
+        report = self.report()
+        if not report['mappings']:
+            return
+        print(f"\n各阶段性能统计 ({report['mode']}，总耗时 {report['total_seconds'] or 0:.2f}s):")
+        print(f"  {_pad('映射', 28)} {_pad('阶段', 14)} {_pad('耗时(s)', 9, True)} {_pad('行数', 10, True)} "
+              f"{_pad('行/秒', 12, True)} {_pad('峰值内存(MB)', 12, True)}")
+        for mapping, entry in report['mappings'].items():
+            for stage, s in entry['stages'].items():
+                print(_format_row(mapping, stage, s))
+            print(_format_row(mapping, '合计', entry))
+        if report['peak_memory_mb'] is not None:
+            print(f"  进程峰值内存: {report['peak_memory_mb']:.2f} MB")
+
+
+def _pad(text: str, width: int, right: bool = False) -> str:
+    """按显示宽度补齐 (中文字符占两列)"""
+    shown = sum(2 if unicodedata.east_asian_width(ch) in 'WF' else 1 for ch in text)
+    fill = ' ' * max(0, width - shown)
+    return fill + text if right else text + fill
+
+
+def _format_row(mapping: str, stage: str, s: Dict) -> str:
+    rate = '-' if s['rows_per_sec'] is None else f"{s['rows_per_sec']:.0f}"
+    peak = '-' if s['peak_memory_mb'] is None else f"{s['peak_memory_mb']:.2f}"
+    return (f"  {_pad(mapping, 28)} {_pad(stage, 14)} {s['seconds']:>9.3f} {s['rows']:>10} "
+            f"{rate:>12} {peak:>12}")
+
+
+class PyinstrumentHook:
+    """
+    采样分析钩子：为每个 (映射, 阶段) 维护一个 pyinstrument 分析器，
+    多次进入 (流式批次) 时累计采样，每次退出后覆盖写出 <映射>.<阶段>.txt
+
+    对象可被 pickle，进程池中的工作进程各自分析并写出。
+    """
+
+    def __init__(self, output_dir: str, interval: float = 0.001):
+        """
+        Args:
+            output_dir: 报告输出目录
+            interval: 采样间隔 (秒)
+        """
+        if pyinstrument is None:
+            raise ImportError("采样分析需要安装 pyinstrument: pip install pyinstrument")
+        self.output_dir = output_dir
+        self.interval = interval
+        self._profilers: Dict[Tuple[str, str], Any] = {}
+
+    def __getstate__(self):
+        return {'output_dir': self.output_dir, 'interval': self.interval, '_profilers': {}}
+
+    @contextmanager
+    def __call__(self, mapping: str, stage: str):
+        profiler = self._profilers.get((mapping, stage))
+        if profiler is None:
+            profiler = self._profilers[(mapping, stage)] = pyinstrument.Profiler(interval=self.interval)
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            os.makedirs(self.output_dir, exist_ok=True)
+            path = os.path.join(self.output_dir, f"{mapping}.{stage}.txt")
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(profiler.output_text(unicode=True))
+
+
+def compare_reports(old: Dict, new: Dict, threshold: float = 0.2) -> List[Dict[str, Any]]:
+    """
+    对比两次运行的报告，找出耗时变慢超过阈值的 (映射, 阶段)
+
+    Args:
+        old: 基线报告
+        new: 新报告
+        threshold: 相对变慢比例阈值 (0.2 即慢 20%)
+
+    Returns:
+        [{'mapping', 'stage', 'old_seconds', 'new_seconds', 'change'}]，按变化比例降序
+    """
+    regressions = []
+    for mapping, entry in new.get('mappings', {}).items():
+        old_entry = old.get('mappings', {}).get(mapping)
+        if old_entry is None:
+            continue
+        pairs = [(stage, old_entry['stages'].get(stage), s) for stage, s in entry['stages'].items()]
+        pairs.append(('合计', old_entry, entry))
+        for stage, before, after in pairs:
+            if not before or before['seconds'] <= 0:
+                continue
+            change = after['seconds'] / before['seconds'] - 1
+            if change > threshold:
+                regressions.append({'mapping': mapping, 'stage': stage, 'old_seconds': before['seconds'],
+                                    'new_seconds': after['seconds'], 'change': round(change, 3)})
+    return sorted(regressions, key=lambda r: r['change'], reverse=True)
+
+
+def main():
+    """对比两次运行的性能报告"""
+    parser = argparse.ArgumentParser(description='对比两次 ETL 运行的性能报告')
+    parser.add_argument('old', help='基线报告 JSON')
+    parser.add_argument('new', help='新报告 JSON')
+    parser.add_argument('--threshold', type=float, default=0.2, help='变慢比例阈值 (默认 0.2)')
+    args = parser.parse_args()
+
+    with open(args.old, 'r', encoding='utf-8') as f:
+        old = json.load(f)
+    with open(args.new, 'r', encoding='utf-8') as f:
+        new = json.load(f)
+
+    regressions = compare_reports(old, new, args.threshold)
+    if not regressions:
+        print(f"✅ 没有超过 {args.threshold:.0%} 的变慢")
+        return
+    print(f"⚠️ {len(regressions)} 处变慢超过 {args.threshold:.0%}:")
+    for r in regressions:
+        print(f"  {_pad(r['mapping'], 28)} {_pad(r['stage'], 14)} {r['old_seconds']:>9.3f}s -> "
+              f"{r['new_seconds']:>9.3f}s  (+{r['change']:.0%})")
+
+
+if __name__ == '__main__':
+    main()
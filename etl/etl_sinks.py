@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+ETL输出 - 将实体逐个写出的流式输出格式
+
+支持的格式:
+    json    : 与原 save_to_json 完全一致的缩进 JSON (逐个实体写出，不再整体构建)
+    jsonl   : 每行一个实体的 JSON Lines
+    parquet : 列式 Parquet，几何属性以 WKB 存储并写入 GeoParquet 元数据 (含图层坐标系)
+"""
+
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Type
+
+import shapely
+
+# 可选依赖：Parquet 输出需要 pyarrow
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+
+class BaseSink:
+    """输出基类：open 后逐个 write 实体，close 时落盘并返回文件路径"""
+
+    extension = ''
+
+    def __init__(self, output_dir: str, mapping_name: str, entity_type: str,
+                 geometry_columns: Optional[List[str]] = None, wkb_columns: Optional[List[str]] = None,
+                 crs: Optional[Dict] = None):
+        """
+        Args:
+            output_dir: 输出目录
+            mapping_name: 映射名称 (即文件名)
+            entity_type: 实体类型
+            geometry_columns: 几何属性名 (仅列式格式使用)，值默认为 WKT，bytes 值视为二进制 WKB
+            wkb_columns: 其中值为十六进制 WKB 的几何属性名
+            crs: 几何的坐标系 (PROJJSON，仅列式格式使用)
+        """
+        output_path = Path(output_dir)
+        output_path.mkdir(parents=True, exist_ok=True)
+        self.path = output_path / f"{mapping_name}.{self.extension}"
+        self.mapping_name = mapping_name
+        self.entity_type = entity_type
+        self.geometry_columns = geometry_columns or []
+        self.wkb_columns = set(wkb_columns or [])
+        self.crs = crs
+        self.count = 0
+
+    def write(self, entity: Dict):
+        raise NotImplementedError
+
+    def write_many(self, entities: List[Dict]):
+        for entity in entities:
+            self.write(entity)
+
+    def close(self) -> Path:
+        return self.path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class JsonSink(BaseSink):
+    """缩进 JSON，输出与 json.dump(data, indent=2) 字节一致，但实体逐个写出"""
+
+    extension = 'json'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._file = open(self.path, 'w', encoding='utf-8')
+        header = json.dumps({'mapping_name': self.mapping_name, 'entity_type': self.entity_type},
+                            ensure_ascii=False, indent=2)
+        # 去掉结尾的 "\n}"，后面接 entities 数组
+        self._file.write(header[:-2] + ',\n  "entities": [')
+
+    def write(self, entity: Dict):
+        text = json.dumps(entity, ensure_ascii=False, indent=2).replace('\n', '\n    ')
+        self._file.write(('\n    ' if self.count == 0 else ',\n    ') + text)
+        self.count += 1
+
+    def close(self) -> Path:
+        if not self._file.closed:
+            self._file.write('\n  ]\n}' if self.count else ']\n}')
+            self._file.close()
+        return self.path
+
+
+class JsonlSink(BaseSink):
+    """JSON Lines，每行一个实体"""
+
+    extension = 'jsonl'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._file = open(self.path, 'w', encoding='utf-8')
+
+    def write(self, entity: Dict):
+        self._file.write(json.dumps(entity, ensure_ascii=False, separators=(',', ':')))
+        self._file.write('\n')
+        self.count += 1
+
+    def close(self) -> Path:
+        if not self._file.closed:
+            self._file.close()
+        return self.path
+
+
+class ParquetSink(BaseSink):
+    """
+    列式 Parquet (GeoParquet)
+
+    每个属性一列 (嵌套属性为 struct)，关系为 list<struct> 列；
+    几何属性从 WKT (或十六进制 WKB) 转为二进制 WKB (已是二进制 WKB 时直接写入)，
+    并写入 GeoParquet 'geo' 元数据 (crs 为图层坐标系的 PROJJSON，未知时为 null)。
+    按 row_group_size 缓冲后写出一个行组，内存占用与行组大小相当。
+
+    各行组的列类型可能不同 (首批关系为空时推断为 list<null>、整数列后续出现小数、后续批次才出现的属性)，
+    因此行组先写入临时分片并合并 Schema (null 提升为具体类型，int 提升为 double)，
+    close 时按合并后的 Schema 逐个分片写入最终文件。
+    """
+
+    extension = 'parquet'
+
+    def __init__(self, *args, row_group_size: int = 50000, **kwargs):
+        if pa is None:
+            raise ImportError("Parquet 输出需要安装 pyarrow")
+        super().__init__(*args, **kwargs)
+        self.row_group_size = row_group_size
+        self._buffer: List[Dict] = []
+        self._parts: List[Path] = []
+        self._schema = None
+
+    def write(self, entity: Dict):
+        row = {'id': entity['id'], 'type': entity['type']}
+        row.update(entity.get('attributes', {}))
+        row['relationships'] = entity.get('relationships', [])
+        self._buffer.append(row)
+        self.count += 1
+        if len(self._buffer) >= self.row_group_size:
+            self._flush()
+
+    def _geo_metadata(self) -> bytes:
+        columns = {name: {'encoding': 'WKB', 'geometry_types': [], 'crs': self.crs}
+                   for name in self.geometry_columns}
+        return json.dumps({'version': '1.0.0', 'primary_column': self.geometry_columns[0],
+                           'columns': columns}).encode('utf-8')
+
+    def _to_table(self, rows: List[Dict]) -> 'pa.Table':
+        for name in self.geometry_columns:
+            # 只解析文本值，二进制 WKB 原样写入
+            texts = [(i, row[name]) for i, row in enumerate(rows) if isinstance(row.get(name), str)]
+            if not texts:
+                continue
+            values = [value for _, value in texts]
+            geoms = shapely.from_wkb(values) if name in self.wkb_columns else shapely.from_wkt(values)
+            for (i, _), wkb in zip(texts, shapely.to_wkb(geoms).tolist()):
+                rows[i][name] = wkb
+        return pa.Table.from_pylist(rows)
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        table = self._to_table(self._buffer)
+        self._buffer = []
+        part = self.path.parent / f".{self.path.name}.part{len(self._parts)}"
+        pq.write_table(table, part)
+        self._parts.append(part)
+        self._schema = table.schema if self._schema is None else \
+            pa.unify_schemas([self._schema, table.schema], promote_options='permissive')
+
+    def _final_schema(self) -> 'pa.Schema':
+        """合并后的 Schema：几何列为 binary，始终全为空的列按字符串处理"""
+        fields = []
+        for f in self._schema:
+            if f.name in self.geometry_columns:
+                f = pa.field(f.name, pa.binary())
+            elif pa.types.is_null(f.type):
+                f = pa.field(f.name, pa.string())
+            fields.append(f)
+        schema = pa.schema(fields)
+        if self.geometry_columns:
+            schema = schema.with_metadata({b'geo': self._geo_metadata()})
+        return schema
+
+    @staticmethod
+    def _conform(table: 'pa.Table', schema: 'pa.Schema') -> 'pa.Table':
+        """把分片对齐到最终 Schema (缺失列补空值)"""
+        columns = []
+        for f in schema:
+            if f.name not in table.column_names:
+                columns.append(pa.nulls(len(table), f.type))
+                continue
+            column = table.column(f.name)
+            try:
+                columns.append(column.cast(f.type))
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+                # 嵌套 struct 字段不一致等无法直接 cast 的情况，按 Python 值重建
+                columns.append(pa.array(column.to_pylist(), type=f.type))
+        return pa.Table.from_arrays(columns, schema=schema)
+
+    def close(self) -> Path:
+        self._flush()
+        if self._parts:
+            self._schema = self._final_schema()
+            try:
+                with pq.ParquetWriter(self.path, self._schema) as writer:
+                    for part in self._parts:
+                        writer.write_table(self._conform(pq.read_table(part), self._schema))
+            finally:
+                for part in self._parts:
+                    part.unlink(missing_ok=True)
+                self._parts = []
+        elif self._schema is None:
+            # 空结果也写出一个只有基础列的文件
+            empty = pa.table({'id': pa.array([], pa.string()), 'type': pa.array([], pa.string())})
+            pq.write_table(empty, self.path)
+            self._schema = empty.schema
+        return self.path
+
+
+SINKS: Dict[str, Type[BaseSink]] = {
+    'json': JsonSink,
+    'jsonl': JsonlSink,
+    'parquet': ParquetSink,
+}
+
+
+def open_sink(fmt: str, output_dir: str, mapping_name: str, entity_type: str,
+              geometry_columns: Optional[List[str]] = None, wkb_columns: Optional[List[str]] = None,
+              crs: Optional[Dict] = None) -> BaseSink:
+    """
+    按格式名创建输出
+
+    Args:
+        fmt: json | jsonl | parquet
+        output_dir: 输出目录
+        mapping_name: 映射名称
+        entity_type: 实体类型
+        geometry_columns: 几何属性名
+        wkb_columns: 其中值为十六进制 WKB 的几何属性名
+        crs: 几何的坐标系 (PROJJSON)
+
+    Returns:
+        输出对象
+    """
+    if fmt not in SINKS:
+        raise ValueError(f"未知的输出格式: {fmt}，可选: {', '.join(SINKS)}")
+    return SINKS[fmt](output_dir, mapping_name, entity_type, geometry_columns=geometry_columns,
+                      wkb_columns=wkb_columns, crs=crs)
@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+转换函数注册表 - YAML 中 transform_func 引用的按列转换
+
+每个转换接收整张数据表与 params，返回与行数等长的取值，
+在 numpy / pandas 中按列计算，不回到逐行的 Python 循环。
+
+内置转换:
+    calc_sum_fields : 多字段求和，非法值按 0 处理      params: columns
+    coalesce        : 取第一个非空值                  params: columns, default
+    code_map        : 按代码表映射                    params: source, mapping, default, keep_unmatched
+    lookup          : 按 CSV 代码表映射               params: source, file, key_column, value_column, default
+    unit_convert    : 单位换算                        params: source, from + to (或 factor), offset, digits
+    regex_extract   : 正则提取 (group 0 为整个匹配)   params: source, pattern, group, default
+    buckets         : 按区间分档                      params: source, bins, labels, right, default
+
+自定义转换:
+    from etl_transforms import register_transform
+
+    @register_transform('floor_area_ratio', required=('area', 'footprint'),
+                        inputs=lambda params: [params['area'], params['footprint']])
+    def floor_area_ratio(frame, params):
+        return get_numeric(frame, params['area']) / get_numeric(frame, params['footprint'])
+
+定义所在的模块写入 global_config.transform_modules，引擎启动时导入即完成注册。
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass(frozen=True)
+class Transform:
+    """已注册的转换"""
+    name: str
+    func: Callable[[pd.DataFrame, Dict], Sequence]
+    required: Tuple[str, ...] = ()
+    inputs: Optional[Callable[[Dict], List[str]]] = None  # 由 params 得出读取的字段 (用于列裁剪)
+    validate: Optional[Callable[[Dict], List[str]]] = None  # 检查 params 取值，返回问题描述 (编译时调用)
+
+
+TRANSFORMS: Dict[str, Transform] = {}
+
+
+def register_transform(name: str, required: Sequence[str] = (),
+                       inputs: Optional[Callable[[Dict], List[str]]] = None,
+                       validate: Optional[Callable[[Dict], List[str]]] = None):
+    """
+    注册转换的装饰器
+
+    Args:
+        name: YAML 中 transform_func 使用的名称
+        required: 必填的 params 项 (编译映射时检查)
+        inputs: 由 params 得出读取的字段，默认取 params 中的 source 与 columns
+        validate: 检查 params 取值的函数，返回问题描述列表 (必填项齐全后在编译映射时调用)
+
+    Returns:
+        装饰器，原函数签名为 func(frame, params) -> 与行数等长的序列
+    """
+    def decorator(func: Callable[[pd.DataFrame, Dict], Sequence]):
+        TRANSFORMS[name] = Transform(name, func, tuple(required), inputs, validate)
+        return func
+    return decorator
+
+
+def transform_inputs(name: str, params: Dict) -> List[str]:
+    """转换读取的源字段"""
+    transform = TRANSFORMS[name]
+    if transform.inputs is not None:
+        return list(transform.inputs(params))
+    columns = list(params.get('columns', []))
+    if params.get('source'):
+        columns.append(params['source'])
+    return columns
+
+
+def apply_transform(name: str, frame: pd.DataFrame, params: Dict) -> List[Any]:
+    """
+    执行转换，结果中的 NaN / NA 统一转为 None
+
+    Args:
+        name: 转换名称
+        frame: 数据表
+        params: 转换参数
+
+    Returns:
+        与数据行一一对应的取值列表
+    """
+    values = np.asarray(TRANSFORMS[name].func(frame, params), dtype=object)
+    if len(values) != len(frame):
+        raise ValueError(f"转换 {name} 返回 {len(values)} 个值，数据表为 {len(frame)} 行")
+    values[pd.isna(values)] = None
+    return values.tolist()
+
+
+# ==================== 取列 ====================
+
+def get_column(frame: pd.DataFrame, column: Optional[str]) -> Optional[pd.Series]:
+    """取列，不存在时返回 None"""
+    if column is not None and column in frame.columns:
+        return frame[column]
+    return None
+
+
+def get_numeric(frame: pd.DataFrame, column: Optional[str]) -> np.ndarray:
+    """取数值列，缺失列与非法值为 NaN"""
+    series = get_column(frame, column)
+    if series is None:
+        return np.full(len(frame), np.nan)
+    return pd.to_numeric(series, errors='coerce').to_numpy(dtype='float64')
+
+
+def _object_array(items: List[Any]) -> np.ndarray:
+    """一维 object 数组 (元素为列表等序列时不展开成二维)"""
+    array = np.empty(len(items), dtype=object)
+    array[:] = items
+    return array
+
+
+def _code_key(value: Any) -> str:
+    """代码表匹配键：整数值的浮点数按整数处理 (GDB 中代码字段常被读为 float)"""
+    if isinstance(value, (float, np.floating)) and float(value).is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _map_codes(series: Optional[pd.Series], n: int, table: Dict[str, Any], default: Any,
+               keep_unmatched: bool = False) -> np.ndarray:
+    """按唯一值映射后再展开 (代码表类字段唯一值很少)"""
+    if series is None:
+        return np.full(n, default, dtype=object)
+    codes, uniques = pd.factorize(series)
+    mapped = [table.get(_code_key(u), u if keep_unmatched else default) for u in uniques]
+    return _object_array(mapped + [default])[codes]
+
+
+# ==================== 内置转换 ====================
+
+def _to_int(value: Any) -> int:
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return 0
+
+
+@register_transform('calc_sum_fields', required=('columns',))
+def calc_sum_fields(frame: pd.DataFrame, params: Dict) -> np.ndarray:
+    """多字段求和，与逐行 int(value) 语义一致：非法值与缺失值按 0 处理，小数截断"""
+    total = np.zeros(len(frame), dtype='int64')
+    for col in params['columns']:
+        series = get_column(frame, col)
+        if series is None:
+            continue
+        kind = series.dtype.kind
+        if kind in 'iub':
+            total += series.to_numpy().astype('int64')
+        elif kind == 'f':
+            values = series.to_numpy(dtype='float64')
+            total += np.trunc(np.where(np.isfinite(values), values, 0.0)).astype('int64')
+        else:
+            # 字符串/混合列：int('12.5') 非法而 int(1.9) 为 1，只能逐个判断
+            total += np.array([_to_int(v) for v in series.tolist()], dtype='int64')
+    return total
+
+
+@register_transform('coalesce', required=('columns',))
+def coalesce(frame: pd.DataFrame, params: Dict) -> np.ndarray:
+    """按顺序取第一个非空 (非 None/NaN/空字符串) 的值"""
+    result = np.full(len(frame), None, dtype=object)
+    filled = np.zeros(len(frame), dtype=bool)
+    for col in params['columns']:
+        series = get_column(frame, col)
+        if series is None:
+            continue
+        values = series.to_numpy(dtype=object)
+        valid = ~pd.isna(values) & (values != '')
+        take = valid & ~filled
+        result[take] = values[take]
+        filled |= take
+    result[~filled] = params.get('default')
+    return result
+
+
+@register_transform('code_map', required=('source', 'mapping'))
+def code_map(frame: pd.DataFrame, params: Dict) -> np.ndarray:
+    """按 YAML 中内联的代码表映射，未匹配时取 default (keep_unmatched 时保留原值)"""
+    table = {_code_key(k): v for k, v in params['mapping'].items()}
+    return _map_codes(get_column(frame, params['source']), len(frame), table,
+                      params.get('default'), params.get('keep_unmatched', False))
+
+
+_LOOKUP_TABLES: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+
+
+def _load_lookup(path: str, key_column: str, value_column: str) -> Dict[str, Any]:
+    cache_key = (path, key_column, value_column)
+    if cache_key not in _LOOKUP_TABLES:
+        table = pd.read_csv(path, dtype={key_column: str})
+        _LOOKUP_TABLES[cache_key] = dict(zip(table[key_column], table[value_column]))
+    return _LOOKUP_TABLES[cache_key]
+
+
+@register_transform('lookup', required=('source', 'file', 'key_column', 'value_column'))
+def lookup(frame: pd.DataFrame, params: Dict) -> np.ndarray:
+    """按外部 CSV 代码表映射 (文件只读取一次)，未匹配时取 default"""
+    table = _load_lookup(params['file'], params['key_column'], params['value_column'])
+    return _map_codes(get_column(frame, params['source']), len(frame), table,
+                      params.get('default'), params.get('keep_unmatched', False))
+
+
+# 单位 -> (量纲, 换算为基本单位的系数)
+UNITS = {
+    'm2': ('area', 1.0), '平方米': ('area', 1.0),
+    'mu': ('area', 10000 / 15), '亩': ('area', 10000 / 15),
+    'ha': ('area', 10000.0), '公顷': ('area', 10000.0),
+    'km2': ('area', 1e6), '平方公里': ('area', 1e6),
+    'mm': ('length', 0.001), 'cm': ('length', 0.01), 'm': ('length', 1.0), 'km': ('length', 1000.0),
+    'kg': ('mass', 1.0), 't': ('mass', 1000.0), '吨': ('mass', 1000.0),
+}
+
+
+def unit_factor(from_unit: str, to_unit: str) -> float:
+    """两个单位之间的换算系数"""
+    (from_dim, from_factor), (to_dim, to_factor) = UNITS[from_unit], UNITS[to_unit]
+    if from_dim != to_dim:
+        raise ValueError(f"单位 {from_unit} 与 {to_unit} 的量纲不同")
+    return from_factor / to_factor
+
+
+def _check_unit_convert(params: Dict) -> List[str]:
+    """需要 factor，或两个已知且量纲相同的 from / to 单位"""
+    if params.get('factor') is not None:
+        return []
+    from_unit, to_unit = params.get('from'), params.get('to')
+    if from_unit is None or to_unit is None:
+        return ["需要 params.factor，或同时指定 params.from 与 params.to"]
+    unknown = [unit for unit in (from_unit, to_unit) if unit not in UNITS]
+    if unknown:
+        return [f"未知的单位 {', '.join(map(str, unknown))}，可选: {', '.join(UNITS)}"]
+    try:
+        unit_factor(from_unit, to_unit)
+    except ValueError as e:
+        return [str(e)]
+    return []
+
+
+@register_transform('unit_convert', required=('source',), validate=_check_unit_convert)
+def unit_convert(frame: pd.DataFrame, params: Dict) -> np.ndarray:
+    """value * factor + offset，factor 可由 from/to 单位得出；digits 指定保留小数位"""
+    factor = params.get('factor')
+    if factor is None:
+        factor = unit_factor(params['from'], params['to'])
+    values = get_numeric(frame, params['source']) * factor + params.get('offset', 0.0)
+    if params.get('digits') is not None:
+        values = np.round(values, params['digits'])
+    return values
+
+
+def _extract_pattern(params: Dict) -> Tuple[str, Any]:
+    """(正则, 分组)：group 为 0 时给整个正则加一层分组，取第 1 组即整个匹配"""
+    group = params.get('group', 1)
+    if group == 0 and not isinstance(group, bool):
+        return f"({params['pattern']})", 1
+    return params['pattern'], group
+
+
+def _check_regex_extract(params: Dict) -> List[str]:
+    """正则可编译，group 为存在的组名或 0 ~ 分组数之间的序号"""
+    regex, group = _extract_pattern(params)
+    try:
+        pattern = re.compile(regex)
+    except re.error as e:
+        return [f"params.pattern 无法编译: {e}"]
+    if isinstance(group, str):
+        return [] if group in pattern.groupindex else [f"params.pattern 中没有名为 {group} 的分组"]
+    if isinstance(group, bool) or not isinstance(group, int) or not 1 <= group <= pattern.groups:
+        return [f"params.group 应为组名或 0 ~ {pattern.groups} 的序号 (0 为整个匹配)，实际为 {group!r}"]
+    return []
+
+
+@register_transform('regex_extract', required=('source', 'pattern'), validate=_check_regex_extract)
+def regex_extract(frame: pd.DataFrame, params: Dict) -> np.ndarray:
+    """正则提取第 group 个分组 (序号或组名，默认 1，0 为整个匹配)，不匹配时取 default"""
+    series = get_column(frame, params['source'])
+    if series is None:
+        return np.full(len(frame), params.get('default'), dtype=object)
+    regex, group = _extract_pattern(params)
+    pattern = re.compile(regex)
+    extracted = series.astype('string').str.extract(pattern, expand=True)
+    column = group if isinstance(group, str) else extracted.columns[group - 1]
+    values = extracted[column].to_numpy(dtype=object)
+    values[pd.isna(values)] = params.get('default')
+    return values
+
+
+@register_transform('buckets', required=('source', 'bins', 'labels'))
+def buckets(frame: pd.DataFrame, params: Dict) -> np.ndarray:
+    """
+    按区间分档：bins 为 n+1 个递增边界，labels 为 n 个档位名；
+    默认左闭右开 (right: true 时左开右闭)，超出范围或非数值取 default
+    """
+    bins = np.asarray(params['bins'], dtype='float64')
+    labels = list(params['labels'])
+    if len(labels) != len(bins) - 1:
+        raise ValueError(f"buckets: {len(bins)} 个边界需要 {len(bins) - 1} 个 labels")
+    values = get_numeric(frame, params['source'])
+    index = np.digitize(values, bins, right=params.get('right', False))
+    valid = (index >= 1) & (index <= len(labels)) & ~np.isnan(values)
+    return _object_array(labels + [params.get('default')])[np.where(valid, index - 1, len(labels))]
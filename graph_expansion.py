@@ -0,0 +1,87 @@
+# graph_expansion.py
+from typing import Dict, List
+
+from cypher_fallback import _quote_key, to_literal
+
+# 语义检索表名后缀：<标签>_embeddings 的 node_id 对应图谱中该标签节点的 id_key 属性
+EMBEDDING_TABLE_SUFFIX = "_embeddings"
+
+
+def table_label(target_table: str) -> str:
+    """语义检索表名 -> 图谱节点标签 (例如 防御区_embeddings -> 防御区)"""
+    if target_table.endswith(EMBEDDING_TABLE_SUFFIX):
+        return target_table[:-len(EMBEDDING_TABLE_SUFFIX)]
+    return target_table
+
+
+def normalize_id(value) -> str:
+    """统一 node_id 与图谱属性值的写法 (向量表中 node_id 为文本，图谱中可能是数字)"""
+    text = str(value).strip()
+    return text[:-2] if text.endswith(".0") and text[:-2].isdigit() else text
+
+
+def _id_literals(node_ids: list) -> List[str]:
+    """node_id 列表 -> Cypher 字面量 (纯数字的 ID 同时按文本和数字匹配)"""
+    literals = []
+    for value in node_ids:
+        key = normalize_id(value)
+        candidates = [to_literal(key)] + ([key] if key.lstrip("-").isdigit() else [])
+        literals.extend(c for c in candidates if c not in literals)
+    return literals
+
+
+def build_expansion_query(label: str, id_key: str, node_ids: list) -> str:
+    """
+    生成一次性展开全部命中节点一跳邻居的 Cypher
+
+    Args:
+        label (str): 命中节点的标签 (非普通标识符时自动加反引号)
+        id_key (str): 与 node_id 对应的属性名 (同上)
+        node_ids (list): 语义检索命中的 node_id 列表
+
+    Returns:
+        str: Cypher 语句，每行返回 {hit, rel, neighbour}
+    """
+    label, id_key = _quote_key(label), _quote_key(id_key)
+    return (f"MATCH (n:{label})-[r]-(m) WHERE n.{id_key} IN [{', '.join(_id_literals(node_ids))}] "
+            f"RETURN {{hit: n.{id_key}, rel: r, neighbour: m}}")
+
+
+def group_neighbours(node_ids: list, rows: list, max_per_hit: int = 20) -> Dict[str, dict]:
+    """
+    把展开查询的结果按命中节点分组
+
+    Args:
+        node_ids (list): 语义检索命中的 node_id 列表
+        rows (list): build_expansion_query 的查询结果
+        max_per_hit (int): 每个命中节点最多保留的邻居数
+
+    Returns:
+        dict: {node_id: {"neighbour_count": 邻居总数, "neighbours": [{relation, direction, label, properties}, ...]}}
+    """
+    groups = {normalize_id(v): {"neighbour_count": 0, "neighbours": []} for v in node_ids}
+    seen = set()
+    for row in rows:
+        if not isinstance(row, dict):
+            continue
+        group = groups.get(normalize_id(row.get("hit")))
+        rel, neighbour = row.get("rel") or {}, row.get("neighbour") or {}
+        # 无向匹配时同一条边可能返回两次
+        edge_key = (normalize_id(row.get("hit")), rel.get("id"), neighbour.get("id"))
+        if group is None or edge_key in seen:
+            continue
+        seen.add(edge_key)
+        group["neighbour_count"] += 1
+        if len(group["neighbours"]) >= max_per_hit:
+            continue
+        entry = {
+            "relation": rel.get("label"),
+            # -> 命中节点指向邻居；<- 邻居指向命中节点
+            "direction": "<-" if str(rel.get("start_id")) == str(neighbour.get("id")) else "->",
+            "label": neighbour.get("label"),
+            "properties": neighbour.get("properties", {}),
+        }
+        if rel.get("properties"):
+            entry["rel_properties"] = rel["properties"]
+        group["neighbours"].append(entry)
+    return groups
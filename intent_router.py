@@ -0,0 +1,256 @@
+# intent_router.py
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from cypher_fallback import match_values, to_literal
+
+# 模板文本中去掉的空白与标点 (实体占位符用 <标签>，尖括号保留)
+_PUNCT_RE = re.compile(r"[\s　，。？！?!,.、；;：:\"'“”‘’「」（）()]+")
+_CN_DIGITS = {"一": 1, "二": 2, "两": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+
+# 回答中最多逐条列出的行数 (与系统提示词的回复规范一致)
+MAX_LISTED_ROWS = 10
+PREVIEW_ROWS = 5
+
+
+def parse_count(text: str) -> Optional[int]:
+    """阿拉伯数字或一到九十九的中文数字 -> int"""
+    if text.isdigit():
+        return int(text)
+    if "十" not in text:
+        return _CN_DIGITS.get(text)
+    tens, _, ones = text.partition("十")
+    if (tens and tens not in _CN_DIGITS) or (ones and ones not in _CN_DIGITS):
+        return None
+    return _CN_DIGITS.get(tens, 1) * 10 + _CN_DIGITS.get(ones, 0)
+
+
+@dataclass
+class Slots:
+    entities: Dict[str, object] = field(default_factory=dict)    # 标签 -> Entity
+    groups: Dict[str, str] = field(default_factory=dict)         # 正则命名分组
+
+
+@dataclass
+class Intent:
+    name: str
+    description: str
+    patterns: List[str]                                 # 对模板文本做 fullmatch 的正则
+    entity_labels: List[str]                            # 必须由实体链接填充的槽位 (标签)
+    build: Callable[[Slots, "IntentRouter"], Optional[str]]   # 返回 Cypher；槽位无效时返回 None
+    columns: List[str]                                  # 回答表格的列 (节点属性)
+    title: Callable[[Slots], str]
+
+
+@dataclass
+class RouteResult:
+    intent: str
+    cypher: str
+    rows: list
+    answer: str
+
+    @property
+    def tool_payloads(self) -> List[dict]:
+        """与 Agent 工具返回相同的格式，便于界面展示与写入答案缓存"""
+        return [{"name": "execute_cypher_query", "content": json.dumps(self.rows, ensure_ascii=False)}]
+
+
+def _entity_condition(var: str, entity) -> str:
+    if entity.node_id is not None:
+        return f"id({var}) = {int(entity.node_id)}"
+    return f"{var}.{entity.key} = {to_literal(entity.value)}"
+
+
+def _risk_level(slots: Slots, router: "IntentRouter") -> Optional[str]:
+    """风险等级取值须能在取值字典中找到 (如 "中" -> "中级")，否则交给 Agent"""
+    level = slots.groups["level"]
+    if router.value_lookup is not None:
+        try:
+            matches = match_values(level, router.value_lookup("防御区", "风险等级"))
+        except Exception as e:
+            print(f"[Router] ⚠️ 查询风险等级取值失败: {e}")
+            return None
+        if len(matches) != 1:
+            return None
+        level = matches[0]
+        slots.groups["level"] = level
+    return f"MATCH (d:防御区) WHERE d.风险等级 = {to_literal(level)} RETURN {{node: d}}"
+
+
+def _top_bearers(slots: Slots, router: "IntentRouter") -> Optional[str]:
+    n = parse_count(slots.groups["n"])
+    if not n or n > 100:
+        return None
+    slots.groups["n"] = str(n)
+    return (f"MATCH (n:承灾体) WHERE n.威胁财产 IS NOT NULL "
+            f"WITH n ORDER BY toFloat(n.威胁财产) DESC LIMIT {n} RETURN {{node: n}}")
+
+
+_WHO = r"(?:谁|哪些人|哪个人|哪位|什么人)"
+_CHECK = r"(?:核查|负责|巡查)"
+
+DEFAULT_INTENTS = [
+    Intent(
+        name="zone_checkers",
+        description="某防御区由谁核查",
+        patterns=[
+            rf"(?:请问)?<防御区>(?:防御区)?(?:是|由)?{_WHO}(?:来)?{_CHECK}(?:的)?(?:呢|啊)?",
+            rf"{_WHO}{_CHECK}(?:了)?<防御区>(?:防御区)?(?:呢)?",
+            r"<防御区>(?:防御区)?的(?:核查人|负责人)(?:是谁|有哪些|是哪些人|有谁)?",
+        ],
+        entity_labels=["防御区"],
+        build=lambda s, r: (f"MATCH (p:核查人)-[r:核查]->(d:防御区) "
+                            f"WHERE {_entity_condition('d', s.entities['防御区'])} RETURN {{node: p}}"),
+        columns=["姓名", "单位"],
+        title=lambda s: f"防御区 **{s.entities['防御区'].value}** 的核查人",
+    ),
+    Intent(
+        name="person_zones",
+        description="某人核查哪些防御区",
+        patterns=[
+            rf"<核查人>{_CHECK}(?:了|的)*(?:哪些|什么|几个|多少)?(?:个)?防御区(?:有哪些|是哪些|都有哪些|有什么|呢)?",
+        ],
+        entity_labels=["核查人"],
+        build=lambda s, r: (f"MATCH (p:核查人)-[r:核查]->(d:防御区) "
+                            f"WHERE {_entity_condition('p', s.entities['核查人'])} RETURN {{node: d}}"),
+        columns=["id", "地理位置", "面积", "风险等级"],
+        title=lambda s: f"**{s.entities['核查人'].value}** 核查的防御区",
+    ),
+    Intent(
+        name="top_bearers_by_property",
+        description="威胁财产最多的前 N 个承灾体",
+        patterns=[
+            r"(?:承灾体(?:里|中)?)?威胁财产(?:最多|最大|最高)的(?:前)?(?P<n>\d+|[一二两三四五六七八九十]+)(?:个|名|条)?(?:承灾体)?(?:是哪些|有哪些)?",
+        ],
+        entity_labels=[],
+        build=_top_bearers,
+        columns=["id", "威胁财产", "威胁人口", "地理位置"],
+        title=lambda s: f"威胁财产最多的前 {s.groups['n']} 个承灾体",
+    ),
+    Intent(
+        name="zones_by_risk_level",
+        description="风险等级为某值的防御区",
+        patterns=[
+            r"(?:哪些|什么)?防御区(?:的)?风险等级(?:是|为|等于)(?P<level>[^的<>]+?)(?:的)?(?:防御区)?(?:有哪些|是哪些)?",
+            r"风险等级(?:是|为|等于)(?P<level>[^的<>]+?)的(?:防御区)(?:有哪些|是哪些)?",
+        ],
+        entity_labels=[],
+        build=_risk_level,
+        columns=["id", "地理位置", "面积", "风险等级"],
+        title=lambda s: f"风险等级为 **{s.groups['level']}** 的防御区",
+    ),
+]
+
+
+def format_rows(title: str, rows: list, columns: List[str]) -> str:
+    """
+    把节点结果整理为 Markdown 回答 (<= 10 条全部列出，否则列出前 5 条并提示查看明细)
+    """
+    props = [(r.get("node") or {}).get("properties", {}) if isinstance(r, dict) else {} for r in rows]
+    # 全为空的列不显示
+    columns = [c for c in columns if any(p.get(c) not in (None, "") for p in props)] or columns[:1]
+    shown = props if len(props) <= MAX_LISTED_ROWS else props[:PREVIEW_ROWS]
+    lines = [f"{title}共 {len(rows)} 条：", "", "| " + " | ".join(columns) + " |", "|" + " --- |" * len(columns)]
+    for p in shown:
+        lines.append("| " + " | ".join("" if p.get(c) is None else str(p.get(c)) for c in columns) + " |")
+    if len(props) > MAX_LISTED_ROWS:
+        lines.append(f"\n以上为前 {PREVIEW_ROWS} 条示例，完整数据请查看下方明细。")
+    lines.append("\n> 来源：图谱关系查询 (常见问题模板直达)")
+    return "\n".join(lines)
+
+
+class IntentRouter:
+    """
+    常见问题模板直达：问题能被某个模板完整匹配 (fullmatch) 且槽位有效时，
+    直接执行参数化 Cypher 并格式化回答，不调用大模型
+
+    - 实体槽位由实体链接填充，问题中的实体片段替换为 <标签> 后再与模板匹配
+    - 模板要求整句匹配，问题带有额外条件 (如 "面积最大的") 时不会命中
+    - 实体有歧义、取值校验失败、查询出错或结果为空时返回 None，由 Agent 处理
+    """
+
+    def __init__(self, run_query: Callable[[str], list], linker=None,
+                 value_lookup: Optional[Callable[[str, str], list]] = None,
+                 intents: Optional[List[Intent]] = None):
+        """
+        Args:
+            run_query: Cypher -> 结果行列表
+            linker: 实体链接器 (EntityLinker 或 EntityIndex，需提供 link(question))
+            value_lookup: (标签, 属性) -> 取值列表，用于校验文本槽位 (如 ValueDictionary.values)
+            intents: 模板列表，默认为 DEFAULT_INTENTS
+        """
+        self.run_query = run_query
+        self.linker = linker
+        self.value_lookup = value_lookup
+        self.intents = intents or DEFAULT_INTENTS
+        self._compiled = [(intent, [re.compile(p) for p in intent.patterns]) for intent in self.intents]
+
+    def template_text(self, question: str):
+        """
+        问题中的实体替换为 <标签> 并去掉标点
+
+        Returns:
+            tuple: (模板文本, {标签: Entity})；同一标签对应多个实体 (有歧义) 时该标签不填充
+        """
+        matches = self.linker.link(question) if self.linker is not None else []
+        entities, pieces, last = {}, [], 0
+        for m in matches:
+            labels = {e.label for e in m.entities}
+            if len(labels) != 1:
+                continue
+            label = labels.pop()
+            pieces.append(question[last:m.start])
+            pieces.append(f"<{label}>")
+            last = m.end
+            candidates = [e for e in m.entities if e.label == label]
+            entities[label] = candidates[0] if len(candidates) == 1 and label not in entities else None
+        pieces.append(question[last:])
+        text = _PUNCT_RE.sub("", "".join(pieces)).lower()
+        return text, {k: v for k, v in entities.items() if v is not None}
+
+    def match(self, question: str):
+        """
+        Returns:
+            tuple | None: (Intent, Slots, Cypher)
+        """
+        text, entities = self.template_text(question)
+        for intent, patterns in self._compiled:
+            if any(label not in entities for label in intent.entity_labels):
+                continue
+            for pattern in patterns:
+                m = pattern.fullmatch(text)
+                if m is None:
+                    continue
+                slots = Slots({label: entities[label] for label in intent.entity_labels},
+                              {k: v for k, v in m.groupdict().items() if v})
+                cypher = intent.build(slots, self)
+                if cypher:
+                    return intent, slots, cypher
+        return None
+
+    def route(self, question: str) -> Optional[RouteResult]:
+        """
+        尝试用模板直接回答
+
+        Args:
+            question (str): 用户问题
+
+        Returns:
+            RouteResult | None: 命中时返回回答与查询结果；否则返回 None (交给 Agent)
+        """
+        matched = self.match(question)
+        if matched is None:
+            return None
+        intent, slots, cypher = matched
+        try:
+            rows = self.run_query(cypher)
+        except Exception as e:
+            print(f"[Router] ⚠️ 模板 {intent.name} 查询失败，交给 Agent: {e}")
+            return None
+        if not rows:
+            print(f"[Router] 模板 {intent.name} 无结果，交给 Agent")
+            return None
+        print(f"[Router] ✅ 模板 {intent.name} 命中，返回 {len(rows)} 条: {cypher}")
+        return RouteResult(intent.name, cypher, rows, format_rows(intent.title(slots), rows, intent.columns))
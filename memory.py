@@ -1,7 +1,338 @@
 # memory.py
-from langchain_core.messages import HumanMessage
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
 
-def build_chat_context(current_prompt: str, history: list, strategy: str = "window", k: int = 6):
+from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
+
+# 可选依赖：dashscope 自带 Qwen 分词器，缺失或加载失败时按字符估算
+try:
+    from dashscope import get_tokenizer
+    _TOKENIZER = get_tokenizer("qwen-turbo")
+except Exception:
+    _TOKENIZER = None
+
+_CJK_RE = re.compile(r"[㐀-鿿豈-﫿]")
+
+# 每条消息的角色/格式开销 (估算)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# 工具结果压缩：短于该 token 数的工具返回 (报错、零结果提示等) 原样保留
+COMPACT_MIN_TOKENS = 200
+# 摘要里列出的关键 ID 个数上限
+DIGEST_MAX_IDS = 10
+# 视为关键 ID 的属性名 (与 schema.py 中各实体的 id_key 对应，node_id 来自语义检索表)
+ID_KEYS = ("id", "姓名", "单位名称", "node_id")
+
+SUMMARY_PROMPT = """你是对话记录员。请把"已有摘要"和"新增对话"合并为一份新的摘要，供后续回答参考。
+要求：
+1. 保留用户关心的实体 (防御区编号、人名、单位等)、查询条件、关键数字结论；
+2. 省略寒暄、工具调用过程与原始 JSON；
+3. 使用中文，不超过 {max_chars} 字，只输出摘要本身。
+
+【已有摘要】
+{summary}
+
+【新增对话】
+{dialogue}
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算文本的 token 数
+
+    有 Qwen 分词器时精确计数；否则中文按 1 字 1 token、其他字符按 4 字符 1 token 估算。
+    """
+    if not text:
+        return 0
+    if _TOKENIZER is not None:
+        return len(_TOKENIZER.encode(text))
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """按 estimate_tokens 截断文本，保留不超过 max_tokens 的最长前缀"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    # token 数随前缀长度单调不减，二分查找截断位置
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(text[:mid]) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo]
+
+
+def message_tokens(msg) -> int:
+    """单条消息的 token 数 (含工具调用参数)"""
+    content = msg.content if isinstance(msg.content, str) else json.dumps(msg.content, ensure_ascii=False)
+    tokens = estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+    for call in getattr(msg, "tool_calls", None) or []:
+        tokens += estimate_tokens(call.get("name", "") + json.dumps(call.get("args", {}), ensure_ascii=False))
+    return tokens
+
+
+def split_turns(history: list) -> list:
+    """
+    按用户消息把历史切分为轮次
+
+    Returns:
+        list: [(起始下标, 结束下标)]，每轮从一条 HumanMessage 开始
+    """
+    starts = [i for i, msg in enumerate(history) if isinstance(msg, HumanMessage)]
+    if not starts or starts[0] != 0:
+        starts = [0] + starts
+    return [(start, end) for start, end in zip(starts, starts[1:] + [len(history)]) if start < end]
+
+
+def render_dialogue(messages: list) -> str:
+    """把消息转为摘要用的纯文本 (跳过工具消息与只含工具调用的 AI 消息)"""
+    lines = []
+    for msg in messages:
+        if isinstance(msg, HumanMessage):
+            lines.append(f"用户: {msg.content}")
+        elif isinstance(msg, AIMessage) and msg.content:
+            lines.append(f"助手: {msg.content}")
+    return "\n".join(lines)
+
+
+def make_llm_summarizer(llm, max_chars: int = 300):
+    """
+    基于聊天模型的增量摘要函数
+
+    Args:
+        llm: LangChain 聊天模型 (建议用较小的模型)
+        max_chars (int): 摘要字数上限
+
+    Returns:
+        callable: summarizer(已有摘要, 新增消息列表) -> 新摘要
+    """
+    def summarize(summary: str, messages: list) -> str:
+        prompt = SUMMARY_PROMPT.format(max_chars=max_chars, summary=summary or "(无)",
+                                       dialogue=render_dialogue(messages))
+        return llm.invoke([HumanMessage(content=prompt)]).content.strip()
+    return summarize
+
+
+def _fallback_summary(summary: str, messages: list, max_tokens: int) -> str:
+    """摘要模型不可用时的兜底：保留已有摘要并追加用户问题，超出预算时丢弃最早的内容"""
+    questions = [f"用户曾问: {msg.content}" for msg in messages if isinstance(msg, HumanMessage)]
+    lines = ([summary] if summary else []) + questions
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+class ToolResultStore:
+    """
+    被压缩的工具返回的完整内容，按句柄 (内容哈希) 保存，供 Agent 通过 recall_tool_result 取回
+
+    句柄只由内容决定，不同会话的相同结果共用一条记录；超过 max_entries 时按最近最少使用淘汰。
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._items: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, content: str) -> str:
+        handle = "tr-" + hashlib.sha1(content.encode("utf-8")).hexdigest()[:10]
+        with self._lock:
+            self._items[handle] = content
+            self._items.move_to_end(handle)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+        return handle
+
+    def get(self, handle: str):
+        with self._lock:
+            content = self._items.get(handle.strip())
+            if content is not None:
+                self._items.move_to_end(handle.strip())
+            return content
+
+
+TOOL_RESULT_STORE = ToolResultStore()
+
+
+def _collect_ids(data, found: list):
+    """递归收集数据中 ID_KEYS 属性的取值 (保持出现顺序、去重)"""
+    if len(found) >= DIGEST_MAX_IDS:
+        return
+    if isinstance(data, dict):
+        for key in ID_KEYS:
+            value = data.get(key)
+            if isinstance(value, (str, int)) and not isinstance(value, bool) and value not in found:
+                found.append(value)
+                break
+        for value in data.values():
+            if isinstance(value, (dict, list)):
+                _collect_ids(value, found)
+    elif isinstance(data, list):
+        for item in data:
+            _collect_ids(item, found)
+
+
+def digest_tool_result(name: str, content: str, args: dict, handle: str) -> str:
+    """
+    生成工具返回的简短摘要：调用参数 (Cypher/检索词)、返回条数、关键 ID 与取回句柄
+
+    Args:
+        name (str): 工具名
+        content (str): 工具原始返回
+        args (dict): 工具调用参数
+        handle (str): 完整内容的句柄
+
+    Returns:
+        str: 摘要文本
+    """
+    try:
+        data = json.loads(content)
+    except (TypeError, ValueError):
+        data = None
+    # 语义检索结果在 search_results 中，图谱查询自动改写后的结果在 results 中
+    rows = data.get("search_results", data.get("results")) if isinstance(data, dict) else data
+
+    lines = [f"[已压缩的历史工具结果 {handle}] 工具 {name}"]
+    if args:
+        lines.append("调用参数: " + json.dumps(args, ensure_ascii=False))
+    if isinstance(rows, list):
+        lines.append(f"返回 {len(rows)} 条数据")
+        ids = []
+        _collect_ids(rows, ids)
+        if ids:
+            lines.append("关键 ID: " + ", ".join(str(i) for i in ids) + (" ..." if len(rows) > len(ids) else ""))
+    else:
+        lines.append(f"返回文本 {len(content)} 字: {content[:80]}...")
+    lines.append(f'如需完整数据，调用 recall_tool_result(handle="{handle}")')
+    return "\n".join(lines)
+
+
+def compact_history(history: list, keep_turns: int = 1, min_tokens: int = COMPACT_MIN_TOKENS,
+                    store: ToolResultStore = None) -> list:
+    """
+    压缩历史中的工具返回：最近 keep_turns 轮原样保留，更早轮次中较大的 ToolMessage 替换为摘要
+
+    完整内容写入 store，Agent 需要时可按句柄取回。返回新列表 (长度与原列表相同)，不修改原消息。
+
+    Args:
+        history (list): 历史消息列表
+        keep_turns (int): 不压缩的最近轮数
+        min_tokens (int): 小于该 token 数的工具返回不压缩
+        store (ToolResultStore): 完整内容的存放处，默认为全局 TOOL_RESULT_STORE
+
+    Returns:
+        list: 压缩后的消息列表
+    """
+    store = store or TOOL_RESULT_STORE
+    turns = split_turns(history)
+    if len(turns) <= keep_turns:
+        return list(history)
+    cutoff = turns[-keep_turns][0] if keep_turns else len(history)
+
+    call_args = {}
+    compacted = []
+    for i, msg in enumerate(history):
+        if isinstance(msg, AIMessage):
+            for call in msg.tool_calls or []:
+                call_args[call.get("id")] = call.get("args", {})
+        if i < cutoff and isinstance(msg, ToolMessage) and isinstance(msg.content, str) \
+                and estimate_tokens(msg.content) >= min_tokens:
+            handle = store.put(msg.content)
+            msg = ToolMessage(content=digest_tool_result(msg.name, msg.content, call_args.get(msg.tool_call_id), handle),
+                              tool_call_id=msg.tool_call_id, name=msg.name)
+        compacted.append(msg)
+    return compacted
+
+
+def build_budget_context(current_prompt: str, history: list, token_budget: int = 3000,
+                         summary_state: dict = None, summarizer=None, summary_tokens: int = 400) -> dict:
+    """
+    按 token 预算构建上下文：最近的轮次原样保留，放不下的早期轮次折叠进滚动摘要
+
+    摘要是增量生成的：summary_state 记录已折叠到第几条消息，
+    每次只把新移出窗口的轮次与旧摘要合并，不重复摘要整段历史。
+
+    Args:
+        current_prompt (str): 当前用户的新问题。
+        history (list): session_state 中的历史消息列表。
+        token_budget (int): 历史 + 当前问题的 token 上限 (摘要另计，受 summary_tokens 约束)。
+        summary_state (dict): 会话内保存的摘要状态 {"summary": str, "covered": int}，原地更新。
+        summarizer (callable): summarizer(已有摘要, 新增消息) -> 新摘要；为 None 或失败时使用兜底摘要。
+        summary_tokens (int): 摘要的 token 上限。
+
+    Returns:
+        dict: 符合 LangGraph 输入要求的字典 {"messages": [...]}
+    """
+    state = summary_state if summary_state is not None else {}
+    if state.get("covered", 0) > len(history):
+        # 历史被清空过，摘要作废
+        state.clear()
+    summary = state.get("summary", "")
+    covered = state.get("covered", 0)
+
+    current_msg_obj = HumanMessage(content=current_prompt)
+    used = message_tokens(current_msg_obj)
+
+    # 1. 从最近一轮往前，整轮放入预算 (至少保留最近一轮)
+    turns = [(s, e) for s, e in split_turns(history) if e > covered]
+    keep_from = len(history)
+    for start, end in reversed(turns):
+        start = max(start, covered)
+        turn_tokens = sum(message_tokens(m) for m in history[start:end])
+        if keep_from < len(history) and used + turn_tokens > token_budget:
+            break
+        used += turn_tokens
+        keep_from = start
+
+    # 2. 新移出窗口的消息并入摘要
+    evicted = history[covered:keep_from]
+    if evicted:
+        try:
+            if summarizer is None:
+                raise RuntimeError("未提供摘要函数")
+            summary = summarizer(summary, evicted)
+            # 模型没有遵守字数要求时按 token 截断
+            summary = truncate_tokens(summary, summary_tokens)
+        except Exception as e:
+            print(f"[Memory] ⚠️ 摘要生成失败，使用兜底摘要: {e}")
+            summary = _fallback_summary(summary, evicted, summary_tokens)
+        state.update(summary=summary, covered=keep_from)
+
+    # 3. 摘要以一问一答的形式放在最前 (系统提示词由 Agent 统一注入，这里不再追加 SystemMessage)
+    final_messages = []
+    if summary:
+        final_messages = [
+            HumanMessage(content=f"【之前对话的摘要】\n{summary}"),
+            AIMessage(content="好的，我会结合以上摘要理解接下来的问题。"),
+        ]
+    final_messages += history[keep_from:] + [current_msg_obj]
+    return {"messages": final_messages}
+
+
+def recent_turns(history: list, k: int) -> list:
+    """
+    滑动窗口：按轮次保留最近 k // 2 轮 (至少 1 轮)
+
+    历史中保存了完整的工具调用链，按消息条数截断时，工具调用较多的一轮就会占满窗口甚至被整轮丢弃，
+    因此 k 仍按 "一问一答" 的消息条数理解，但以整轮为单位截取 (工具消息不会脱离发起调用的 AI 消息)。
+    """
+    turns = split_turns(history)
+    if not turns:
+        return []
+    keep = turns[-max(1, k // 2):]
+    return history[keep[0][0]:]
+
+
+def build_chat_context(current_prompt: str, history: list, strategy: str = "window", k: int = 6,
+                       token_budget: int = 3000, summary_state: dict = None, summarizer=None,
+                       compact_tools: bool = True):
     """
     根据策略构建发送给 Agent 的消息上下文。
 
@@ -11,35 +342,45 @@ def build_chat_context(current_prompt: str, history: list, strategy: str = "wind
         strategy (str): 记忆策略
             - "none": 不记忆 (只发当前问题)
             - "full": 全量记忆 (小心 Token 爆炸)
-            - "window": 滑动窗口 (最近 k 条)
+            - "window": 滑动窗口 (最近 k // 2 轮，见 recent_turns)
+            - "budget": Token 预算 + 滚动摘要 (见 build_budget_context)
         k (int): 窗口大小，默认为 6。
+        token_budget (int): budget 策略的 token 上限。
+        summary_state (dict): budget 策略在会话中保存的摘要状态。
+        summarizer (callable): budget 策略的摘要函数。
+        compact_tools (bool): 是否把早期轮次的工具返回压缩为摘要 (见 compact_history)。
 
     Returns:
         dict: 符合 LangGraph 输入要求的字典 {"messages": [...]}
     """
-    
+
+    if compact_tools and strategy != "none":
+        history = compact_history(history)
+
+    if strategy == "budget":
+        return build_budget_context(current_prompt, history, token_budget=token_budget,
+                                    summary_state=summary_state, summarizer=summarizer)
+
     # 1. 构造当前消息对象
     current_msg_obj = HumanMessage(content=current_prompt)
-    
+
     # 2. 根据策略筛选历史
     if strategy == "none":
         # 模式一：无记忆
         final_messages = [current_msg_obj]
-        
+
     elif strategy == "full":
         # 模式二：全量
         final_messages = history + [current_msg_obj]
-        
+
     elif strategy == "window":
-        # 模式三：滑动窗口 (默认)
-        # 确保 k 是偶数比较合理（一问一答），且至少为 2
-        safe_k = max(2, k)
-        recent_history = history[-safe_k:] if history else []
+        # 模式三：滑动窗口 (默认)，按整轮截取
+        recent_history = recent_turns(history, k)
         final_messages = recent_history + [current_msg_obj]
-        
+
     else:
         # 默认回退到 window
-        recent_history = history[-6:] if history else []
+        recent_history = recent_turns(history, 6)
         final_messages = recent_history + [current_msg_obj]
 
-    return {"messages": final_messages}
\ No newline at end of file
+    return {"messages": final_messages}
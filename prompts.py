@@ -1,14 +1,24 @@
 # prompts.py
 from config import GRAPH_NAME
-from schema import GRAPH_SCHEMA, RELATIONSHIPS
+from schema_provider import get_schema
 
-def generate_schema_description():
-    """根据 schema.py 自动生成 Prompt 中的 Schema 描述部分"""
+def generate_schema_description(schema=None, relationships=None):
+    """
+    根据 schema.py 自动生成 Prompt 中的 Schema 描述部分
+
+    Args:
+        schema (dict): 要描述的 Schema (子集)，默认为当前完整 Schema (见 schema_provider.get_schema)
+        relationships (list): 要描述的关系，默认为当前完整关系列表
+    """
+    if schema is None or relationships is None:
+        snapshot = get_schema()
+        schema = snapshot.schema if schema is None else schema
+        relationships = snapshot.relationships if relationships is None else relationships
     desc_lines = []
     
     # 1. 自动生成节点规则
     desc_lines.append("**【节点属性映射规则 (自动生成)】**:")
-    for label, config in GRAPH_SCHEMA.items():
+    for label, config in schema.items():
          line = f"- **:{label}** ({config['desc']})"
          if "id_key" in config:
             line += f"\n  - ID查询键: '{config['id_key']}'"
@@ -20,16 +30,21 @@ def generate_schema_description():
         
     # 2. 自动生成关系列表
     desc_lines.append("\n**【关系类型】**:")
-    desc_lines.append(", ".join(RELATIONSHIPS))
+    desc_lines.append(", ".join(relationships))
     
     return "\n".join(desc_lines)
 
-def get_system_prompt():
+def get_system_prompt(schema_text=None, entity_hints=""):
     """
     获取 Agent 的 System Prompt。
-    可以根据需要扩展参数，比如传入 schema_info 动态生成。
+
+    Args:
+        schema_text (str): Schema 描述，默认为完整 Schema；按问题挑选子集时由调用方传入
+        entity_hints (str): 实体链接提示 (见 entity_linker.format_entity_hints)，为空时不加该段
     """
-    dynamic_schema_text = generate_schema_description()
+    dynamic_schema_text = schema_text or generate_schema_description()
+    if entity_hints:
+        dynamic_schema_text += f"\n\n**【实体链接 (系统预先识别)】**:\n{entity_hints}"
     return f"""
 # Role
 你是一个智能的混合检索专家 Agent。你拥有两个核心能力：
@@ -62,9 +77,13 @@ def get_system_prompt():
 
 ### 3. 混合查询 (Scenario: Hybrid Workflow)
 - **触发条件**: 问题既包含模糊描述，又询问具体属性（例如：“有哪些植被破坏严重的地方？它们的负责人是谁？”）。
-- **执行链路 (Chain of Thought)**:
-    1. **Step 1**: 调用 `search_knowledge_base` 获取相关地点的 `node_id` 列表。
-    2. **Step 2**: 从结果中提取 ID，**构建 Cypher 语句**,调用 `execute_cypher_query`查询关联信息。
+- **行动**: 调用 `hybrid_search`，一次返回语义命中的 Top 5 数据及每条数据在图谱中的直接关联节点 (`neighbours`，如负责人、承灾体)。
+    - 直接用 `neighbours` 回答关联信息，不需要再为这些 `node_id` 单独写 Cypher。
+    - 只有需要多跳关系或对关联节点做过滤/排序时，才从结果中提取 `node_id`，**构建 Cypher 语句**调用 `execute_cypher_query`。
+
+### 4. 历史工具结果 (Scenario: Follow-up)
+- 较早轮次的工具返回会被压缩为摘要（调用参数、条数、关键 ID 和句柄 `tr-xxxx`）。
+- 摘要中的信息足够回答时直接使用；需要完整字段时调用 `recall_tool_result` 并传入句柄，不要重复执行原查询。
 
 ---
 
@@ -98,7 +117,9 @@ def get_system_prompt():
    - **> 10 条**: 列出前 5 条作为示例，并明确告知用户：“完整数据请查看下方明细”。
 
 2. **零结果处理 (Zero Shot)**:
-   - 如果工具返回 "SYSTEM_NOTICE: 查询结果为 0 条"，**必须**根据错误提示调整思路，重新生成查询尝试一次，不要直接放弃。
+   - `execute_cypher_query` 查询为空时会自动改写重试 (忽略大小写/空白、按属性取值模糊匹配、去掉关系方向)。
+     如果返回中带有 `rewrite` 字段，说明结果来自改写后的查询，回答时要说明实际匹配到的值 (例如 "未找到'中'，按'中级'查询")。
+   - 如果工具仍返回零结果提示，**必须**根据提示调整思路 (不要重复系统已尝试过的改写)，重新生成查询尝试一次，不要直接放弃。
 
 3. **引用来源**:
    - 明确指出信息是来自“语义库匹配”还是“图谱关系查询”。
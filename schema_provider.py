@@ -0,0 +1,192 @@
+# schema_provider.py
+import json
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from config import GRAPH_NAME, SCHEMA_SOURCE, SCHEMA_EXCEL_PATH, SCHEMA_SAMPLE_SIZE
+from db import pooled_connection, data_version
+from schema import GRAPH_SCHEMA, RELATIONSHIPS
+
+# 自动推断 ID 键时的候选属性 (按优先级)
+ID_KEY_CANDIDATES = ("id", "姓名", "单位名称", "编号", "name")
+
+
+@dataclass
+class SchemaSnapshot:
+    schema: Dict[str, dict]            # GRAPH_SCHEMA 格式
+    relationships: List[str]           # RELATIONSHIPS 格式
+    version: str                       # 生成时的数据版本戳
+    source: str                        # live | static
+    dropped: List[str] = field(default_factory=list)   # 覆盖来源中有、图谱中已不存在的标签/关系
+
+
+def _quote_label(label: str) -> str:
+    return "`" + label.replace("`", "``") + "`"
+
+
+def _agtype_value(raw):
+    """agtype 标量文本 (如 '"防御区"') -> Python 值"""
+    try:
+        return json.loads(raw)
+    except (TypeError, ValueError):
+        return raw
+
+
+def introspect_graph(cursor, graph_name: str = GRAPH_NAME, sample_size: int = SCHEMA_SAMPLE_SIZE) -> tuple:
+    """
+    从 ag_catalog 与各标签表读取图谱的实际结构
+
+    - 标签：ag_catalog.ag_label (kind 'v' 为节点，'e' 为关系)
+    - 节点属性：每个标签抽样 sample_size 个节点，取属性键并集
+    - 关系端点：每种关系抽样 sample_size 条，取 (起点标签, 终点标签) 组合
+
+    Args:
+        cursor: 已 LOAD 'age' 并设置 search_path 的游标
+        graph_name (str): 图名
+        sample_size (int): 每个标签的抽样数
+
+    Returns:
+        tuple: (labels {标签: [属性键]}, relationships [(关系名, 起点, 终点)])
+    """
+    cursor.execute(
+        """
+        SELECT l.name, l.kind FROM ag_catalog.ag_label l
+        JOIN ag_catalog.ag_graph g ON l.graph = g.graphid
+        WHERE g.name = %s AND l.name NOT IN ('_ag_label_vertex', '_ag_label_edge')
+        ORDER BY l.id
+        """,
+        (graph_name,),
+    )
+    catalog = cursor.fetchall()
+
+    labels = {}
+    for name, kind in catalog:
+        if kind != "v":
+            continue
+        cursor.execute(f"""
+            SELECT * FROM cypher('{graph_name}', $$
+                MATCH (n:{_quote_label(name)}) WITH n LIMIT {int(sample_size)}
+                UNWIND keys(n) AS k RETURN DISTINCT k
+            $$) as (k agtype);
+        """)
+        labels[name] = sorted(_agtype_value(row[0]) for row in cursor.fetchall())
+
+    relationships = []
+    for name, kind in catalog:
+        if kind != "e":
+            continue
+        cursor.execute(f"""
+            SELECT * FROM cypher('{graph_name}', $$
+                MATCH (a)-[r:{_quote_label(name)}]->(b) WITH a, b LIMIT {int(sample_size)}
+                RETURN DISTINCT label(a), label(b)
+            $$) as (a agtype, b agtype);
+        """)
+        for start, end in cursor.fetchall():
+            relationships.append((name, _agtype_value(start), _agtype_value(end)))
+    return labels, relationships
+
+
+def build_live_schema(labels: Dict[str, List[str]], relationships: List[tuple],
+                      overrides: List[Dict[str, dict]], override_relationships: List[str] = ()) -> tuple:
+    """
+    以实时结构为准合并覆盖来源
+
+    - 标签、属性、关系以图谱实际数据为准 (消除手工 Schema 的漂移)
+    - 覆盖来源 (按顺序，后者优先) 提供标签说明、ID 键、查询键与属性顺序
+    - 覆盖来源中有、图谱中不存在的标签与关系被丢弃并记录
+
+    Args:
+        labels (dict): 实时标签 -> 属性键
+        relationships (list): 实时关系 [(关系名, 起点, 终点)]
+        overrides (list): GRAPH_SCHEMA 格式的覆盖来源列表 (如 [Excel, schema.py])
+        override_relationships (list): 手工维护的关系描述 (用于检查漂移)
+
+    Returns:
+        tuple: (schema, relationships, dropped)
+    """
+    schema = {}
+    for label, keys in labels.items():
+        merged = {}
+        for source in overrides:
+            merged.update({k: v for k, v in source.get(label, {}).items() if k != "properties"})
+        id_key = merged.get("id_key")
+        if id_key not in keys:
+            id_key = next((k for k in ID_KEY_CANDIDATES if k in keys), None)
+        config = {"desc": merged.get("desc", f"{label}实体")}
+        if "query_key" in merged and merged["query_key"] in keys:
+            config["query_key"] = merged["query_key"]
+        if id_key:
+            config["id_key"] = id_key
+
+        # 属性顺序：覆盖来源中的顺序在前，其余按字母序
+        ordered = [p for source in reversed(overrides) for p in source.get(label, {}).get("properties", [])]
+        props = list(dict.fromkeys(p for p in ordered + list(keys) if p in keys and p != id_key))
+        config["properties"] = props
+        schema[label] = config
+
+    rels = [f"{name} ({start} -> {end})" for name, start, end in relationships]
+    dropped = [label for source in overrides for label in source if label not in labels]
+    dropped += [rel for rel in override_relationships if rel not in rels]
+    return schema, rels, list(dict.fromkeys(dropped))
+
+
+def _load_excel_overrides() -> Dict[str, dict]:
+    """读取 Excel 映射表 (未配置或读取失败时为空)"""
+    if not SCHEMA_EXCEL_PATH:
+        return {}
+    try:
+        from scripts.generate_schema_tool import read_schema_from_excel
+        return read_schema_from_excel(SCHEMA_EXCEL_PATH)
+    except Exception as e:
+        print(f"[Schema] ⚠️ 读取 Excel 映射表失败: {e}")
+        return {}
+
+
+_SNAPSHOT: Optional[SchemaSnapshot] = None
+_EXCEL_OVERRIDES: Optional[Dict[str, dict]] = None
+_LOCK = threading.Lock()
+
+
+def _static_snapshot(version: str) -> SchemaSnapshot:
+    return SchemaSnapshot(GRAPH_SCHEMA, RELATIONSHIPS, version, "static")
+
+
+def get_schema() -> SchemaSnapshot:
+    """
+    当前图谱 Schema
+
+    SCHEMA_SOURCE=live 时从 AGE 目录实时读取，按数据版本戳 (db.data_version) 缓存，
+    数据写入 (包括新增标签表) 后下次调用重新读取；读取失败时使用 schema.py 中的静态 Schema。
+
+    Returns:
+        SchemaSnapshot: Schema、关系、版本戳与来源
+    """
+    global _SNAPSHOT, _EXCEL_OVERRIDES
+    if SCHEMA_SOURCE != "live":
+        return _static_snapshot("static")
+    version = data_version()
+    snapshot = _SNAPSHOT
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+
+    with _LOCK:
+        if _SNAPSHOT is not None and _SNAPSHOT.version == version:
+            return _SNAPSHOT
+        if _EXCEL_OVERRIDES is None:
+            _EXCEL_OVERRIDES = _load_excel_overrides()
+        try:
+            with pooled_connection() as conn, conn.cursor() as cursor:
+                labels, relationships = introspect_graph(cursor)
+            if not labels:
+                raise ValueError(f"图 {GRAPH_NAME} 中没有节点标签")
+            schema, rels, dropped = build_live_schema(labels, relationships,
+                                                      [_EXCEL_OVERRIDES, GRAPH_SCHEMA], RELATIONSHIPS)
+            _SNAPSHOT = SchemaSnapshot(schema, rels, version, "live", dropped)
+            print(f"[Schema] ✅ 实时 Schema: {len(schema)} 个标签, {len(rels)} 种关系 (版本 {version})")
+            if dropped:
+                print(f"[Schema] ⚠️ 以下手工定义在图谱中不存在，已忽略: {dropped}")
+        except Exception as e:
+            print(f"[Schema] ⚠️ 读取实时 Schema 失败，使用 schema.py: {e}")
+            _SNAPSHOT = _static_snapshot(version)
+        return _SNAPSHOT
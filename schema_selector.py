@@ -0,0 +1,158 @@
+# schema_selector.py
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from cache import normalize_question
+
+# 关系描述格式: "关系名 (起点标签 -> 终点标签)"
+_REL_RE = re.compile(r"^\s*(\S+)\s*\(\s*(\S+)\s*->\s*(\S+)\s*\)\s*$")
+
+
+def parse_relationship(rel: str):
+    """解析关系描述，返回 (关系名, 起点, 终点)；格式不符时返回 None"""
+    m = _REL_RE.match(rel)
+    return m.groups() if m else None
+
+
+@dataclass
+class SchemaSelection:
+    schema: Dict[str, dict]            # 选中的标签 -> 配置 (属性已裁剪)
+    relationships: List[str]
+    confidence: float
+    full: bool                         # 是否回退为完整 Schema
+    reason: str = ""
+    scores: Dict[str, float] = field(default_factory=dict)
+
+
+class SchemaSelector:
+    """
+    按问题挑选相关的 Schema 子集 (标签、属性、关系)，用于缩短系统提示词
+
+    - 直接命中：问题中出现标签名/属性名，或实体链接命中某标签的实例
+    - 语义命中：问题向量与标签描述 (标签 + 说明 + 属性) 的余弦相似度 >= threshold
+    - 命中标签保留全部属性，经关系扩展进来的相邻标签只保留 ID 键与问题中提到的属性
+    - 没有直接命中且最高相似度 < min_confidence 时回退为完整 Schema
+    - 标签数不超过 full_max_labels 的小图谱直接使用完整 Schema
+    """
+
+    def __init__(self, schema: Dict[str, dict], relationships: List[str],
+                 encoder: Optional[Callable[[List[str]], np.ndarray]] = None,
+                 threshold: float = 0.55, min_confidence: float = 0.6,
+                 full_max_labels: int = 6, cache_size: int = 256):
+        """
+        Args:
+            schema: GRAPH_SCHEMA 格式的完整 Schema
+            relationships: RELATIONSHIPS 格式的关系列表
+            encoder: 文本列表 -> 归一化向量矩阵；为 None 时只使用直接命中
+            threshold: 标签入选的相似度阈值
+            min_confidence: 低于该值 (且无直接命中) 时回退为完整 Schema
+            full_max_labels: 标签数不超过该值时不做裁剪
+            cache_size: 选择结果缓存条数
+        """
+        self.schema = schema
+        self.relationships = relationships
+        self.encoder = encoder
+        self.threshold = threshold
+        self.min_confidence = min_confidence
+        self.full_max_labels = full_max_labels
+        self.cache_size = cache_size
+        self._labels = list(schema)
+        self._label_vectors = None
+        self._cache: "OrderedDict[tuple, SchemaSelection]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _label_text(self, label: str) -> str:
+        config = self.schema[label]
+        props = [config.get("id_key", "")] + list(config.get("properties", []))
+        return f"{label}：{config.get('desc', '')}。属性：{'、'.join(p for p in props if p)}"
+
+    def _vectors(self):
+        """标签描述向量 (首次使用时编码)"""
+        if self._label_vectors is None:
+            self._label_vectors = np.asarray(self.encoder([self._label_text(l) for l in self._labels]),
+                                             dtype="float32")
+        return self._label_vectors
+
+    def full_selection(self, reason: str, confidence: float = 0.0, scores: Dict[str, float] = None) -> SchemaSelection:
+        return SchemaSelection(self.schema, list(self.relationships), confidence, True, reason, scores or {})
+
+    def select(self, question: str, entity_hits: Iterable[str] = ()) -> SchemaSelection:
+        """
+        挑选与问题相关的 Schema 子集
+
+        Args:
+            question (str): 用户问题
+            entity_hits (Iterable[str]): 实体链接命中的标签 (问题中出现了这些标签的实例)
+
+        Returns:
+            SchemaSelection: 选中的子集；回退时 full=True 且包含完整 Schema
+        """
+        if len(self._labels) <= self.full_max_labels:
+            return self.full_selection("标签数较少，使用完整 Schema", 1.0)
+
+        entity_hits = tuple(sorted(set(entity_hits) & set(self._labels)))
+        key = (normalize_question(question), entity_hits)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        selection = self._select(question, entity_hits)
+        with self._lock:
+            self._cache[key] = selection
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return selection
+
+    def _select(self, question: str, entity_hits: tuple) -> SchemaSelection:
+        # 1. 直接命中：标签名、属性名、实体链接
+        direct = set(entity_hits)
+        mentioned_props = set()
+        for label, config in self.schema.items():
+            if label in question:
+                direct.add(label)
+            for prop in config.get("properties", []):
+                if prop and prop in question:
+                    mentioned_props.add(prop)
+                    direct.add(label)
+
+        # 2. 语义命中
+        scores = {}
+        if self.encoder is not None:
+            try:
+                query = np.asarray(self.encoder([question]), dtype="float32")[0]
+                scores = dict(zip(self._labels, (self._vectors() @ query).tolist()))
+            except Exception as e:
+                print(f"[Schema] ⚠️ 向量编码失败，只使用直接命中: {e}")
+        semantic = {label for label, score in scores.items() if score >= self.threshold}
+        confidence = 1.0 if direct else max(scores.values(), default=0.0)
+        if not direct and confidence < self.min_confidence:
+            return self.full_selection(f"置信度 {confidence:.2f} 过低，使用完整 Schema", confidence, scores)
+
+        # 3. 沿关系扩展一跳 (保证问题涉及的路径可以写出来)
+        core = direct | semantic
+        parsed = [(rel, parse_relationship(rel)) for rel in self.relationships]
+        neighbours = set()
+        for _, triple in parsed:
+            if triple and (triple[1] in core or triple[2] in core):
+                neighbours.update(triple[1:])
+        selected = core | (neighbours & set(self._labels))
+
+        # 4. 裁剪属性：核心标签保留全部属性，相邻标签只保留 ID 键与问题中提到的属性
+        subset = {}
+        for label in self._labels:
+            if label not in selected:
+                continue
+            config = dict(self.schema[label])
+            if label not in core:
+                config["properties"] = [p for p in config.get("properties", []) if p in mentioned_props]
+            subset[label] = config
+        rels = [rel for rel, triple in parsed if triple is None or (triple[1] in selected and triple[2] in selected)]
+
+        reason = f"命中 {len(core)} 个标签，扩展后 {len(subset)}/{len(self._labels)} 个"
+        return SchemaSelection(subset, rels, confidence, False, reason, scores)
@@ -13,44 +13,53 @@ COL_DESC = "字段含义"
 COL_TYPE = "字段类型"  # 标记是 ID、Name 还是普通属性
 
 # ================= 核心逻辑 =================
-def generate_schema_code():
-    try:
-        # 1. 读取 Excel
-        df = pd.read_excel(EXCEL_PATH, sheet_name=SHEET_NAME)
-        
-        # 填充空值，防止报错
-        df.fillna("", inplace=True)
-        
-        schema_dict = {}
+def read_schema_from_excel(excel_path=EXCEL_PATH, sheet_name=SHEET_NAME):
+    """
+    读取 Excel 映射表，返回 GRAPH_SCHEMA 格式的字典
+    (schema_provider.py 也用它把 Excel 作为实时 Schema 的覆盖来源)
+    """
+    # 1. 读取 Excel
+    df = pd.read_excel(excel_path, sheet_name=sheet_name)
+    
+    # 填充空值，防止报错
+    df.fillna("", inplace=True)
+    
+    schema_dict = {}
 
-        # 2. 遍历每一行数据
-        for _, row in df.iterrows():
-            label = str(row[COL_LABEL]).strip()
-            prop = str(row[COL_PROP]).strip()
-            desc = str(row[COL_DESC]).strip()
-            p_type = str(row[COL_TYPE]).strip().lower()
+    # 2. 遍历每一行数据
+    for _, row in df.iterrows():
+        label = str(row[COL_LABEL]).strip()
+        prop = str(row[COL_PROP]).strip()
+        desc = str(row[COL_DESC]).strip()
+        p_type = str(row[COL_TYPE]).strip().lower()
 
-            # 如果这个 label 还没处理过，初始化结构
-            if label not in schema_dict:
-                schema_dict[label] = {
-                    "desc": f"{label}实体", # 默认描述，稍后可手动优化
-                    "query_key": "姓名",    # 默认兜底
-                    "properties": []
-                }
+        # 如果这个 label 还没处理过，初始化结构
+        if label not in schema_dict:
+            schema_dict[label] = {
+                "desc": f"{label}实体", # 默认描述，稍后可手动优化
+                "query_key": "姓名",    # 默认兜底
+                "properties": []
+            }
 
-            # 3. 根据类型填充 schema
-            if p_type == "id":
-                schema_dict[label]["id_key"] = prop
-            elif p_type == "name":
-                schema_dict[label]["query_key"] = prop
-            else:
-                # 普通属性加入列表
-                if prop: # 防止空行
-                    schema_dict[label]["properties"].append(prop)
-                    
-            # (可选) 如果这一行是对节点的整体描述，可以覆盖 desc
-            # if p_type == "entity_desc":
-            #     schema_dict[label]["desc"] = desc
+        # 3. 根据类型填充 schema
+        if p_type == "id":
+            schema_dict[label]["id_key"] = prop
+        elif p_type == "name":
+            schema_dict[label]["query_key"] = prop
+        else:
+            # 普通属性加入列表
+            if prop: # 防止空行
+                schema_dict[label]["properties"].append(prop)
+                
+        # (可选) 如果这一行是对节点的整体描述，可以覆盖 desc
+        # if p_type == "entity_desc":
+        #     schema_dict[label]["desc"] = desc
+    return schema_dict
+
+
+def generate_schema_code():
+    try:
+        schema_dict = read_schema_from_excel()
 
         # 4. 生成 Python 代码字符串
         # 我们不直接 dump JSON，因为生成的 Python 代码需要在 schema.py 里被引用
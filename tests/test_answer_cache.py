@@ -0,0 +1,82 @@
+"""
+单元测试：cache.py 中的语义答案缓存
+
+测试覆盖：
+- 规范化后相同的问题直接命中，近似问题按相似度与虚词差异命中
+- 实体/编号不同、或字符相同但顺序不同 (主客体互换) 的问题不命中
+- 依赖上下文的问题不缓存
+- 数据版本变化后失效，超出容量按最近最少使用淘汰
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from cache import SemanticAnswerCache, lexically_compatible, normalize_question
+
+
+def char_encoder(texts):
+    """按字符哈希的词袋向量 (归一化)，用于替代 bge 模型"""
+    vectors = np.zeros((len(texts), 256), dtype="float32")
+    for i, text in enumerate(texts):
+        for ch in normalize_question(text):
+            vectors[i, hash(ch) % 256] += 1
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_cache(**kwargs):
+    kwargs.setdefault("threshold", 0.8)
+    return SemanticAnswerCache(char_encoder, **kwargs)
+
+
+def test_exact_and_near_duplicate_hits():
+    cache = make_cache()
+    cache.store("哪些防御区风险等级是中级？", "A、B", [{"name": "execute_cypher_query", "content": "[]"}])
+    hit = cache.lookup("哪些防御区风险等级是中级")
+    assert hit.similarity == 1.0 and hit.answer == "A、B"
+    hit = cache.lookup("请问哪些防御区的风险等级是中级呢")
+    assert hit is not None and hit.question == "哪些防御区风险等级是中级？"
+    assert cache.stats()["hits"] == 2
+
+
+def test_different_entities_do_not_hit():
+    cache = make_cache(threshold=0.5)
+    cache.store("哪些防御区风险等级是中级？", "A", [])
+    cache.store("441323103033546防御区是谁核查的？", "张三", [])
+    assert cache.lookup("哪些防御区风险等级是高级？") is None
+    assert cache.lookup("441323103033547防御区是谁核查的？") is None
+    assert not lexically_compatible("承灾体里威胁财产最多的前5个", "承灾体里威胁财产最多的前10个")
+
+
+def test_swapped_entities_not_compatible():
+    """字符相同但顺序不同 (主客体互换) 的问题不复用答案"""
+    assert not lexically_compatible("北区是否属于南区", "南区是否属于北区")
+    assert not lexically_compatible("河流A流经的防御区", "防御区流经的河流A")
+    assert lexically_compatible("请问哪些防御区风险等级是中级？", "防御区风险等级是中级的有哪些")
+
+
+def test_context_dependent_questions_skipped():
+    cache = make_cache()
+    cache.store("它的负责人是谁", "张三", [])
+    assert cache.stats()["entries"] == 0
+    cache.store("防御区A的负责人是谁", "张三", [])
+    assert cache.lookup("它的负责人是谁") is None
+
+
+def test_version_invalidation_and_lru():
+    version = {"value": "v1"}
+    cache = make_cache(max_entries=2, version_provider=lambda: version["value"])
+    cache.store("问题一", "1", [])
+    assert cache.lookup("问题一") is not None
+    version["value"] = "v2"
+    assert cache.lookup("问题一") is None
+
+    cache.store("问题二", "2", [])   # 写入时清理旧版本记录
+    cache.store("问题三", "3", [])
+    cache.lookup("问题二")
+    cache.store("问题四", "4", [])   # 淘汰最近最少使用的 "问题三"
+    assert cache.stats()["entries"] == 2
+    assert cache.lookup("问题三") is None and cache.lookup("问题二").answer == "2"
@@ -0,0 +1,104 @@
+"""
+单元测试：cypher_fallback.py 中的零结果自动改写
+
+测试覆盖：
+- 提取 WHERE 等值条件与节点属性 Map，并改写为 WHERE 条件
+- 取值字典的规范化/包含/相似匹配；编号类条件只做规范化后相等的匹配
+- 规范化改写在 Cypher 侧与 normalize_value 一致 (忽略任意空白)
+- 改写按顺序执行，返回第一个非空结果及改写说明
+- 全部为空时记录已尝试的改写
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import re
+
+from cypher_fallback import (FallbackLadder, ValueDictionary, is_identifier, lift_predicates, match_values,
+                             normalized_pattern, relax_directions, render)
+
+
+def test_lift_predicates():
+    template, preds = lift_predicates("MATCH (p:核查人 {姓名: '朱炳湖'})-[r:核查]->(d:防御区) RETURN {node: d}")
+    assert render(template, ["COND"]) == "MATCH (p:核查人)-[r:核查]->(d:防御区) WHERE COND RETURN {node: d}"
+    assert [(p.var, p.key, p.value, p.label) for p in preds] == [("p", "姓名", "朱炳湖", "核查人")]
+
+    # 已有 WHERE：原表达式加括号；匿名节点补变量名；数字字面量
+    template, preds = lift_predicates("MATCH (:防御区 {id: 123})<-[r:核查]-(p) WHERE p.a IS NULL OR p.b = 'x' RETURN p")
+    assert render(template, ["C0", "C1"]) == \
+        "MATCH (_fb0:防御区)<-[r:核查]-(p) WHERE C1 AND ( p.a IS NULL OR C0 ) RETURN p"
+    assert [(p.var, p.value) for p in preds] == [("p", "x"), ("_fb0", 123)]
+
+    # 含参数的 Map 不改写
+    assert lift_predicates("MATCH (n:核查人 {姓名: $name}) RETURN n")[1] == []
+    assert relax_directions("MATCH (a)-[r:X]->(b)<-[s:Y]-(c) RETURN a") == "MATCH (a)-[r:X]-(b)-[s:Y]-(c) RETURN a"
+
+
+def test_match_values():
+    values = ["中级", "高级", "朱炳湖", "441323103033546"]
+    assert match_values(" 朱炳湖", values) == ["朱炳湖"]
+    assert match_values("中", values) == ["中级"]
+    assert match_values("朱柄湖", values) == ["朱炳湖"]
+    assert match_values(441323103033546, values) == ["441323103033546"]
+    assert match_values("完全无关", values) == []
+    assert match_values("441323103033547", values, exact=True) == []
+    assert match_values(" 441323103033546", values, exact=True) == ["441323103033546"]
+
+
+def test_identifier_and_normalized_pattern():
+    assert is_identifier("ysfyqtybh", "A01") and is_identifier("统一编号", "x") and is_identifier("id", "x")
+    assert is_identifier("姓名", "330104001") and is_identifier("面积", 12.5)
+    assert not is_identifier("姓名", "朱炳湖") and not is_identifier("风险等级", "中")
+
+    pattern = normalized_pattern("朱炳湖 A")
+    assert re.fullmatch(pattern, "朱　炳湖\ta") and re.fullmatch(pattern, " 朱炳湖a ")
+    assert not re.fullmatch(pattern, "朱炳湖ab")
+
+
+def test_ladder_returns_first_hit():
+    executed = []
+
+    def run_query(cypher):
+        executed.append(cypher)
+        if "RETURN DISTINCT" in cypher:
+            return ["中级", "高级"]
+        return [{"id": 1}] if "IN ['中级']" in cypher else []
+
+    ladder = FallbackLadder(run_query, ValueDictionary(run_query))
+    result = ladder.retry("MATCH (d:防御区) WHERE d.风险等级 = '中' RETURN {node: d}")
+    assert result.rows == [{"id": 1}]
+    assert result.rewrite["step"] == "dictionary"
+    assert result.rewrite["cypher"] == "MATCH (d:防御区) WHERE d.风险等级 IN ['中级'] RETURN {node: d}"
+    assert result.tried == ["属性值忽略大小写与空白"]
+    assert "toLower" in executed[0]
+
+    # 取值字典已缓存
+    ladder.retry("MATCH (d:防御区) WHERE d.风险等级 = '中' RETURN {node: d}")
+    assert sum("RETURN DISTINCT" in c for c in executed) == 1
+
+
+def test_ladder_all_empty():
+    ladder = FallbackLadder(lambda cypher: [])
+    result = ladder.retry("MATCH (p:核查人 {姓名: '张三'})-[r:核查]->(d) RETURN d")
+    assert result.rows == [] and result.rewrite is None
+    assert len(result.tried) == 3
+    assert "CONTAINS" in result.tried[1] and "张三" in result.tried_note()
+
+
+def test_ladder_keeps_identifiers_exact():
+    executed = []
+
+    def run_query(cypher):
+        executed.append(cypher)
+        if "RETURN DISTINCT" in cypher:
+            return ["330104002", "3301040011", "A-330104001"]
+        return []
+
+    ladder = FallbackLadder(run_query, ValueDictionary(run_query))
+    result = ladder.retry("MATCH (d:防御区) WHERE d.ysfyqtybh = '330104001' AND d.名称 = 'x' RETURN d")
+    assert result.rows == [] and "ysfyqtybh 为编号" in result.tried[1]
+    rewritten = executed[-1]
+    assert "'330104002'" not in rewritten and "CONTAINS '330104001'" not in rewritten
+    assert "d.ysfyqtybh)) =~ '^\\\\s*3\\\\s*3" in rewritten and "d.名称) CONTAINS 'x'" in rewritten
@@ -0,0 +1,69 @@
+"""
+单元测试：entity_linker.py 中的实体链接
+
+测试覆盖：
+- Aho-Corasick 自动机找出全部重叠模式
+- 问题中的人名、编号、单位名 (含空白) 精确命中，编号不在更长的数字串中误命中
+- 长编号允许 1 位错漏
+- 从图谱读取实体并增量刷新
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from entity_linker import (AhoCorasick, Entity, EntityIndex, EntityLinker, format_entity_hints)
+
+ENTITIES = [
+    Entity("核查人", "姓名", "朱炳湖", 1),
+    Entity("防御区", "id", "441323103033546", 2),
+    Entity("核查单位", "单位名称", "惠州市地质局", 3),
+    Entity("核查人", "姓名", "李", 4),
+]
+
+
+def test_aho_corasick():
+    ac = AhoCorasick({tuple("he"): "he", tuple("she"): "she", tuple("hers"): "hers"})
+    assert sorted(ac.search("ushers")) == [(1, 4, "she"), (2, 4, "he"), (2, 6, "hers")]
+
+
+def test_link_exact_and_fuzzy():
+    index = EntityIndex(ENTITIES)
+    assert len(index) == 3   # 单字人名不参与链接
+
+    matches = index.link("朱炳湖负责的防御区里，441323103033546 归 惠州市 地质局 管吗")
+    assert [(m.text, m.how) for m in matches] == [
+        ("朱炳湖", "exact"), ("441323103033546", "exact"), ("惠州市 地质局", "exact")]
+    assert matches[0].entities == [ENTITIES[0]]
+
+    assert index.link("12441323103033546") == []
+    fuzzy = index.link("441323103033547防御区是谁核查的")
+    assert fuzzy[0].how == "fuzzy" and fuzzy[0].entities[0].value == "441323103033546"
+
+    hints = format_entity_hints(matches[:1])
+    assert "「朱炳湖」→ :核查人 {姓名: '朱炳湖'} (id(n) = 1)" in hints
+
+
+def test_linker_incremental_refresh():
+    graph = {"核查人": [{"gid": 1, "value": "朱炳湖"}]}
+    queries = []
+
+    def run_query(cypher):
+        queries.append(cypher)
+        after = int(cypher.split("id(n) > ")[1].split()[0])
+        label = "核查人" if "核查人" in cypher else "防御区"
+        return [row for row in graph.get(label, []) if row["gid"] > after]
+
+    class Snapshot:
+        schema = {"核查人": {"id_key": "姓名"}, "防御区": {"id_key": "id"}}
+
+    version = {"value": "v1"}
+    linker = EntityLinker(run_query, lambda: Snapshot, lambda: version["value"])
+    assert [m.text for m in linker.link("朱炳湖和张三丰")] == ["朱炳湖"]
+    assert linker.refresh() == "无需刷新"
+
+    graph["核查人"].append({"gid": 2, "value": "张三丰"})
+    version["value"] = "v2"
+    assert [m.text for m in linker.link("朱炳湖和张三丰")] == ["朱炳湖", "张三丰"]
+    assert "id(n) > 1" in queries[-2]
@@ -0,0 +1,422 @@
+"""
+单元测试：etl/etl_engine.py 中的 ETLEngine
+
+测试覆盖：
+- 向量化执行与逐行执行结果一致
+- 主键生成 (direct / md5)
+- 类型转换、字段求和、嵌套属性
+- 动态关系与 merge_relation 去重
+- 读取图层时的列裁剪下推
+- 流式分批读取 (转换出错时抛出，仅图层读取失败时跳过)
+- 基于哈希索引的关系合并
+- 执行计划与多进程并行执行 (读取后续图层前交付已完成的映射)
+- 几何整列编码：精度、简化、WKB
+- 基于 STRtree 的空间关系
+"""
+
+import os
+import time
+import sys
+
+# 添加 etl 目录到路径 (etl 内模块使用同级导入)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'etl'))
+
+import numpy as np
+import geopandas as gpd
+import pytest
+import shapely
+from shapely.geometry import Point, box
+
+from etl_engine import ETLEngine, EntityMerger
+from etl_plan import GeometryEncoding, compile_key_rule, compile_mapping
+from etl_benchmark import (make_synthetic_layers, make_engine, write_synthetic_gdb, make_fanout_records,
+                           _merge_linear, make_detailed_polygons, DEFAULT_CONFIG)
+
+
+@pytest.fixture
+def layers():
+    """合成的防御区/承灾体图层"""
+    return make_synthetic_layers(300)
+
+
+@pytest.fixture
+def mixed_layer():
+    """包含缺失值、非法值和字符串数值的承灾体图层"""
+    return gpd.GeoDataFrame({
+        'id': ['A1', 'A2', 'A3', 'A4'],
+        'jzmj': ['12.5', None, 'abc', 30],
+        'ysfyqtybh': ['Z1', '', None, 'Z2'],
+        'lxr': ['张三', '张三', '李四', None],
+        'lxfs': ['1', '1', '2', None],
+        'nljg1': [1, 2, 3, 4],
+        'nljg2': ['2', 'x', None, 1.9],
+        'nljg3': [np.nan, 1.0, 2.0, 3.0],
+        'sffzijgtw': [0, 1, '0', None],
+        'geometry': [Point(0, 0), None, Point(1, 1), Point(2, 2)]
+    })
+
+
+class TestVectorizedExecution:
+    """测试向量化执行与逐行执行的一致性"""
+
+    def test_synthetic_layers_identical(self, layers):
+        """合成图层上两种执行方式结果完全一致"""
+        row_results = make_engine(layers, vectorized=False).run()
+        vec_results = make_engine(layers, vectorized=True).run()
+        assert row_results == vec_results
+
+    def test_mixed_types_identical(self, mixed_layer):
+        """混合类型列走逐个回退路径，结果仍然一致"""
+        layers = {'承灾体': mixed_layer, '防御区': gpd.GeoDataFrame()}
+        row_results = make_engine(layers, vectorized=False).run()
+        vec_results = make_engine(layers, vectorized=True).run()
+        assert row_results == vec_results
+
+    def test_md5_key_generation(self, mixed_layer):
+        """md5 多字段主键与逐行实现一致"""
+        engine = ETLEngine(DEFAULT_CONFIG)
+        key_rule = {'fields': ['lxr', 'lxfs'], 'prefix': 'family_', 'method': 'md5'}
+        expected = [engine._generate_key(row.to_dict(), key_rule) for _, row in mixed_layer.iterrows()]
+        assert engine._generate_keys(mixed_layer, compile_key_rule(key_rule)) == expected
+
+    def test_calc_sum_ignores_invalid(self, mixed_layer):
+        """字段求和忽略非法值与缺失值"""
+        engine = ETLEngine(DEFAULT_CONFIG)
+        totals = engine._calc_sum_columns(mixed_layer, ['nljg1', 'nljg2', 'nljg3', 'missing'])
+        assert totals == [3, 3, 5, 8]
+
+    def test_dynamic_relation(self, mixed_layer):
+        """动态关系按规则顺序匹配，外键为空时不生成关系"""
+        engine = ETLEngine(DEFAULT_CONFIG)
+        plan = compile_mapping('Household_Mapping', engine.config['Household_Mapping'])
+        rels = engine._process_relationships_frame(mixed_layer, plan.relationships)
+        assert [r[0]['relation'] for r in rels] == ['拥有', '居住于', '居住于', '居住于']
+        assert rels[0][0]['target_id'] == 'A1'
+
+    def test_merge_relation(self, mixed_layer):
+        """merge_relation 策略下同一户只保留一个实体并合并关系"""
+        layers = {'承灾体': mixed_layer, '防御区': gpd.GeoDataFrame()}
+        result = make_engine(layers).run()['Household_Mapping']
+        assert len(result['entities']) == 3
+        first = result['entities'][0]
+        assert [r['target_id'] for r in first['relationships']] == ['A1', 'A2']
+
+
+class TestColumnProjection:
+    """测试读取 GDB 图层时的列裁剪"""
+
+    def test_layer_projection_union(self):
+        """共享图层的多个映射合并所需字段，无 wkt 属性时跳过几何"""
+        engine = ETLEngine(DEFAULT_CONFIG)
+        columns, needs_geometry = engine._layer_projection('承灾体')
+        assert columns == sorted(['id', 'jzmj', 'ysfyqtybh', 'lxr', 'lxfs',
+                                  'nljg1', 'nljg2', 'nljg3', 'sffzijgtw'])
+        assert needs_geometry is False
+
+    def test_geometry_required_for_wkt(self):
+        """存在 dtype: wkt 属性的图层需要读取几何"""
+        engine = ETLEngine(DEFAULT_CONFIG)
+        columns, needs_geometry = engine._layer_projection('防御区')
+        assert columns == ['fyqdj', 'tybh', 'xppd']
+        assert needs_geometry is True
+
+    def test_projected_read_matches_full_read(self, layers, tmp_path):
+        """列裁剪读取只包含引用字段，且 ETL 结果与全量读取一致"""
+        gdb_path = str(tmp_path / 'synthetic.gdb')
+        write_synthetic_gdb(layers, gdb_path, extra_columns=5)
+
+        outputs = []
+        for projection in (False, True):
+            engine = ETLEngine(DEFAULT_CONFIG, projection=projection)
+            engine.gdb_path = gdb_path
+            outputs.append(engine.run())
+
+        projected = engine.gdf_cache['承灾体']
+        assert 'extra_0' not in projected.columns
+        assert 'geometry' not in projected.columns
+        assert outputs[0] == outputs[1]
+
+
+class TestStreamingRun:
+    """测试流式分批执行"""
+
+    @pytest.fixture
+    def gdb_path(self, layers, tmp_path):
+        path = str(tmp_path / 'synthetic.gdb')
+        write_synthetic_gdb(layers, path)
+        return path
+
+    def test_streaming_matches_full_run(self, gdb_path):
+        """小批次流式执行与整层读取结果一致 (含跨批次的 merge_relation 合并)"""
+        full_engine = ETLEngine(DEFAULT_CONFIG)
+        full_engine.gdb_path = gdb_path
+        stream_engine = ETLEngine(DEFAULT_CONFIG)
+        stream_engine.gdb_path = gdb_path
+
+        assert stream_engine.run(stream=True, batch_size=37) == full_engine.run()
+
+    def test_streaming_does_not_cache_layers(self, gdb_path):
+        """流式模式读完即丢弃批次，不缓存整层数据"""
+        engine = ETLEngine(DEFAULT_CONFIG)
+        engine.gdb_path = gdb_path
+        engine.run(stream=True, batch_size=50)
+        assert engine.gdf_cache == {}
+
+    def test_batches_bounded_by_batch_size(self, gdb_path):
+        """每批要素数不超过 batch_size"""
+        engine = ETLEngine(DEFAULT_CONFIG)
+        engine.gdb_path = gdb_path
+        sizes = [len(b) for b in engine._iter_layer_batches('承灾体', 64)]
+        assert max(sizes) <= 64
+        assert sum(sizes) == 300
+
+    def test_streaming_on_result_without_keeping(self, gdb_path):
+        """流式模式同样按映射回调，keep_results=False 时返回值只保留数量"""
+        expected = ETLEngine(DEFAULT_CONFIG)
+        expected.gdb_path = gdb_path
+        expected = expected.run()
+
+        engine = ETLEngine(DEFAULT_CONFIG)
+        engine.gdb_path = gdb_path
+        received = {}
+        results = engine.run(stream=True, batch_size=37, keep_results=False,
+                             on_result=lambda key, result: received.update({key: result}))
+
+        assert received == expected
+        assert all('entities' not in r and r['entity_count'] == len(expected[k]['entities'])
+                   for k, r in results.items())
+
+    def test_transform_error_not_swallowed(self, gdb_path, monkeypatch):
+        """转换/写出出错时直接抛出，不当作图层读取失败跳过"""
+        engine = ETLEngine(DEFAULT_CONFIG)
+        engine.gdb_path = gdb_path
+
+        def broken_transform(batch, plan):
+            raise RuntimeError("transform bug")
+
+        monkeypatch.setattr(engine, '_transform', broken_transform)
+        with pytest.raises(RuntimeError, match="transform bug"):
+            engine.run(stream=True, batch_size=50)
+
+    def test_missing_layer_skipped(self, gdb_path, monkeypatch):
+        """图层无法读取时跳过该图层，其他映射照常输出"""
+        engine = ETLEngine(DEFAULT_CONFIG)
+        engine.gdb_path = gdb_path
+        read = engine._iter_layer_batches
+
+        def iter_batches(layer_name, batch_size):
+            if layer_name == '承灾体':
+                raise OSError("layer not found")
+            yield from read(layer_name, batch_size)
+
+        monkeypatch.setattr(engine, '_iter_layer_batches', iter_batches)
+        results = engine.run(stream=True, batch_size=50)
+        assert results['ElementAtRisk_Mapping']['entities'] == []
+        assert len(results['DefenseZone_Mapping']['entities']) > 0
+
+
+class TestEntityMerger:
+    """测试 merge_relation 关系合并"""
+
+    def test_matches_linear_merge(self):
+        """哈希索引合并与原线性比对结果一致 (含重复关系)"""
+        records = make_fanout_records(2000, 200)
+        merger = EntityMerger('受灾家庭', 'merge_relation')
+        merger.add_records(records)
+        assert merger.to_list() == _merge_linear(records, '受灾家庭')
+
+    def test_sharded_merge_matches_sequential(self):
+        """按批次/工作进程分片后再 merge，结果与顺序合并一致"""
+        records = make_fanout_records(1000, 100)
+        sequential = EntityMerger('受灾家庭', 'merge_relation')
+        sequential.add_records(records)
+
+        merged = EntityMerger('受灾家庭', 'merge_relation')
+        for start in range(0, len(records), 300):
+            partial = EntityMerger('受灾家庭', 'merge_relation')
+            partial.add_records(records[start:start + 300])
+            merged.merge(partial)
+        assert merged.to_list() == sequential.to_list()
+
+    def test_default_policy_last_wins(self):
+        """默认策略下重复主键后者覆盖前者，保持首次出现的位置"""
+        merger = EntityMerger('承灾体')
+        merger.add('a', {'v': 1}, [])
+        merger.add('b', {'v': 2}, [])
+        merger.add('a', {'v': 3}, [])
+        assert [(e['id'], e['attributes']['v']) for e in merger.to_list()] == [('a', 3), ('b', 2)]
+
+
+class TestParallelRun:
+    """测试执行计划与并行执行"""
+
+    def test_build_plan_groups_shared_layers(self):
+        """共享图层的映射归入同一图层，每个图层只读一次"""
+        plan = ETLEngine(DEFAULT_CONFIG).build_plan()
+        assert plan['layers'] == {
+            '防御区': ['DefenseZone_Mapping'],
+            '承灾体': ['ElementAtRisk_Mapping', 'Household_Mapping']
+        }
+        assert plan['dependencies']['Household_Mapping'] == ['承灾体']
+
+    def test_parallel_matches_sequential(self, layers):
+        """进程池执行结果与顺序执行一致，并逐个回调写出"""
+        finished = []
+        parallel_engine = make_engine(layers)
+        parallel = parallel_engine.run(workers=2, on_result=lambda name, data: finished.append(name))
+
+        assert parallel == make_engine(layers).run(workers=1)
+        assert sorted(finished) == sorted(parallel)
+        assert set(parallel_engine.timings) == set(parallel)
+
+    def test_parallel_delivers_between_layer_reads(self, layers, tmp_path):
+        """已完成的映射在读取后续图层前就回调，不等全部图层读完"""
+        import yaml
+        with open(DEFAULT_CONFIG, encoding='utf-8') as f:
+            config = yaml.safe_load(f)
+        config['ZoneCopy_Mapping'] = dict(config['DefenseZone_Mapping'], source_layer='防御区副本')
+        config_path = tmp_path / 'config.yaml'
+        config_path.write_text(yaml.safe_dump(config, allow_unicode=True), encoding='utf-8')
+
+        events = []
+        engine = make_engine(dict(layers, 防御区副本=layers['防御区']), str(config_path))
+        read = engine._read_gdb_layer
+
+        def slow_read(layer_name):
+            events.append(('read', layer_name))
+            if layer_name == '承灾体':
+                time.sleep(2)   # 读取期间防御区映射在工作进程中完成
+            return read(layer_name)
+
+        engine._read_gdb_layer = slow_read
+        engine.run(workers=2, on_result=lambda name, data: events.append(('done', name)))
+        assert events.index(('done', 'DefenseZone_Mapping')) < events.index(('read', '防御区副本'))
+
+class TestGeometryEncoding:
+    """测试几何属性的整列编码选项"""
+
+    @staticmethod
+    def zone_attr(engine, **options):
+        attr = next(a for a in engine.config['DefenseZone_Mapping']['attributes'] if a['target'] == '空间位置')
+        attr.update(options)
+        return attr
+
+    def test_options_identical_between_modes(self, layers):
+        """精度与简化选项在逐行和向量化模式下结果一致"""
+        results = []
+        for vectorized in (False, True):
+            engine = make_engine(layers, vectorized=vectorized)
+            self.zone_attr(engine, precision=3, simplify=0.001)
+            results.append(engine.run())
+        assert results[0] == results[1]
+
+    def test_precision_rounds_coordinates(self):
+        """precision 控制 WKT 小数位数"""
+        engine = ETLEngine(DEFAULT_CONFIG)
+        geoms = np.array([Point(114.123456789, 22.987654321), None], dtype=object)
+        encoded = engine._encode_geometries(geoms, GeometryEncoding('wkt', precision=4))
+        assert encoded.tolist() == ['POINT (114.1235 22.9877)', None]
+
+    def test_simplify_reduces_vertices(self):
+        """简化后坐标数减少且几何仍然有效"""
+        engine = ETLEngine(DEFAULT_CONFIG)
+        geoms = make_detailed_polygons(10)
+        encoded = engine._encode_geometries(geoms, GeometryEncoding('wkt', simplify=0.001))
+        simplified = shapely.from_wkt(encoded.tolist())
+        assert (shapely.get_num_coordinates(simplified) < shapely.get_num_coordinates(geoms)).all()
+        assert shapely.is_valid(simplified).all()
+
+    def test_wkb_hex_round_trip(self, layers, tmp_path):
+        """wkb 输出为十六进制字符串，Parquet 输出时解码为二进制几何列"""
+        engine = make_engine(layers)
+        self.zone_attr(engine, dtype='wkb', precision=6)
+        data = engine.run()['DefenseZone_Mapping']
+        value = data['entities'][0]['attributes']['空间位置']
+        expected = shapely.transform(layers['防御区'].geometry.iloc[0], lambda c: np.round(c, 6))
+        assert shapely.from_wkb(value).equals_exact(expected, 0)
+
+        engine.config['global_config']['output'] = {'format': 'parquet'}
+        with engine.open_sink('DefenseZone_Mapping', str(tmp_path)) as sink:
+            sink.write_many(data['entities'])
+        gdf = gpd.read_parquet(sink.path)
+        assert gdf.geometry.name == '空间位置'
+        assert gdf.geometry.iloc[0].equals_exact(expected, 0)
+
+
+SPATIAL_REL = {'relation': '位于', 'target_type': '防御区', 'spatial': 'within', 'target_layer': '防御区',
+               'target_key_field': 'tybh', 'target_key_prefix': 'zone_', 'fallback': True}
+
+
+class TestSpatialRelationships:
+    """测试空间关系"""
+
+    @pytest.fixture
+    def spatial_layers(self):
+        """两个相邻防御区与若干承灾体，部分承灾体缺少外键"""
+        zones = gpd.GeoDataFrame({
+            'tybh': ['Z1', 'Z2'], 'fyqdj': ['低', '高'], 'xppd': [1.0, 2.0],
+            'geometry': [box(0, 0, 1, 1), box(1, 0, 2, 1)]
+        })
+        elements = gpd.GeoDataFrame({
+            'id': ['A1', 'A2', 'A3', 'A4', 'A5'],
+            'ysfyqtybh': ['Z1', '', '', '', ''],
+            'lxr': ['张三'] * 5, 'lxfs': ['1'] * 5, 'sffzijgtw': [0] * 5,
+            'geometry': [Point(1.5, 0.5), Point(0.5, 0.5), Point(1.5, 0.5), Point(5, 5), None]
+        })
+        return {'防御区': zones, '承灾体': elements}
+
+    @staticmethod
+    def spatial_engine(layers, vectorized=True, **rel_options):
+        engine = make_engine(layers, vectorized=vectorized)
+        engine.config['ElementAtRisk_Mapping']['relationships'].append(dict(SPATIAL_REL, **rel_options))
+        return engine
+
+    @staticmethod
+    def targets(result):
+        return {e['id']: [r['target_id'] for r in e['relationships']]
+                for e in result['ElementAtRisk_Mapping']['entities']}
+
+    def test_within_fallback(self, spatial_layers):
+        """缺少外键的承灾体按所在多边形关联，已有外键的不重复关联"""
+        result = self.spatial_engine(spatial_layers).run()
+        assert self.targets(result) == {
+            'elem_A1': ['zone_Z1'], 'elem_A2': ['zone_Z1'], 'elem_A3': ['zone_Z2'],
+            'elem_A4': [], 'elem_A5': []
+        }
+
+    def test_row_mode_identical(self, spatial_layers):
+        """逐行模式与向量化模式结果一致"""
+        for options in ({}, {'spatial': 'nearest', 'max_distance': 10, 'fallback': False}):
+            row = self.spatial_engine(spatial_layers, vectorized=False, **options).run()
+            vec = self.spatial_engine(spatial_layers, vectorized=True, **options).run()
+            assert row == vec
+
+    def test_nearest_max_distance(self, spatial_layers):
+        """nearest 只关联最大距离内的目标"""
+        result = self.spatial_engine(spatial_layers, spatial='nearest', max_distance=1.0).run()
+        targets = self.targets(result)
+        assert targets['elem_A2'] == ['zone_Z1']
+        assert targets['elem_A4'] == []
+
+    def test_intersects_multiple_targets(self, spatial_layers):
+        """位于边界上的点与两侧多边形都相交，按目标图层顺序输出"""
+        spatial_layers['承灾体'].loc[1, 'geometry'] = Point(1, 0.5)
+        result = self.spatial_engine(spatial_layers, spatial='intersects').run()
+        assert self.targets(result)['elem_A2'] == ['zone_Z1', 'zone_Z2']
+
+    def test_plan_and_projection_include_target_layer(self):
+        """空间关系使映射依赖目标图层，并读取目标主键字段与双方几何"""
+        engine = ETLEngine(DEFAULT_CONFIG)
+        engine.config['ElementAtRisk_Mapping']['relationships'].append(dict(SPATIAL_REL))
+        assert engine.build_plan()['dependencies']['ElementAtRisk_Mapping'] == ['承灾体', '防御区']
+        assert engine._layer_projection('承灾体')[1] is True
+        assert 'tybh' in engine._layer_projection('防御区')[0]
+
+    def test_unknown_predicate(self, spatial_layers):
+        """未知的空间关系抛出 ValueError"""
+        with pytest.raises(ValueError):
+            self.spatial_engine(spatial_layers, spatial='touches').run()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "--tb=short"])
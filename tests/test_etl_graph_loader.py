@@ -0,0 +1,229 @@
+"""
+单元测试：etl/etl_graph_loader.py 中的 AGEBulkLoader
+
+测试覆盖：
+- graphid 布局
+- 标签按需创建
+- 点/边分批 COPY，target_id 通过主键映射解析
+- 目标点不在本次加载中时从已有标签表解析
+- 加载后建立索引与吞吐统计
+- 应用增量变更集：删除、原地更新、新增
+- 读取导出目录：json / jsonl / parquet (几何转回 WKT)，无法识别的文件报错
+"""
+
+import os
+import sys
+import csv
+import io
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+# 添加项目根目录与 etl 目录到路径
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, 'etl'))
+os.environ.setdefault('DASHSCOPE_API_KEY', 'test-key')
+
+import pytest
+
+from etl_graph_loader import AGEBulkLoader, make_graphid, read_results, KEY_PROPERTY
+from etl_sinks import open_sink
+
+
+class FakeAGECursor:
+    """模拟 AGE 目录与序列的游标，记录执行的 SQL 与 COPY 内容"""
+
+    def __init__(self, existing_vertices=None):
+        self.labels = {}  # 标签 -> (id, 序列名)
+        self.sequences = {}
+        self.executed = []
+        self.copies = {}  # 表名 -> 行列表
+        self.existing_vertices = existing_vertices or {}  # 标签 -> [(graphid, key)]
+        self._result = []
+        self.connection = SimpleNamespace(encoding='UTF8')
+
+    def mogrify(self, template, args):
+        return repr(tuple(args)).encode('utf-8')
+
+    def execute(self, sql, params=None):
+        if isinstance(sql, bytes):
+            sql = sql.decode('utf-8')
+        self.executed.append((sql, params))
+        if 'FROM ag_catalog.ag_graph WHERE name' in sql:
+            self._result = [(1,)]
+        elif 'FROM ag_catalog.ag_label' in sql:
+            label = params[1]
+            self._result = [self.labels[label]] if label in self.labels else []
+        elif 'create_vlabel' in sql or 'create_elabel' in sql:
+            label = params[1]
+            self.labels[label] = (len(self.labels) + 3, f'{label}_id_seq')
+        elif 'nextval' in sql:
+            seq, count = params
+            start = self.sequences.get(seq, 0)
+            self.sequences[seq] = start + count
+            self._result = [(i,) for i in range(start + 1, start + count + 1)]
+        elif '->>' in sql:
+            label = sql.split('"')[-2]
+            self._result = self.existing_vertices.get(label, [])
+        else:
+            self._result = []
+
+    def fetchone(self):
+        return self._result[0] if self._result else None
+
+    def fetchall(self):
+        return self._result
+
+    def copy_expert(self, sql, buffer):
+        table = sql.split(' (')[0].replace('COPY ', '')
+        self.copies.setdefault(table, []).extend(csv.reader(io.StringIO(buffer.read())))
+
+
+@pytest.fixture
+def results():
+    """两个映射：防御区与关联到防御区的承灾体"""
+    return {
+        'DefenseZone_Mapping': {
+            'entity_type': '防御区',
+            'entities': [
+                {'id': f'zone_{i}', 'type': '防御区', 'attributes': {'统一编号': str(i)}, 'relationships': []}
+                for i in range(5)
+            ]
+        },
+        'ElementAtRisk_Mapping': {
+            'entity_type': '承灾体',
+            'entities': [
+                {'id': f'elem_{i}', 'type': '承灾体', 'attributes': {'建筑面积': 10.0 * i},
+                 'relationships': [{'relation': '位于', 'target_type': '防御区', 'target_id': f'zone_{i % 6}'}]}
+                for i in range(12)
+            ]
+        }
+    }
+
+
+def make_loader(cursor, batch_size=4):
+    conn = MagicMock()
+    conn.cursor.return_value = cursor
+    return AGEBulkLoader(conn, 'test_graph', batch_size=batch_size), conn
+
+
+class TestAGEBulkLoader:
+    """测试批量加载流程"""
+
+    def test_graphid_layout(self):
+        """标签 id 位于高 16 位"""
+        assert make_graphid(3, 7) == (3 << 48) | 7
+
+    def test_load_vertices_and_edges(self, results):
+        """点与边分批 COPY，边端点为对应点的 graphid"""
+        cursor = FakeAGECursor()
+        loader, conn = make_loader(cursor)
+        report = loader.load(results)
+
+        zone_rows = cursor.copies['"test_graph"."防御区"']
+        elem_rows = cursor.copies['"test_graph"."承灾体"']
+        edge_rows = cursor.copies['"test_graph"."位于"']
+        assert len(zone_rows) == 5
+        assert len(elem_rows) == 12
+        # zone_5 不存在，对应的 2 条关系被跳过
+        assert len(edge_rows) == 10
+
+        zone_ids = {row[1]: int(row[0]) for row in zone_rows}
+        assert all(f'"{KEY_PROPERTY}": "zone_' in props for props in zone_ids)
+        zone_label_id = cursor.labels['防御区'][0]
+        assert {int(row[2]) >> 48 for row in edge_rows} == {zone_label_id}
+
+        assert report['承灾体']['rows'] == 12
+        assert report['位于']['kind'] == 'edge'
+        assert conn.commit.called
+
+    def test_batches_respect_batch_size(self, results):
+        """每批预留的 graphid 数不超过 batch_size"""
+        cursor = FakeAGECursor()
+        loader, _ = make_loader(cursor, batch_size=4)
+        loader.load(results)
+        counts = [params[1] for sql, params in cursor.executed if 'nextval' in sql]
+        assert max(counts) <= 4
+
+    def test_resolve_targets_from_existing_label(self, results):
+        """目标点已在库中时通过已有标签表解析"""
+        cursor = FakeAGECursor(existing_vertices={'防御区': [(make_graphid(3, 99), 'zone_5')]})
+        cursor.labels['防御区'] = (3, '防御区_id_seq')
+        loader, _ = make_loader(cursor)
+        loader.load({'ElementAtRisk_Mapping': results['ElementAtRisk_Mapping']})
+
+        edge_rows = cursor.copies['"test_graph"."位于"']
+        assert [int(row[2]) for row in edge_rows] == [make_graphid(3, 99)] * 2
+
+    def test_indexes_created_after_load(self, results):
+        """加载完成后为点表和边表建立索引"""
+        cursor = FakeAGECursor()
+        loader, _ = make_loader(cursor)
+        loader.load(results)
+        index_sql = [sql for sql, _ in cursor.executed if 'CREATE INDEX' in sql]
+        assert any('gin (properties)' in sql and '防御区' in sql for sql in index_sql)
+        assert any('(start_id)' in sql and '位于' in sql for sql in index_sql)
+        last_copy = max(i for i, (sql, _) in enumerate(cursor.executed) if 'nextval' in sql)
+        first_index = min(i for i, (sql, _) in enumerate(cursor.executed) if 'CREATE INDEX' in sql)
+        assert first_index > last_copy
+
+    def test_apply_delta(self):
+        """删除点及其所有边，更新点属性并只重建出边，新增点通过 COPY 写入"""
+        existing = [(make_graphid(3, i), f'elem_{i}') for i in range(3)]
+        cursor = FakeAGECursor(existing_vertices={'承灾体': existing})
+        cursor.labels['承灾体'] = (3, '承灾体_id_seq')
+        cursor.sequences['承灾体_id_seq'] = 3
+        loader, _ = make_loader(cursor)
+
+        delta = {
+            'mapping_name': 'ElementAtRisk_Mapping', 'entity_type': '承灾体',
+            'inserted': [{'id': 'elem_9', 'type': '承灾体', 'attributes': {}, 'relationships': []}],
+            'updated': [{'id': 'elem_1', 'type': '承灾体', 'attributes': {'建筑面积': 1.0}, 'relationships': []}],
+            'deleted': ['elem_2', 'elem_missing'],
+        }
+        summary = loader.apply_delta({'ElementAtRisk_Mapping': delta})
+
+        assert summary['ElementAtRisk_Mapping'] == {'inserted': 1, 'updated': 1, 'deleted': 1, 'unresolved': 0}
+        edge_deletes = [(sql, params) for sql, params in cursor.executed if '_ag_label_edge' in sql]
+        assert edge_deletes[0][1] == ([make_graphid(3, 2)], [make_graphid(3, 2)])
+        assert 'end_id' not in edge_deletes[1][0] and edge_deletes[1][1] == ([make_graphid(3, 1)],)
+        update_sql = next(sql for sql, _ in cursor.executed if sql.startswith('UPDATE'))
+        assert str(make_graphid(3, 1)) in update_sql and '建筑面积' in update_sql
+        assert [row[1] for row in cursor.copies['"test_graph"."承灾体"']] == ['{"etl_key": "elem_9"}']
+
+
+class TestReadResults:
+    """测试读取已导出的结果目录"""
+
+    def test_read_all_formats(self, results, tmp_path):
+        """json / jsonl / parquet 读回与导出前一致，Parquet 几何列转回 WKT"""
+        zones = {
+            'entity_type': '防御区',
+            'entities': [
+                {'id': f'zone_{i}', 'type': '防御区',
+                 'attributes': {'统一编号': str(i), '空间位置': f'POINT (113.{i + 1} 23.5)'},
+                 'relationships': [{'relation': '核查', 'target_type': '核查人', 'target_id': '朱炳湖'}]}
+                for i in range(3)
+            ]
+        }
+        exports = {'DefenseZone_Mapping': ('json', results['DefenseZone_Mapping'], []),
+                   'ElementAtRisk_Mapping': ('jsonl', results['ElementAtRisk_Mapping'], []),
+                   'Zone_Parquet': ('parquet', zones, ['空间位置'])}
+        for mapping_name, (fmt, data, geometry_columns) in exports.items():
+            with open_sink(fmt, str(tmp_path), mapping_name, data['entity_type'], geometry_columns) as sink:
+                sink.write_many(data['entities'])
+
+        loaded = read_results(str(tmp_path))
+        for mapping_name, (_, data, _) in exports.items():
+            assert loaded[mapping_name]['entity_type'] == data['entity_type']
+            assert loaded[mapping_name]['entities'] == data['entities']
+
+    def test_unknown_format(self, tmp_path):
+        """无法识别的文件不再静默跳过"""
+        (tmp_path / 'DefenseZone_Mapping.csv').write_text('id\n', encoding='utf-8')
+        with pytest.raises(ValueError):
+            read_results(str(tmp_path))
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "--tb=short"])
@@ -0,0 +1,138 @@
+"""
+单元测试：etl/etl_manifest.py 中的增量变更检测
+
+测试覆盖：
+- 实体哈希与关系顺序无关
+- 首次运行全部为新增，重跑无变化时 delta 为空
+- 属性/关系变化识别为更新，消失的主键识别为删除
+- commit 前清单不更新
+- delta 流写出与读回
+- 增量运行默认不更新清单，下游消费成功后提交 delta 旁的待提交清单
+"""
+
+import os
+import sys
+import copy
+
+# 添加 etl 目录到路径 (etl 内模块使用同级导入)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'etl'))
+
+import pytest
+
+from etl_manifest import MappingManifest, commit_pending, entity_hash, write_delta, read_delta
+from etl_benchmark import make_synthetic_layers, make_engine
+
+
+def make_entities(n=5):
+    return [
+        {'id': f'elem_{i}', 'type': '承灾体', 'attributes': {'建筑面积': 10.0 * i},
+         'relationships': [{'relation': '位于', 'target_type': '防御区', 'target_id': f'zone_{i}'}]}
+        for i in range(n)
+    ]
+
+
+class TestMappingManifest:
+    """测试清单比对"""
+
+    def test_hash_ignores_relationship_order(self):
+        """关系顺序不同的同一实体哈希相同"""
+        entity = make_entities(1)[0]
+        entity['relationships'].append({'relation': '属于', 'target_type': '乡镇', 'target_id': 't1'})
+        reordered = copy.deepcopy(entity)
+        reordered['relationships'].reverse()
+        assert entity_hash(entity) == entity_hash(reordered)
+
+    def test_first_run_then_unchanged(self, tmp_path):
+        """首次运行全部新增；提交后重跑 delta 为空"""
+        entities = make_entities()
+        manifest = MappingManifest(str(tmp_path), 'M')
+        delta = manifest.diff('承灾体', entities)
+        assert len(delta['inserted']) == 5 and not delta['updated'] and not delta['deleted']
+        manifest.commit()
+
+        delta = MappingManifest(str(tmp_path), 'M').diff('承灾体', entities)
+        assert not delta['inserted'] and not delta['updated'] and not delta['deleted']
+        assert delta['unchanged'] == 5
+
+    def test_updates_and_deletes(self, tmp_path):
+        """属性或关系变化为更新，不再出现的主键为删除"""
+        manifest = MappingManifest(str(tmp_path), 'M')
+        manifest.diff('承灾体', make_entities())
+        manifest.commit()
+
+        entities = make_entities()[:4]
+        entities[0]['attributes']['建筑面积'] = 999.0
+        entities[1]['relationships'][0]['target_id'] = 'zone_x'
+        entities.append({'id': 'elem_new', 'type': '承灾体', 'attributes': {}, 'relationships': []})
+
+        delta = MappingManifest(str(tmp_path), 'M').diff('承灾体', entities)
+        assert [e['id'] for e in delta['updated']] == ['elem_0', 'elem_1']
+        assert [e['id'] for e in delta['inserted']] == ['elem_new']
+        assert delta['deleted'] == ['elem_4']
+        assert delta['unchanged'] == 2
+
+    def test_manifest_not_updated_without_commit(self, tmp_path):
+        """未 commit 时再次比对仍基于旧清单"""
+        manifest = MappingManifest(str(tmp_path), 'M')
+        manifest.diff('承灾体', make_entities())
+        delta = MappingManifest(str(tmp_path), 'M').diff('承灾体', make_entities())
+        assert len(delta['inserted']) == 5
+
+    def test_delta_round_trip(self, tmp_path):
+        """delta 流写出后读回结构一致"""
+        manifest = MappingManifest(str(tmp_path / 'manifest'), 'M')
+        manifest.diff('承灾体', make_entities())
+        manifest.commit()
+        entities = make_entities()[1:]
+        entities[0]['attributes']['建筑面积'] = 1.0
+        delta = MappingManifest(str(tmp_path / 'manifest'), 'M').diff('承灾体', entities)
+
+        loaded = read_delta(write_delta(delta, str(tmp_path)))
+        for key in ('mapping_name', 'entity_type', 'inserted', 'updated', 'deleted'):
+            assert loaded[key] == delta[key]
+
+
+class TestExportDelta:
+    """测试 ETLEngine 增量运行"""
+
+    def test_rerun_emits_only_changes(self, tmp_path):
+        """修改源数据后重跑，只输出变化的实体"""
+        layers = make_synthetic_layers(100)
+        first = make_engine(layers).export_delta(str(tmp_path), commit=True)
+        assert first['DefenseZone_Mapping']['inserted'] == 10
+        assert first['DefenseZone_Mapping']['unchanged'] == 0
+        assert first['DefenseZone_Mapping']['pending'] is None
+
+        zones = layers['防御区'].copy()
+        zones.loc[0, 'fyqdj'] = 'changed'
+        layers = dict(layers, 防御区=zones.iloc[:-1])
+        second = make_engine(layers).export_delta(str(tmp_path), commit=True)
+
+        assert second['DefenseZone_Mapping']['updated'] == 1
+        assert second['DefenseZone_Mapping']['deleted'] == 1
+        assert second['DefenseZone_Mapping']['inserted'] == 0
+        assert all(item['inserted'] == item['updated'] == item['deleted'] == 0
+                   for key, item in second.items() if key != 'DefenseZone_Mapping')
+
+
+    def test_manifest_committed_after_consumer(self, tmp_path):
+        """默认不更新清单：下游未提交时重跑仍输出全部变更，提交待提交清单后才只输出变化"""
+        layers = make_synthetic_layers(100)
+        first = make_engine(layers).export_delta(str(tmp_path))
+        pending = first['DefenseZone_Mapping']['pending']
+        assert pending.exists() and not first['DefenseZone_Mapping']['manifest'].path.exists()
+
+        # 下游失败 (未提交)：delta 不丢失
+        retry = make_engine(layers).export_delta(str(tmp_path))
+        assert retry['DefenseZone_Mapping']['inserted'] == 10
+
+        assert all(commit_pending(item['path']) for item in retry.values())
+        assert not pending.exists()
+        assert commit_pending(retry['DefenseZone_Mapping']['path']) is False
+
+        third = make_engine(layers).export_delta(str(tmp_path))
+        assert all(item['inserted'] == item['updated'] == item['deleted'] == 0 for item in third.values())
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "--tb=short"])
@@ -0,0 +1,105 @@
+"""
+单元测试：etl/etl_plan.py 中的映射计划编译
+
+测试覆盖：
+- 示例配置编译为不可变计划，字段与几何需求正确
+- 未知配置项、非法取值、缺失必填项一次性全部报告
+- 对照图层实际字段检查引用
+- 试运行报告行数与预计耗时
+"""
+
+import os
+import sys
+import copy
+import dataclasses
+
+# 添加 etl 目录到路径 (etl 内模块使用同级导入)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'etl'))
+
+import pytest
+
+from etl_engine import ETLEngine
+from etl_plan import MappingConfigError, compile_mapping
+from etl_benchmark import make_synthetic_layers, make_engine, DEFAULT_CONFIG
+
+
+@pytest.fixture
+def config():
+    return copy.deepcopy(ETLEngine(DEFAULT_CONFIG).config)
+
+
+class TestCompileMapping:
+    """测试映射编译与校验"""
+
+    def test_compile_example_config(self, config):
+        """示例配置编译成功，嵌套属性展开为子属性"""
+        plan = compile_mapping('Household_Mapping', config['Household_Mapping'])
+        assert plan.key.method == 'md5' and plan.key.dedup_policy == 'merge_relation'
+        nested = plan.attributes[-1]
+        assert nested.kind == 'nested'
+        assert [c.target for c in nested.children] == ['行动受限人数', '儿童_0_14岁', '老人_60岁以上', '残障人士']
+        assert plan.relationships[0].rules == ((0, '拥有'), ('otherwise', '居住于'))
+        assert plan.needs_geometry is False
+
+        zone_plan = compile_mapping('DefenseZone_Mapping', config['DefenseZone_Mapping'])
+        assert zone_plan.columns == ('fyqdj', 'tybh', 'xppd')
+        assert zone_plan.needs_geometry is True
+        assert zone_plan.attributes[2].geometry.precision == 6
+
+    def test_plan_is_immutable(self, config):
+        """计划为冻结的数据类"""
+        plan = compile_mapping('DefenseZone_Mapping', config['DefenseZone_Mapping'])
+        with pytest.raises(dataclasses.FrozenInstanceError):
+            plan.attributes[0].source = 'other'
+
+    def test_reports_all_errors(self, config):
+        """拼写错误与非法取值不再静默为 None，而是一次性列出"""
+        mapping = config['ElementAtRisk_Mapping']
+        mapping['attributes'][1]['dtpye'] = 'float'
+        mapping['attributes'][0]['dtype'] = 'decimal'
+        mapping['relationships'][0].pop('foreign_key_field')
+        mapping['key_rule']['method'] = 'sha1'
+
+        with pytest.raises(MappingConfigError) as exc_info:
+            compile_mapping('ElementAtRisk_Mapping', mapping)
+        errors = exc_info.value.errors
+        assert len(errors) == 4
+        assert any("未知配置项 'dtpye'" in e for e in errors)
+        assert any("'decimal'" in e for e in errors)
+        assert any('foreign_key_field' in e for e in errors)
+        assert any("'sha1'" in e for e in errors)
+
+    def test_engine_collects_errors_across_mappings(self, config):
+        """引擎编译时汇总所有映射的问题"""
+        engine = ETLEngine(DEFAULT_CONFIG)
+        engine.config['DefenseZone_Mapping']['attributes'][0]['sorce'] = 'tybh'
+        del engine.config['Household_Mapping']['entity_type']
+        with pytest.raises(MappingConfigError) as exc_info:
+            engine.run()
+        assert len(exc_info.value.errors) == 2
+
+
+class TestValidateAndDryRun:
+    """测试字段检查与试运行"""
+
+    def test_validate_missing_columns(self):
+        """引用图层中不存在的字段时给出提示"""
+        engine = make_engine(make_synthetic_layers(100))
+        assert engine.validate() == []
+        engine.config['ElementAtRisk_Mapping']['attributes'].append({'target': '层数', 'source': 'cs'})
+        assert engine.validate() == ["ElementAtRisk_Mapping: 图层 承灾体 中没有字段 'cs'"]
+
+    def test_dry_run_reports_rows_and_estimate(self):
+        """试运行报告每个映射的行数与预计耗时，不改变结果"""
+        layers = make_synthetic_layers(300)
+        engine = make_engine(layers)
+        report = engine.dry_run(sample_rows=50)
+        assert report['ElementAtRisk_Mapping']['rows'] == 300
+        assert report['ElementAtRisk_Mapping']['sample_rows'] == 50
+        assert report['DefenseZone_Mapping']['rows'] == 30
+        assert all(item['estimated_seconds'] > 0 for item in report.values())
+        assert engine.run() == make_engine(layers).run()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "--tb=short"])
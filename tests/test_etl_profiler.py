@@ -0,0 +1,115 @@
+"""
+单元测试：etl/etl_profiler.py 中的分阶段性能统计
+
+测试覆盖：
+- 顺序运行记录每个映射各阶段的耗时与行数，共用图层只记一次读取
+- 流式运行按批次累加读取与写出
+- 开启内存统计时记录峰值内存
+- 钩子在每个阶段外层调用
+- JSON 报告写出与两次报告对比
+"""
+
+import os
+import sys
+import json
+from contextlib import contextmanager
+
+# 添加 etl 目录到路径 (etl 内模块使用同级导入)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'etl'))
+
+import pytest
+
+from etl_profiler import StageProfiler, compare_reports
+from etl_benchmark import make_synthetic_layers, make_engine, write_synthetic_gdb
+
+
+@pytest.fixture
+def layers():
+    return make_synthetic_layers(600)
+
+
+class TestStageProfiler:
+    """测试引擎运行中的分阶段统计"""
+
+    def test_sequential_stages(self, layers, tmp_path):
+        """每个映射记录主键/属性/关系/合并/写出，承灾体只在首个映射下记录读取"""
+        engine = make_engine(layers)
+        engine.gdf_cache.clear()
+        gdb_path = str(tmp_path / 'synthetic.gdb')
+        write_synthetic_gdb(layers, gdb_path)
+        engine.gdb_path = gdb_path
+        engine.export(str(tmp_path / 'out'))
+        report = engine.profiler.report()
+
+        assert report['mode'] == 'sequential'
+        element = report['mappings']['ElementAtRisk_Mapping']
+        assert list(element['stages']) == ['read', 'keys', 'attributes', 'relationships', 'merge', 'write']
+        assert element['stages']['read']['rows'] == 600
+        assert 'read' not in report['mappings']['Household_Mapping']['stages']
+        assert report['mappings']['Household_Mapping']['stages']['write']['rows'] < 600
+        assert element['rows_per_sec'] > 0 and element['peak_memory_mb'] is None
+
+    def test_row_mode_single_transform_stage(self, layers):
+        """逐行模式下主键/属性/关系记为一个 transform 阶段"""
+        engine = make_engine(layers, vectorized=False)
+        engine.run()
+        stages = engine.profiler.report()['mappings']['DefenseZone_Mapping']['stages']
+        assert list(stages) == ['transform', 'merge']
+
+    def test_streaming_accumulates_batches(self, layers, tmp_path):
+        """流式模式按批次累加读取与写出"""
+        gdb_path = str(tmp_path / 'synthetic.gdb')
+        write_synthetic_gdb(layers, gdb_path)
+        engine = make_engine({})
+        engine.gdb_path = gdb_path
+        engine.export(str(tmp_path / 'out'), stream=True, batch_size=200)
+        report = engine.profiler.report()
+        read = report['mappings']['ElementAtRisk_Mapping']['stages']['read']
+        assert report['mode'] == 'stream'
+        assert read['rows'] == 600 and read['calls'] == 4  # 3 批 + 结束时的空读取
+        assert report['mappings']['ElementAtRisk_Mapping']['stages']['write']['calls'] == 3
+
+    def test_trace_memory(self, layers):
+        """开启内存统计时各阶段有峰值内存"""
+        engine = make_engine(layers, trace_memory=True)
+        engine.run()
+        report = engine.profiler.report()
+        assert report['peak_memory_mb'] > 0
+        assert report['mappings']['ElementAtRisk_Mapping']['stages']['attributes']['peak_memory_mb'] > 0
+
+    def test_hook_wraps_each_stage(self, layers):
+        """钩子在每个阶段外层调用"""
+        calls = []
+
+        @contextmanager
+        def hook(mapping, stage):
+            calls.append((mapping, stage))
+            yield
+
+        engine = make_engine(layers, profiler_hook=hook)
+        engine.run()
+        assert ('Household_Mapping', 'relationships') in calls
+        assert len(calls) == sum(s['calls'] for m in engine.profiler.report()['mappings'].values()
+                                 for s in m['stages'].values())
+
+
+class TestReport:
+    """测试报告写出与对比"""
+
+    def test_save_and_compare(self, tmp_path):
+        """报告可写出为 JSON，对比时找出变慢超过阈值的阶段"""
+        profiler = StageProfiler()
+        profiler.reset('sequential')
+        with profiler.stage('M', 'keys') as stage:
+            stage.rows = 10
+        profiler.finish()
+        path = profiler.save(str(tmp_path / 'profile.json'))
+        old = json.loads(path.read_text(encoding='utf-8'))
+        assert old['mappings']['M']['stages']['keys']['rows'] == 10
+
+        old['mappings']['M']['seconds'] = old['mappings']['M']['stages']['keys']['seconds'] = 1.0
+        new = json.loads(json.dumps(old))
+        new['mappings']['M']['stages']['keys']['seconds'] = 2.0
+        regressions = compare_reports(old, new, threshold=0.5)
+        assert [(r['stage'], r['change']) for r in regressions] == [('keys', 1.0)]
+        assert compare_reports(old, old) == []
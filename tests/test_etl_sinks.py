@@ -0,0 +1,170 @@
+"""
+单元测试：etl/etl_sinks.py 中的流式输出
+
+测试覆盖：
+- JSON 输出与原 json.dump(indent=2) 字节一致
+- JSONL 每行一个实体
+- Parquet 几何列为 WKB 且带 GeoParquet 元数据
+- Parquet 多个行组的列类型不一致时合并 Schema (首批关系为空、int 与 float、后续新增的列)
+- Parquet 的 GeoParquet 元数据写入图层坐标系 (PROJJSON)，二进制 WKB 值原样写入
+- 按 global_config.output 为映射选择格式并流式写出
+- 导出为 Parquet 时几何直接编码为二进制 WKB，坐标系取自图层
+"""
+
+import os
+import sys
+import json
+
+# 添加 etl 目录到路径 (etl 内模块使用同级导入)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'etl'))
+
+import geopandas as gpd
+import pyarrow.parquet as pq
+import pytest
+import shapely
+from pyproj import CRS
+
+from etl_sinks import JsonSink, JsonlSink, ParquetSink, open_sink
+from etl_benchmark import make_synthetic_layers, make_engine, write_synthetic_gdb
+
+
+@pytest.fixture(scope='module')
+def results():
+    """合成图层上的 ETL 结果"""
+    return make_engine(make_synthetic_layers(200)).run()
+
+
+class TestSinks:
+    """测试各输出格式"""
+
+    def test_json_identical_to_json_dump(self, results, tmp_path):
+        """逐个写出的 JSON 与整体 json.dump 结果字节一致"""
+        for mapping_name, data in results.items():
+            with JsonSink(str(tmp_path), mapping_name, data['entity_type']) as sink:
+                sink.write_many(data['entities'])
+            expected = json.dumps(data, ensure_ascii=False, indent=2)
+            assert sink.path.read_text(encoding='utf-8') == expected
+
+    def test_json_empty_entities(self, tmp_path):
+        """空结果与 json.dump 一致"""
+        with JsonSink(str(tmp_path), 'Empty', '防御区') as sink:
+            pass
+        assert json.loads(sink.path.read_text(encoding='utf-8')) == \
+            {'mapping_name': 'Empty', 'entity_type': '防御区', 'entities': []}
+
+    def test_jsonl_one_entity_per_line(self, results, tmp_path):
+        """JSONL 每行一个实体，可逐行解析"""
+        data = results['Household_Mapping']
+        with JsonlSink(str(tmp_path), 'Household_Mapping', data['entity_type']) as sink:
+            sink.write_many(data['entities'])
+        lines = sink.path.read_text(encoding='utf-8').splitlines()
+        assert [json.loads(line) for line in lines] == data['entities']
+
+    def test_parquet_geometry_as_wkb(self, results, tmp_path):
+        """Parquet 几何属性写为 WKB，可被 geopandas 作为 GeoParquet 读取"""
+        data = results['DefenseZone_Mapping']
+        sink = ParquetSink(str(tmp_path), 'DefenseZone_Mapping', data['entity_type'],
+                           geometry_columns=['空间位置'], row_group_size=8)
+        with sink:
+            sink.write_many(data['entities'])
+
+        table = pq.read_table(sink.path)
+        assert table.num_rows == len(data['entities'])
+        assert json.loads(table.schema.metadata[b'geo'])['primary_column'] == '空间位置'
+        assert pq.ParquetFile(sink.path).num_row_groups > 1
+
+        gdf = gpd.read_parquet(sink.path)
+        assert gdf.geometry.name == '空间位置'
+        assert gdf.geometry.iloc[0].wkt == data['entities'][0]['attributes']['空间位置']
+
+    def test_parquet_schema_unified_across_batches(self, tmp_path):
+        """首批关系为空、后续出现关系/小数/新属性时，各行组合并为同一 Schema"""
+        entities = [
+            {'id': 'a', 'type': '防御区', 'attributes': {'面积': 1}, 'relationships': []},
+            {'id': 'b', 'type': '防御区', 'attributes': {'面积': 2, '备注': None}, 'relationships': []},
+            {'id': 'c', 'type': '防御区', 'attributes': {'面积': 2.5, '备注': '新增'},
+             'relationships': [{'relation': '核查', 'target_type': '核查人', 'target_id': '朱炳湖'}]},
+        ]
+        with ParquetSink(str(tmp_path), 'Batches', '防御区', row_group_size=2) as sink:
+            sink.write_many(entities)
+
+        table = pq.read_table(sink.path)
+        assert pq.ParquetFile(sink.path).num_row_groups == 2
+        assert table.column('面积').to_pylist() == [1.0, 2.0, 2.5]
+        assert table.column('备注').to_pylist() == [None, None, '新增']
+        assert table.column('relationships').to_pylist() == [
+            [], [], [{'relation': '核查', 'target_type': '核查人', 'target_id': '朱炳湖'}]]
+        assert [p.name for p in tmp_path.iterdir()] == ['Batches.parquet']
+
+    def test_parquet_crs_and_binary_wkb(self, tmp_path):
+        """坐标系写入 geo 元数据；bytes 值视为二进制 WKB 不再解析"""
+        point = shapely.Point(113.5, 23.1)
+        entities = [
+            {'id': 'a', 'type': '防御区', 'attributes': {'空间位置': point.wkb}, 'relationships': []},
+            {'id': 'b', 'type': '防御区', 'attributes': {'空间位置': point.wkt}, 'relationships': []},
+            {'id': 'c', 'type': '防御区', 'attributes': {'空间位置': None}, 'relationships': []},
+        ]
+        crs = CRS.from_epsg(4490).to_json_dict()
+        with ParquetSink(str(tmp_path), 'Crs', '防御区', geometry_columns=['空间位置'], crs=crs) as sink:
+            sink.write_many(entities)
+
+        geo = json.loads(pq.read_table(sink.path).schema.metadata[b'geo'])
+        assert geo['columns']['空间位置']['crs'] == crs
+        gdf = gpd.read_parquet(sink.path)
+        assert gdf.crs.to_epsg() == 4490
+        assert gdf.geometry.iloc[0].equals(point) and gdf.geometry.iloc[1].equals(point)
+        assert gdf.geometry.iloc[2] is None
+
+    def test_unknown_format(self, tmp_path):
+        """未知格式抛出 ValueError"""
+        with pytest.raises(ValueError):
+            open_sink('xml', str(tmp_path), 'M', '防御区')
+
+
+class TestExport:
+    """测试按映射配置格式导出"""
+
+    def test_per_mapping_format(self, tmp_path):
+        """global_config.output 中按映射指定格式，流式导出与整层结果一致"""
+        layers = make_synthetic_layers(200)
+        gdb_path = str(tmp_path / 'synthetic.gdb')
+        write_synthetic_gdb(layers, gdb_path)
+
+        engine = make_engine(layers)
+        expected = engine.run()
+
+        engine = make_engine({})
+        engine.gdb_path = gdb_path
+        engine.config['global_config']['output'] = {
+            'format': 'json',
+            'mappings': {'ElementAtRisk_Mapping': 'jsonl', 'Household_Mapping': 'jsonl'}
+        }
+        paths = engine.export(str(tmp_path / 'out'), stream=True, batch_size=40)
+
+        assert paths['DefenseZone_Mapping'].suffix == '.json'
+        assert paths['ElementAtRisk_Mapping'].suffix == '.jsonl'
+        for mapping_name in ('ElementAtRisk_Mapping', 'Household_Mapping'):
+            lines = paths[mapping_name].read_text(encoding='utf-8').splitlines()
+            assert [json.loads(line) for line in lines] == expected[mapping_name]['entities']
+
+    def test_parquet_export_binary_geometry(self, tmp_path):
+        """导出为 Parquet 时几何直接编码为 WKB，坐标系取自图层，之后的 run() 仍输出 WKT"""
+        layers = make_synthetic_layers(100)
+        engine = make_engine(layers)
+        expected = engine.run()['DefenseZone_Mapping']['entities']
+        engine.config['global_config']['output'] = {'format': 'json',
+                                                    'mappings': {'DefenseZone_Mapping': 'parquet'}}
+        paths = engine.export(str(tmp_path / 'out'), workers=1)
+
+        gdf = gpd.read_parquet(paths['DefenseZone_Mapping'])
+        assert gdf.crs.to_epsg() == 4326
+        assert gdf.geometry.iloc[0].wkt == expected[0]['attributes']['空间位置']
+        assert isinstance(engine.run()['DefenseZone_Mapping']['entities'][0]['attributes']['空间位置'], str)
+
+        engine.binary_geometry = {'DefenseZone_Mapping'}
+        entity = engine.run()['DefenseZone_Mapping']['entities'][0]
+        assert entity['attributes']['空间位置'] == shapely.from_wkt(expected[0]['attributes']['空间位置']).wkb
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "--tb=short"])
@@ -0,0 +1,188 @@
+"""
+单元测试：etl/etl_transforms.py 中的转换函数注册表
+
+测试覆盖：
+- 内置转换按列计算：求和、coalesce、代码表、CSV 查表、单位换算、正则提取、分档
+- 未注册的转换与缺失的必填参数在编译时报告
+- 参数取值在编译时检查：unit_convert 的 factor 或已知单位，regex_extract 的分组
+- 按列执行与逐行执行结果一致
+- global_config.transform_modules 中的自定义转换可在 YAML 中引用
+"""
+
+import os
+import sys
+import copy
+import textwrap
+
+# 添加 etl 目录到路径 (etl 内模块使用同级导入)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'etl'))
+
+import numpy as np
+import pandas as pd
+import pytest
+import yaml
+
+from etl_engine import ETLEngine
+from etl_plan import MappingConfigError, compile_mapping
+from etl_transforms import apply_transform, transform_inputs, unit_factor
+from etl_benchmark import make_synthetic_layers, make_engine, DEFAULT_CONFIG
+
+
+@pytest.fixture
+def frame():
+    return pd.DataFrame({
+        'a': [1.0, np.nan, 2.9, None],
+        'b': ['x', '', None, 'y'],
+        'c': ['甲', '乙', None, '丙'],
+        'code': [1.0, 2.0, 3.0, np.nan],
+        'area': [666.6667, 10000.0, None, 'bad'],
+        'addr': ['梁化镇12号', '无门牌', None, '梁化镇7号'],
+    })
+
+
+def write_config(tmp_path, config, name='transforms.yaml'):
+    path = tmp_path / name
+    path.write_text(yaml.safe_dump(config, allow_unicode=True), encoding='utf-8')
+    return str(path)
+
+
+class TestBuiltinTransforms:
+    """测试内置转换"""
+
+    def test_calc_sum_fields(self, frame):
+        """非法值与缺失值按 0 处理，小数截断"""
+        assert apply_transform('calc_sum_fields', frame, {'columns': ['a', 'code', 'missing']}) == [2, 2, 5, 0]
+
+    def test_coalesce(self, frame):
+        """取第一个非空值，全空时取 default"""
+        assert apply_transform('coalesce', frame, {'columns': ['b', 'c'], 'default': '无'}) == ['x', '乙', '无', 'y']
+
+    def test_code_map(self, frame):
+        """浮点代码按整数匹配，未匹配与缺失取 default"""
+        params = {'source': 'code', 'mapping': {1: '低', '2': '中'}, 'default': '未知'}
+        assert apply_transform('code_map', frame, params) == ['低', '中', '未知', '未知']
+        params['keep_unmatched'] = True
+        assert apply_transform('code_map', frame, params)[2] == 3.0
+
+    def test_lookup(self, frame, tmp_path):
+        """从 CSV 代码表映射"""
+        table = tmp_path / 'codes.csv'
+        table.write_text('dm,mc\n1,低\n3,高\n', encoding='utf-8')
+        params = {'source': 'code', 'file': str(table), 'key_column': 'dm', 'value_column': 'mc'}
+        assert apply_transform('lookup', frame, params) == ['低', None, '高', None]
+
+    def test_unit_convert(self, frame):
+        """按单位换算并保留小数位，非数值为 None"""
+        params = {'source': 'area', 'from': '平方米', 'to': '亩', 'digits': 2}
+        assert apply_transform('unit_convert', frame, params) == [1.0, 15.0, None, None]
+        assert unit_factor('km', 'm') == 1000.0
+        with pytest.raises(ValueError):
+            unit_factor('m', 'ha')
+
+    def test_regex_extract(self, frame):
+        """提取分组，不匹配取 default"""
+        params = {'source': 'addr', 'pattern': r'(?P<no>\d+)号', 'group': 'no', 'default': ''}
+        assert apply_transform('regex_extract', frame, params) == ['12', '', '', '7']
+        params = {'source': 'addr', 'pattern': r'\d+号', 'group': 0}
+        assert apply_transform('regex_extract', frame, params) == ['12号', None, None, '7号']
+
+    def test_buckets(self, frame):
+        """左闭右开分档，超出范围与缺失取 default"""
+        params = {'source': 'a', 'bins': [0, 2, 5], 'labels': ['低', '高'], 'default': '无'}
+        assert apply_transform('buckets', frame, params) == ['低', '无', '高', '无']
+
+    def test_inputs(self):
+        """读取字段来自 source 与 columns"""
+        assert transform_inputs('coalesce', {'columns': ['a', 'b']}) == ['a', 'b']
+        assert transform_inputs('code_map', {'source': 'code', 'mapping': {}}) == ['code']
+
+
+class TestTransformMappings:
+    """测试转换在映射中的编译与执行"""
+
+    @pytest.fixture
+    def config(self):
+        config = copy.deepcopy(ETLEngine(DEFAULT_CONFIG).config)
+        config['DefenseZone_Mapping']['attributes'] += [
+            {'target': '风险等级编码', 'transform_func': 'code_map',
+             'params': {'source': 'fyqdj', 'mapping': {'高': 3, '中': 2, '低': 1}, 'default': 0}},
+            {'target': '坡度分级', 'transform_func': 'buckets',
+             'params': {'source': 'xppd', 'bins': [0, 15, 25, 90], 'labels': ['缓', '较陡', '陡']}},
+        ]
+        config['ElementAtRisk_Mapping']['attributes'].append(
+            {'target': '建筑面积_亩', 'transform_func': 'unit_convert',
+             'params': {'source': 'jzmj', 'from': 'm2', 'to': '亩', 'digits': 3}})
+        return config
+
+    def test_compile_errors(self, config):
+        """未注册的转换与缺失的必填参数一次性报告"""
+        attributes = config['DefenseZone_Mapping']['attributes']
+        attributes.append({'target': 'x', 'transform_func': 'no_such_func'})
+        attributes.append({'target': 'y', 'transform_func': 'code_map', 'params': {'source': 'fyqdj'}})
+        with pytest.raises(MappingConfigError) as info:
+            compile_mapping('DefenseZone_Mapping', config['DefenseZone_Mapping'])
+        assert len(info.value.errors) == 2
+        assert 'no_such_func' in info.value.errors[0] and 'params.mapping' in info.value.errors[1]
+
+    def test_param_checks(self, config):
+        """unit_convert 缺少 factor 与单位、单位未知或量纲不同，regex_extract 分组不存在时编译报错"""
+        attributes = config['DefenseZone_Mapping']['attributes']
+        bad_params = [
+            ('unit_convert', {'source': 'a'}, 'params.factor'),
+            ('unit_convert', {'source': 'a', 'from': 'm2'}, 'params.factor'),
+            ('unit_convert', {'source': 'a', 'from': 'm2', 'to': 'acre'}, 'acre'),
+            ('unit_convert', {'source': 'a', 'from': 'm', 'to': 'ha'}, '量纲'),
+            ('regex_extract', {'source': 'a', 'pattern': r'\d+号'}, 'params.group'),
+            ('regex_extract', {'source': 'a', 'pattern': r'(\d+)号', 'group': 2}, 'params.group'),
+            ('regex_extract', {'source': 'a', 'pattern': r'(\d+)号', 'group': 'no'}, 'no'),
+            ('regex_extract', {'source': 'a', 'pattern': r'(\d+号'}, 'params.pattern'),
+        ]
+        for i, (name, params, _) in enumerate(bad_params):
+            attributes.append({'target': f'x{i}', 'transform_func': name, 'params': params})
+        with pytest.raises(MappingConfigError) as info:
+            compile_mapping('DefenseZone_Mapping', config['DefenseZone_Mapping'])
+        assert len(info.value.errors) == len(bad_params)
+        for error, (name, _, expected) in zip(info.value.errors, bad_params):
+            assert name in error and expected in error
+
+        del attributes[-len(bad_params):]
+        attributes += [
+            {'target': 'f', 'transform_func': 'unit_convert', 'params': {'source': 'a', 'factor': 0.5}},
+            {'target': 'g', 'transform_func': 'regex_extract', 'params': {'source': 'a', 'pattern': r'\d+号', 'group': 0}},
+        ]
+        compile_mapping('DefenseZone_Mapping', config['DefenseZone_Mapping'])
+
+    def test_plan_columns(self, config):
+        """转换读取的字段参与列裁剪"""
+        plan = compile_mapping('ElementAtRisk_Mapping', config['ElementAtRisk_Mapping'])
+        assert plan.attributes[-1].kind == 'transform'
+        assert 'jzmj' in plan.columns
+
+    def test_row_and_vectorized_identical(self, config, tmp_path):
+        """按列执行与逐行执行结果一致"""
+        path = write_config(tmp_path, config)
+        layers = make_synthetic_layers(300)
+        row_results = make_engine(layers, path, vectorized=False).run()
+        vec_results = make_engine(layers, path, vectorized=True).run()
+        assert row_results == vec_results
+        zone = vec_results['DefenseZone_Mapping']['entities'][0]['attributes']
+        assert zone['风险等级编码'] in (1, 2, 3)
+
+    def test_custom_transform_module(self, config, tmp_path):
+        """transform_modules 中注册的自定义转换可在 YAML 中引用"""
+        (tmp_path / 'custom_etl_transforms.py').write_text(textwrap.dedent('''
+            from etl_transforms import register_transform, get_numeric
+
+            @register_transform('double_value', required=('source',))
+            def double_value(frame, params):
+                return get_numeric(frame, params['source']) * 2
+        '''), encoding='utf-8')
+        config['global_config']['transform_modules'] = ['custom_etl_transforms']
+        config['DefenseZone_Mapping']['attributes'].append(
+            {'target': '坡度x2', 'transform_func': 'double_value', 'params': {'source': 'xppd'}})
+        path = write_config(tmp_path, config)
+        layers = make_synthetic_layers(100)
+        result = make_engine(layers, path).run()['DefenseZone_Mapping']
+        for entity in result['entities']:
+            attrs = entity['attributes']
+            assert attrs['坡度x2'] is None if attrs['坡度'] is None else attrs['坡度x2'] == attrs['坡度'] * 2
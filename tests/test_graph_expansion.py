@@ -0,0 +1,47 @@
+"""
+单元测试：graph_expansion.py 中的混合检索图谱展开
+
+测试覆盖：
+- 语义检索表名到节点标签的映射
+- 批量展开查询 (纯数字 ID 同时按文本和数字匹配，非普通标识符的标签/属性名加反引号)
+- 邻居按命中节点分组、去重、判断方向并限制数量
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from graph_expansion import build_expansion_query, group_neighbours, table_label
+
+
+def test_build_expansion_query():
+    assert table_label("防御区_embeddings") == "防御区"
+    cypher = build_expansion_query("防御区", "id", ["441323103033546", "441323103033546.0", "A-1"])
+    assert cypher == ("MATCH (n:防御区)-[r]-(m) WHERE n.id IN ['441323103033546', 441323103033546, 'A-1'] "
+                      "RETURN {hit: n.id, rel: r, neighbour: m}")
+    cypher = build_expansion_query("防御区-2024", "统一 编号", ["A-1"])
+    assert cypher == ("MATCH (n:`防御区-2024`)-[r]-(m) WHERE n.`统一 编号` IN ['A-1'] "
+                      "RETURN {hit: n.`统一 编号`, rel: r, neighbour: m}")
+
+
+def test_group_neighbours():
+    checker = {"id": 10, "label": "核查人", "properties": {"姓名": "朱炳湖"}}
+    bearer = {"id": 20, "label": "承灾体", "properties": {"id": "B1"}}
+    rows = [
+        {"hit": 441323103033546, "rel": {"id": 1, "label": "核查", "start_id": 10, "end_id": 2}, "neighbour": checker},
+        {"hit": 441323103033546, "rel": {"id": 1, "label": "核查", "start_id": 10, "end_id": 2}, "neighbour": checker},
+        {"hit": 441323103033546, "rel": {"id": 2, "label": "防御区承灾体关系", "start_id": 2, "end_id": 20},
+         "neighbour": bearer},
+        {"hit": "unknown", "rel": {"id": 3}, "neighbour": bearer},
+    ]
+    groups = group_neighbours(["441323103033546", "X"], rows, max_per_hit=1)
+
+    hit = groups["441323103033546"]
+    assert hit["neighbour_count"] == 2
+    assert hit["neighbours"] == [{"relation": "核查", "direction": "<-", "label": "核查人",
+                                  "properties": {"姓名": "朱炳湖"}}]
+    assert groups["X"] == {"neighbour_count": 0, "neighbours": []}
+
+    groups = group_neighbours(["441323103033546"], rows)
+    assert [n["direction"] for n in groups["441323103033546"]["neighbours"]] == ["<-", "->"]
@@ -0,0 +1,82 @@
+"""
+单元测试：intent_router.py 中的常见问题模板直达
+
+测试覆盖：
+- 四类固定句式的识别与 Cypher 生成 (实体槽位来自实体链接，风险等级经取值字典校验)
+- 带额外条件或实体有歧义的问题不命中模板
+- 中文数字解析
+- 查询无结果时交给 Agent；回答超过 10 条时只列出前 5 条
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from entity_linker import Entity, EntityIndex
+from intent_router import IntentRouter, format_rows, parse_count
+
+INDEX = EntityIndex([
+    Entity("核查人", "姓名", "朱炳湖", 1),
+    Entity("防御区", "id", "441323103033546", 2),
+])
+
+
+def make_router(rows=None):
+    executed = []
+
+    def run_query(cypher):
+        executed.append(cypher)
+        return rows if rows is not None else [{"node": {"properties": {"姓名": "朱炳湖", "单位": "地质局"}}}]
+
+    router = IntentRouter(run_query, INDEX, value_lookup=lambda label, key: ["中级", "高级", "低级"])
+    return router, executed
+
+
+def test_match_templates():
+    router, _ = make_router()
+
+    intent, _, cypher = router.match("441323103033546防御区是谁核查的？")
+    assert intent.name == "zone_checkers"
+    assert cypher == "MATCH (p:核查人)-[r:核查]->(d:防御区) WHERE id(d) = 2 RETURN {node: p}"
+
+    intent, _, cypher = router.match("朱炳湖负责哪些防御区")
+    assert intent.name == "person_zones" and "id(p) = 1" in cypher
+
+    intent, slots, cypher = router.match("承灾体里威胁财产最多的前五个？")
+    assert intent.name == "top_bearers_by_property" and cypher.endswith("LIMIT 5 RETURN {node: n}")
+
+    intent, slots, cypher = router.match("哪些防御区风险等级是中？")
+    assert intent.name == "zones_by_risk_level" and "d.风险等级 = '中级'" in cypher
+
+
+def test_no_confident_match():
+    router, _ = make_router()
+    assert router.match("朱炳湖负责的防御区中面积最大的是哪个？") is None
+    assert router.match("张三负责哪些防御区") is None           # 未链接到实体
+    assert router.match("哪些防御区风险等级是未知？") is None    # 取值不在字典中
+    assert router.match("哪些防御区是坡度较缓") is None
+
+
+def test_parse_count():
+    assert [parse_count(t) for t in ["5", "五", "十", "十二", "二十", "三十五"]] == [5, 5, 10, 12, 20, 35]
+    assert parse_count("百") is None
+
+
+def test_route_result_and_fallthrough():
+    router, executed = make_router()
+    routed = router.route("谁核查了441323103033546防御区")
+    assert routed.intent == "zone_checkers" and len(executed) == 1
+    assert "| 朱炳湖 | 地质局 |" in routed.answer
+    assert routed.tool_payloads[0]["name"] == "execute_cypher_query"
+
+    empty_router, _ = make_router(rows=[])
+    assert empty_router.route("朱炳湖负责哪些防御区") is None
+
+
+def test_format_rows_preview():
+    rows = [{"node": {"properties": {"id": str(i), "面积": None}}} for i in range(12)]
+    answer = format_rows("测试", rows, ["id", "面积"])
+    assert answer.startswith("测试共 12 条")
+    assert "| 4 |" in answer and "| 5 |" not in answer   # 只列前 5 条，全空的列不显示
+    assert "完整数据请查看下方明细" in answer
@@ -0,0 +1,138 @@
+"""
+单元测试：memory.py 中的 Token 预算记忆
+
+测试覆盖：
+- 预算内的历史原样保留
+- 超出预算的早期轮次折叠进摘要，摘要增量更新
+- 摘要函数失败时使用兜底摘要，超长摘要按 token 截断
+- 历史清空后摘要状态重置
+- 早期轮次的工具返回压缩为摘要，完整内容可按句柄取回
+- 滑动窗口按整轮截取，工具调用较多的轮次不会挤掉历史
+"""
+
+import json
+import os
+import re
+import sys
+
+import pytest
+
+pytest.importorskip("langchain_core")
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
+
+from memory import (ToolResultStore, build_chat_context, compact_history, estimate_tokens, split_turns,
+                    truncate_tokens)
+
+
+def make_history(n_turns, size=50):
+    history = []
+    for i in range(n_turns):
+        history.append(HumanMessage(content=f"问题{i}" + "问" * size))
+        history.append(AIMessage(content=f"回答{i}" + "答" * size))
+    return history
+
+
+def test_budget_keeps_recent_turns():
+    history = make_history(3)
+    payload = build_chat_context("新问题", history, strategy="budget", token_budget=10000)
+    assert payload["messages"][:-1] == history
+    assert split_turns(history) == [(0, 2), (2, 4), (4, 6)]
+    assert estimate_tokens("防御区ab") == 4
+
+
+def test_evicted_turns_are_summarized_incrementally():
+    calls = []
+
+    def summarizer(summary, messages):
+        calls.append(len(messages))
+        return (summary + "|" if summary else "") + ",".join(m.content[:3] for m in messages if m.type == "human")
+
+    state = {}
+    history = make_history(4)
+    payload = build_chat_context("新问题", history, strategy="budget", token_budget=250,
+                                 summary_state=state, summarizer=summarizer)
+    messages = payload["messages"]
+    assert state["covered"] == 4 and calls == [4]
+    assert "问题0,问题1" in messages[0].content and isinstance(messages[1], AIMessage)
+    assert messages[2:-1] == history[4:]
+
+    # 再来一轮：只摘要新移出的消息
+    history += make_history(1)
+    build_chat_context("再问", history, strategy="budget", token_budget=250,
+                       summary_state=state, summarizer=summarizer)
+    assert calls == [4, 2] and state["summary"].startswith("问题0,问题1|")
+
+
+def test_summarizer_failure_and_reset():
+    def broken(summary, messages):
+        raise RuntimeError("模型不可用")
+
+    state = {}
+    history = make_history(4)
+    build_chat_context("新问题", history, strategy="budget", token_budget=150,
+                       summary_state=state, summarizer=broken)
+    assert state["summary"].startswith("用户曾问: 问题0")
+
+    payload = build_chat_context("新问题", [], strategy="budget", summary_state=state)
+    assert state == {} and len(payload["messages"]) == 1
+
+
+def test_long_summary_truncated_by_tokens():
+    assert truncate_tokens("abc", 10) == "abc"
+    text = "summary " * 200
+    assert estimate_tokens(truncate_tokens(text, 50)) <= 50
+    assert len(truncate_tokens(text, 50)) > 50   # 按 token 而不是按字符截断
+
+    state = {}
+    build_chat_context("新问题", make_history(4), strategy="budget", token_budget=150, summary_state=state,
+                       summarizer=lambda summary, messages: "summary " * 300 + "摘要" * 300)
+    assert estimate_tokens(state["summary"]) <= 400 and len(state["summary"]) > 400
+
+
+def make_tool_turn(question, call_id, ids):
+    rows = [{"node": {"label": "防御区", "properties": {"id": i, "核查描述": "坡体" * 100}}} for i in ids]
+    return [
+        HumanMessage(content=question),
+        AIMessage(content="", tool_calls=[{"name": "execute_cypher_query", "id": call_id,
+                                           "args": {"cypher_query": "MATCH (n:防御区) RETURN {node: n}"}}]),
+        ToolMessage(content=json.dumps(rows, ensure_ascii=False), tool_call_id=call_id, name="execute_cypher_query"),
+        AIMessage(content="查到了"),
+    ]
+
+
+def test_old_tool_results_are_compacted():
+    store = ToolResultStore()
+    history = make_tool_turn("问题一", "call-1", ["A1", "A2", "A3"]) + make_tool_turn("问题二", "call-2", ["B1"])
+    compacted = compact_history(history, keep_turns=1, store=store)
+
+    assert len(compacted) == len(history) and compacted[6] is history[6]
+    digest = compacted[2].content
+    assert compacted[2].tool_call_id == "call-1"
+    assert "返回 3 条数据" in digest and "A1, A2, A3" in digest and "MATCH (n:防御区)" in digest
+    handle = re.search(r"tr-[0-9a-f]+", digest).group()
+    assert store.get(handle) == history[2].content
+    assert estimate_tokens(digest) < estimate_tokens(history[2].content) / 5
+
+    # 窗口按整轮截取，不会从工具消息中间开始
+    payload = build_chat_context("新问题", history, strategy="window", k=3)
+    assert payload["messages"][0].content == "问题二"
+    payload = build_chat_context("新问题", history, strategy="window", k=4)
+    assert payload["messages"][0].content == "问题一"
+
+
+def test_window_keeps_tool_heavy_turn():
+    history = make_history(2)
+    history += [HumanMessage(content="上一问"),
+                AIMessage(content="", tool_calls=[{"name": "execute_cypher_query", "args": {}, "id": f"c{i}"}
+                                                  for i in range(3)])]
+    history += [ToolMessage(content="[]", tool_call_id=f"c{i}") for i in range(3)]
+    history.append(AIMessage(content="上一答"))
+
+    payload = build_chat_context("新问题", history, strategy="window", k=6, compact_tools=False)
+    contents = [m.content for m in payload["messages"]]
+    assert contents[0].startswith("问题0") and "上一问" in contents and contents[-2:] == ["上一答", "新问题"]
+    payload = build_chat_context("新问题", history, strategy="window", k=2, compact_tools=False)
+    assert payload["messages"][:-1] == history[4:]
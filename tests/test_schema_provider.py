@@ -0,0 +1,66 @@
+"""
+单元测试：schema_provider.py 中的实时 Schema 读取与合并
+
+测试覆盖：
+- 从 ag_catalog 与标签表读取标签、属性键与关系端点
+- 实时结构为准，覆盖来源提供说明/ID 键/属性顺序，漂移的手工定义被丢弃
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# config.py 导入时要求 API Key，这里的测试不会调用模型
+os.environ.setdefault("DASHSCOPE_API_KEY", "test-key")
+
+from schema_provider import build_live_schema, introspect_graph
+
+
+class FakeCursor:
+    """按 SQL 内容返回预置结果的游标"""
+
+    def __init__(self):
+        self.sql = []
+        self._rows = []
+
+    def execute(self, sql, params=None):
+        self.sql.append(sql)
+        if "ag_catalog.ag_label" in sql:
+            self._rows = [("防御区", "v"), ("核查人", "v"), ("核查", "e")]
+        elif "MATCH (n:`防御区`)" in sql:
+            self._rows = [('"风险等级"',), ('"id"',), ('"面积"',)]
+        elif "MATCH (n:`核查人`)" in sql:
+            self._rows = [('"姓名"',), ('"电话"',)]
+        elif "[r:`核查`]" in sql:
+            self._rows = [('"核查人"', '"防御区"')]
+
+    def fetchall(self):
+        return self._rows
+
+
+def test_introspect_graph():
+    cursor = FakeCursor()
+    labels, relationships = introspect_graph(cursor, graph_name="g", sample_size=50)
+    assert labels == {"防御区": ["id", "面积", "风险等级"], "核查人": ["姓名", "电话"]}
+    assert relationships == [("核查", "核查人", "防御区")]
+    assert "LIMIT 50" in cursor.sql[1]
+
+
+def test_live_schema_with_overrides():
+    labels = {"防御区": ["id", "面积", "风险等级", "坡度"], "核查人": ["姓名", "电话"]}
+    relationships = [("核查", "核查人", "防御区")]
+    excel = {"防御区": {"desc": "防御区实体", "query_key": "姓名", "properties": ["坡度"]}}
+    static = {
+        "防御区": {"desc": "重点防御的地质灾害区域", "id_key": "id", "properties": ["风险等级", "面积", "核查描述"]},
+        "核查人": {"desc": "核查人员", "id_key": "工号", "properties": ["单位"]},
+        "核查单位": {"desc": "单位", "id_key": "单位名称", "properties": []},
+    }
+    schema, rels, dropped = build_live_schema(labels, relationships, [excel, static],
+                                              ["核查 (核查人 -> 防御区)", "隶属 (核查人 -> 核查单位)"])
+
+    assert schema["防御区"] == {"desc": "重点防御的地质灾害区域", "id_key": "id",
+                               "properties": ["风险等级", "面积", "坡度"]}
+    # 手工 ID 键在图谱中不存在时自动推断
+    assert schema["核查人"]["id_key"] == "姓名" and schema["核查人"]["properties"] == ["电话"]
+    assert rels == ["核查 (核查人 -> 防御区)"]
+    assert dropped == ["核查单位", "隶属 (核查人 -> 核查单位)"]
@@ -0,0 +1,79 @@
+"""
+单元测试：schema_selector.py 中的 Schema 子集挑选
+
+测试覆盖：
+- 标签数较少时直接使用完整 Schema
+- 标签名/属性名/实体链接直接命中，并沿关系扩展一跳
+- 语义命中与低置信度回退
+- 结果按问题缓存
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from schema_selector import SchemaSelector, parse_relationship
+
+SCHEMA = {
+    "核查人": {"desc": "核查人员", "id_key": "姓名", "properties": ["单位"]},
+    "防御区": {"desc": "防御区域", "id_key": "id", "properties": ["面积", "风险等级"]},
+    "承灾体": {"desc": "受威胁对象", "id_key": "id", "properties": ["威胁财产"]},
+    "核查单位": {"desc": "单位", "id_key": "单位名称", "properties": []},
+    "雨量站": {"desc": "降雨监测站点", "id_key": "站号", "properties": ["累计雨量"]},
+    "隐患点": {"desc": "地质灾害隐患点", "id_key": "编号", "properties": ["规模"]},
+}
+RELATIONSHIPS = [
+    "隶属 (核查人 -> 核查单位)",
+    "核查 (核查人 -> 防御区)",
+    "防御区承灾体关系 (防御区 -> 承灾体)",
+    "监测 (雨量站 -> 隐患点)",
+]
+
+
+class KeywordEncoder:
+    """按关键词给向量分量，用于替代 bge 模型"""
+    KEYWORDS = ["雨", "隐患", "核查", "防御", "威胁"]
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, texts):
+        self.calls += 1
+        vectors = np.array([[1.0 if k in t else 0.0 for k in self.KEYWORDS] + [0.2] for t in texts])
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_small_schema_uses_full():
+    selector = SchemaSelector(SCHEMA, RELATIONSHIPS, full_max_labels=6)
+    assert selector.select("哪些雨量站").full
+    assert parse_relationship("核查 (核查人 -> 防御区)") == ("核查", "核查人", "防御区")
+
+
+def test_direct_hits_expand_one_hop():
+    selector = SchemaSelector(SCHEMA, RELATIONSHIPS, full_max_labels=3)
+    selection = selector.select("风险等级是中级的防御区有哪些")
+    assert not selection.full
+    assert set(selection.schema) == {"防御区", "核查人", "承灾体"}
+    assert selection.schema["防御区"]["properties"] == ["面积", "风险等级"]
+    assert selection.schema["核查人"]["properties"] == [] and selection.schema["核查人"]["id_key"] == "姓名"
+    assert "监测 (雨量站 -> 隐患点)" not in selection.relationships
+
+    selection = selector.select("张三负责哪些区域", entity_hits=["核查人"])
+    assert set(selection.schema) == {"核查人", "核查单位", "防御区"}
+
+
+def test_semantic_hits_fallback_and_cache():
+    encoder = KeywordEncoder()
+    selector = SchemaSelector(SCHEMA, RELATIONSHIPS, encoder=encoder, threshold=0.6,
+                              min_confidence=0.6, full_max_labels=3)
+    selection = selector.select("最近下雨多的地方")
+    assert not selection.full and {"雨量站", "隐患点"} <= set(selection.schema)
+    assert "防御区" not in selection.schema
+
+    assert selector.select("今天天气怎么样").full
+    calls = encoder.calls
+    selector.select("最近下雨多的地方？")
+    assert encoder.calls == calls
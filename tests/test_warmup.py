@@ -0,0 +1,47 @@
+"""
+单元测试：warmup.py 中的后台预热
+
+测试覆盖：
+- 后台线程依次执行步骤并记录状态与说明
+- 单步失败不影响后续步骤
+- 重复启动只运行一次
+"""
+
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from warmup import Warmup, WarmupStep
+
+
+def wait_done(warmup, timeout=5.0):
+    deadline = time.time() + timeout
+    while not warmup.done and time.time() < deadline:
+        time.sleep(0.01)
+    return warmup.snapshot()
+
+
+def test_steps_run_in_background():
+    calls = []
+
+    def fail():
+        calls.append("fail")
+        raise RuntimeError("连接失败")
+
+    warmup = Warmup([
+        WarmupStep("模型", lambda: calls.append("model") or "已就绪"),
+        WarmupStep("连接", fail),
+        WarmupStep("问题", lambda: calls.append("question")),
+    ])
+    assert warmup.snapshot()["progress"] == 0.0
+    warmup.start()
+    warmup.start()
+    snapshot = wait_done(warmup)
+
+    assert calls == ["model", "fail", "question"]
+    assert snapshot["done"] and snapshot["progress"] == 1.0
+    assert [s["status"] for s in snapshot["steps"]] == ["done", "failed", "done"]
+    assert snapshot["steps"][0]["detail"] == "已就绪"
+    assert snapshot["steps"][1]["detail"] == "连接失败"
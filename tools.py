@@ -1,11 +1,21 @@
 import json, re, os
-import psycopg2
-from langchain_core.tools import tool
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.tools import StructuredTool
 from streamlit_agraph import agraph, Node, Edge, Config
 from sentence_transformers import SentenceTransformer, CrossEncoder
 
-from config import DB_CONFIG, GRAPH_NAME, ORIGIN_NAME
+from config import (GRAPH_NAME, ORIGIN_NAME, TOOL_TIMEOUT_SECONDS, INFERENCE_WORKERS,
+                    CYPHER_FALLBACK_ENABLED, CYPHER_FALLBACK_MAX_VALUES, ENTITY_FULL_REFRESH_SECONDS,
+                    HYBRID_MAX_NEIGHBOURS)
+from db import pooled_connection, data_version
+from cypher_fallback import FallbackLadder, ValueDictionary
+from entity_linker import EntityLinker
+from graph_expansion import build_expansion_query, group_neighbours, normalize_id, table_label
+from intent_router import IntentRouter
+from schema_provider import get_schema
 from prompts import get_zero_results_hint
+from memory import TOOL_RESULT_STORE
 
 
 # 定义映射关系：Agent 传过来的 category -> 数据库里的表名
@@ -66,6 +76,9 @@ if RETRIEVER and RERANKER:
 else:
     print("⚠️ 警告：部分模型加载失败，相关功能可能无法使用")
 
+# 模型推理线程池 (异步工具中的向量编码与重排序在此执行，不阻塞事件循环)
+INFERENCE_EXECUTOR = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix="inference")
+
 
 
 
@@ -92,24 +105,10 @@ def _clean_age_data(raw_data):
         # 如果不是 JSON（比如只是普通字符串 "Hello"），就返回清洗后的字符串
         return clean_str
 
-@tool
-def execute_cypher_query(cypher_query: str) -> str:
-    """
-    执行 Cypher 查询。
-    输入必须是纯 Cypher 语句，例如: MATCH (n:核查人) RETURN {info: n}
-    不要包含 SQL 包装。
-    """
-    print(f"\n[图谱精准检索] 大模型生成的Cypher: {cypher_query}")
-    
-    conn = None
-    try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cursor = conn.cursor()
-        
-        # 初始化 AGE
-        cursor.execute("LOAD 'age';")
-        cursor.execute("SET search_path = ag_catalog, '$user', public;")
-        
+def _query_graph(cypher_query: str) -> list:
+    """(内部函数) 执行 Cypher 并返回清洗后的结果行 (出错时抛异常)"""
+    # 从连接池借连接 (AGE 已在连接初始化时加载)
+    with pooled_connection() as conn, conn.cursor() as cursor:
         # SQL 包装器 (单列返回策略)
         full_sql = f"""
         SELECT * FROM cypher('{GRAPH_NAME}', $$
@@ -121,15 +120,45 @@ def execute_cypher_query(cypher_query: str) -> str:
         
         cursor.execute(full_sql)
         rows = cursor.fetchall()
-        
-        # 清洗结果
-        results = [_clean_age_data(row[0]) for row in rows]
-        # results = [row[0] for row in rows]
+    
+    # 清洗结果
+    return [_clean_age_data(row[0]) for row in rows]
+
+
+# 零结果自动改写 (规范化匹配 -> 取值字典模糊匹配 -> 去掉关系方向)
+FALLBACK_LADDER = FallbackLadder(
+    _query_graph,
+    ValueDictionary(_query_graph, max_values=CYPHER_FALLBACK_MAX_VALUES, version_provider=data_version),
+)
+
+# 实体链接词典 (图谱中各标签的 ID/名称属性)，首次使用或预热时构建
+ENTITY_LINKER = EntityLinker(_query_graph, get_schema, version_provider=data_version,
+                             full_refresh_seconds=ENTITY_FULL_REFRESH_SECONDS)
+
+# 常见问题模板直达 (槽位由实体链接与取值字典填充)
+INTENT_ROUTER = IntentRouter(_query_graph, ENTITY_LINKER, value_lookup=FALLBACK_LADDER.dictionary.values)
+
+
+def _run_cypher(cypher_query: str) -> str:
+    """
+    执行 Cypher 查询。
+    输入必须是纯 Cypher 语句，例如: MATCH (n:核查人) RETURN {info: n}
+    不要包含 SQL 包装。
+    """
+    print(f"\n[图谱精准检索] 大模型生成的Cypher: {cypher_query}")
+    
+    try:
+        results = _query_graph(cypher_query)
 
         # === 核心修改：零结果处理策略 ===
         if len(results) == 0:
+            # 先在服务端按固定顺序自动改写重试，省去模型多轮试错
+            fallback = FALLBACK_LADDER.retry(cypher_query) if CYPHER_FALLBACK_ENABLED else None
+            if fallback is not None and fallback.rows:
+                print(f"[图谱精准检索] 改写后返回 {len(fallback.rows)} 条数据 ({fallback.rewrite['description']})")
+                return json.dumps({"rewrite": fallback.rewrite, "results": fallback.rows}, ensure_ascii=False)
             print("[图谱精准检索] ⚠️ 查询结果为空，返回引导提示")
-            return get_zero_results_hint(query_info=cypher_query)
+            return get_zero_results_hint(query_info=cypher_query) + (fallback.tried_note() if fallback else "")
         # ===============================
 
         print(f"[图谱精准检索] 返回 {len(results)} 条数据")
@@ -140,92 +169,286 @@ def execute_cypher_query(cypher_query: str) -> str:
         error_msg = f"查询失败: {str(e)}"
         print(f"[Tool] ❌ 报错: {error_msg}")
         return error_msg
-    finally:
-        if conn:
-            conn.close()
 
-@tool
-def search_knowledge_base(query: str, category: str = "defense_area") -> str:
+async def _with_timeout(awaitable, label: str) -> str:
     """
-    通用语义检索工具。
-    返回：匹配到的原始 JSON 数据列表。
+    (内部函数) 为单次工具调用加超时，超时后返回提示文本而不是抛出异常，
+    这样同一步中并发执行的其他工具调用结果仍然可用
     """
+    try:
+        return await asyncio.wait_for(awaitable, timeout=TOOL_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        msg = f"{label}超时 (>{TOOL_TIMEOUT_SECONDS:.0f}s)，请缩小查询范围 (如增加过滤条件或 LIMIT) 后重试。"
+        print(f"[Tool] ⏱️ {msg}")
+        return msg
+
+
+async def _arun_cypher(cypher_query: str) -> str:
+    """execute_cypher_query 的异步版本：在线程中执行，带超时"""
+    return await _with_timeout(asyncio.to_thread(_run_cypher, cypher_query), "图谱查询")
+
+
+def _vector_candidates(query_vector: list, target_table: str) -> list:
+    """(内部函数) 数据库向量初筛 (Top 50)"""
+    with pooled_connection() as conn, conn.cursor() as cursor:
+        # 使用 <=> 操作符计算余弦距离
+        sql = f"""
+            SELECT content, full_metadata, (embedding <=> %s::vector) as distance, node_id
+            FROM "{ORIGIN_NAME}"."{target_table}" 
+            ORDER BY distance ASC
+            LIMIT 50
+        """
+        cursor.execute(sql, (json.dumps(query_vector),))
+        return cursor.fetchall()
+
+
+def _rank_results(rows: list, scores) -> list:
+    """(内部函数) 将重排序分数与原始数据绑定，按分数降序取 Top 5"""
+    ranked_results = []
+    for i in range(len(rows)):
+        ranked_results.append({
+            "score": float(scores[i]),
+            "data": rows[i][1], # full_metadata (JSON格式)
+            "node_id": rows[i][3],
+        })
+        
+    # 按分数降序排列，取 Top 5
+    ranked_results.sort(key=lambda x: x["score"], reverse=True)
+    return ranked_results[:5]
+
+
+def _format_search_response(query: str, category: str, rows: list, scores) -> str:
+    """(内部函数) 将重排序分数与原始数据绑定，取 Top 5 并格式化返回"""
+    final_top_5 = [{"score": r["score"], "data": r["data"]} for r in _rank_results(rows, scores)]
+
+    print(f"[语义检索] 内容： {final_top_5}")
+    
+    # 格式化返回 (通用化改造)
+    final_response = {
+        # 1. 元数据 (Meta Info)：告诉 LLM 这是怎么来的
+        "meta_context": {
+            "source_tool": "vector_semantic_search", # 明确告知是向量检索
+            "retrieval_query": query,                # 明确告知用的什么关键词查的
+            "target_category": category,             # 明确告知查的什么分类
+            "record_count": len(final_top_5),     # 查到了几条
+            "description": "The following data was retrieved based on vector semantic similarity. Please use this context to answer the user's question."
+        },
+        
+        # 2. 数据载荷 (Payload)：纯净的原始数据列表
+        "search_results": final_top_5
+    }
+
+    # 返回整个大的 JSON 对象
+    return json.dumps(final_response, ensure_ascii=False, indent=2)
+
+
+def _check_search_args(category: str):
+    """(内部函数) 检查模型与分类，返回 (目标表, 错误信息)"""
     # 检查模型是否已加载
     if RETRIEVER is None or RERANKER is None:
         error_msg = "模型未正确加载，请检查模型文件是否已下载并放置在正确位置。"
         print(f"[语义检索] ❌ 错误: {error_msg}")
-        return error_msg
+        return None, error_msg
     
-    # 1. 确定要查哪张表
+    # 确定要查哪张表
     target_table = TABLE_MAP.get(category)
     if not target_table:
-        return f"系统错误: 未知的分类 '{category}'，请检查工具调用参数。"
+        return None, f"系统错误: 未知的分类 '{category}'，请检查工具调用参数。"
+    return target_table, None
+
+
+def _search_knowledge_base(query: str, category: str = "defense_area") -> str:
+    """
+    通用语义检索工具。
+    返回：匹配到的原始 JSON 数据列表。
+    """
+    target_table, error_msg = _check_search_args(category)
+    if error_msg:
+        return error_msg
 
-    conn = None
     try:
         # 1. 将用户问题转向量
         query_vector = RETRIEVER.encode(query).tolist()
         
-        conn = psycopg2.connect(**DB_CONFIG)
-        cursor = conn.cursor()
-        
         # 2. 数据库向量初筛 (Top 50)
-        # 使用 <=> 操作符计算余弦距离
-        sql = f"""
-            SELECT content, full_metadata, (embedding <=> %s::vector) as distance
-            FROM "{ORIGIN_NAME}"."{target_table}" 
-            ORDER BY distance ASC
-            LIMIT 50
-        """
-        cursor.execute(sql, (json.dumps(query_vector),))
-        rows = cursor.fetchall()
-        
+        rows = _vector_candidates(query_vector, target_table)
         if not rows:
             return "未找到相关信息。"
             
         # 3. 重排序 (Reranking) - 提升精度的关键
         # 准备数据对: [[query, doc1], [query, doc2]...]
         pairs = [[query, row[0]] for row in rows]
-        
-        # 计算相关性分数
         scores = RERANKER.predict(pairs)
         
-        # 将分数和原始数据绑定
-        ranked_results = []
-        for i in range(len(rows)):
-            ranked_results.append({
-                "score": float(scores[i]),
-                "data": rows[i][1] # full_metadata (JSON格式)
-            })
-            
-        # 按分数降序排列，取 Top 5
-        ranked_results.sort(key=lambda x: x["score"], reverse=True)
-        final_top_5 = ranked_results[:5]
+        # 4. 格式化返回
+        return _format_search_response(query, category, rows, scores)
 
-        print(f"[语义检索] 内容： {final_top_5}")
-        
-        # 4. 格式化返回 (通用化改造)
-        final_response = {
-            # 1. 元数据 (Meta Info)：告诉 LLM 这是怎么来的
-            "meta_context": {
-                "source_tool": "vector_semantic_search", # 明确告知是向量检索
-                "retrieval_query": query,                # 明确告知用的什么关键词查的
-                "target_category": category,             # 明确告知查的什么分类
-                "record_count": len(final_top_5),     # 查到了几条
-                "description": "The following data was retrieved based on vector semantic similarity. Please use this context to answer the user's question."
-            },
-            
-            # 2. 数据载荷 (Payload)：纯净的原始数据列表
-            "search_results": final_top_5
-        }
+    except Exception as e:
+        return f"检索出错: {str(e)}"
+
+
+async def _asearch_knowledge_base(query: str, category: str = "defense_area") -> str:
+    """
+    search_knowledge_base 的异步版本：
+    模型推理放入推理线程池，数据库查询放入线程中，整体带超时
+    """
+    target_table, error_msg = _check_search_args(category)
+    if error_msg:
+        return error_msg
 
-        # 返回整个大的 JSON 对象
-        return json.dumps(final_response, ensure_ascii=False, indent=2)
+    async def search():
+        loop = asyncio.get_running_loop()
+        try:
+            query_vector = await loop.run_in_executor(INFERENCE_EXECUTOR, RETRIEVER.encode, query)
+            rows = await asyncio.to_thread(_vector_candidates, query_vector.tolist(), target_table)
+            if not rows:
+                return "未找到相关信息。"
+            pairs = [[query, row[0]] for row in rows]
+            scores = await loop.run_in_executor(INFERENCE_EXECUTOR, RERANKER.predict, pairs)
+            return _format_search_response(query, category, rows, scores)
+        except Exception as e:
+            return f"检索出错: {str(e)}"
+
+    return await _with_timeout(search(), "语义检索")
+
+
+def _expand_hits(target_table: str, hits: list) -> dict:
+    """(内部函数) 一次批量查询展开全部命中节点的一跳邻居，按 node_id 分组"""
+    label = table_label(target_table)
+    id_key = get_schema().schema.get(label, {}).get("id_key", "id")
+    node_ids = [h["node_id"] for h in hits if h["node_id"] is not None]
+    if not node_ids:
+        return {}
+    cypher = build_expansion_query(label, id_key, node_ids)
+    print(f"[混合检索] 图谱展开: {cypher}")
+    return group_neighbours(node_ids, _query_graph(cypher), max_per_hit=HYBRID_MAX_NEIGHBOURS)
+
+
+def _format_hybrid_response(query: str, category: str, hits: list, groups: dict, graph_error: str = "") -> str:
+    """(内部函数) 每条语义命中附带其图谱邻居，一次返回"""
+    results = []
+    for hit in hits:
+        group = groups.get(normalize_id(hit["node_id"]), {"neighbour_count": 0, "neighbours": []})
+        results.append({**hit, **group})
+
+    final_response = {
+        "meta_context": {
+            "source_tool": "hybrid_search",
+            "retrieval_query": query,
+            "target_category": category,
+            "record_count": len(results),
+            "description": "Each search result was retrieved by vector semantic similarity, "
+                           "and 'neighbours' lists its directly connected nodes in the knowledge graph "
+                           "(direction '->' means the hit points to the neighbour).",
+        },
+        "search_results": results,
+    }
+    if graph_error:
+        final_response["meta_context"]["graph_error"] = graph_error
+    return json.dumps(final_response, ensure_ascii=False, indent=2)
+
+
+def _hybrid_search(query: str, category: str = "defense_area") -> str:
+    """
+    混合检索：语义检索 + 重排序取 Top 5，再用一次图谱查询展开每条命中的一跳邻居。
+    返回：命中数据及各自的关联节点 (负责人、承灾体等)。
+    """
+    target_table, error_msg = _check_search_args(category)
+    if error_msg:
+        return error_msg
 
+    try:
+        query_vector = RETRIEVER.encode(query).tolist()
+        rows = _vector_candidates(query_vector, target_table)
+        if not rows:
+            return "未找到相关信息。"
+        scores = RERANKER.predict([[query, row[0]] for row in rows])
+        hits = _rank_results(rows, scores)
     except Exception as e:
         return f"检索出错: {str(e)}"
-    finally:
-        if conn: conn.close()
+
+    # 图谱展开失败时仍返回语义检索结果
+    try:
+        groups, graph_error = _expand_hits(target_table, hits), ""
+    except Exception as e:
+        print(f"[混合检索] ⚠️ 图谱展开失败: {e}")
+        groups, graph_error = {}, f"图谱展开失败: {e}"
+    return _format_hybrid_response(query, category, hits, groups, graph_error)
+
+
+async def _ahybrid_search(query: str, category: str = "defense_area") -> str:
+    """hybrid_search 的异步版本：模型推理放入推理线程池，数据库查询放入线程中，整体带超时"""
+    target_table, error_msg = _check_search_args(category)
+    if error_msg:
+        return error_msg
+
+    async def search():
+        loop = asyncio.get_running_loop()
+        try:
+            query_vector = await loop.run_in_executor(INFERENCE_EXECUTOR, RETRIEVER.encode, query)
+            rows = await asyncio.to_thread(_vector_candidates, query_vector.tolist(), target_table)
+            if not rows:
+                return "未找到相关信息。"
+            pairs = [[query, row[0]] for row in rows]
+            scores = await loop.run_in_executor(INFERENCE_EXECUTOR, RERANKER.predict, pairs)
+            hits = _rank_results(rows, scores)
+        except Exception as e:
+            return f"检索出错: {str(e)}"
+
+        try:
+            groups, graph_error = await asyncio.to_thread(_expand_hits, target_table, hits), ""
+        except Exception as e:
+            print(f"[混合检索] ⚠️ 图谱展开失败: {e}")
+            groups, graph_error = {}, f"图谱展开失败: {e}"
+        return _format_hybrid_response(query, category, hits, groups, graph_error)
+
+    return await _with_timeout(search(), "混合检索")
+
+
+def _recall_tool_result(handle: str) -> str:
+    """
+    取回历史对话中被压缩的工具结果的完整数据。
+    handle 为压缩摘要中给出的句柄，例如 tr-1a2b3c4d5e。
+    """
+    content = TOOL_RESULT_STORE.get(handle)
+    if content is None:
+        return f"系统错误: 句柄 '{handle}' 已过期或不存在，请重新调用原工具查询。"
+    return content
+
+
+# 工具返回的失败提示 (这类结果不写入答案缓存)
+TOOL_ERROR_PREFIXES = ("查询失败", "检索出错", "模型未正确加载", "系统错误")
+
+
+def is_tool_error(content: str) -> bool:
+    """工具返回是否为失败/超时提示"""
+    return content.startswith(TOOL_ERROR_PREFIXES) or "超时 (>" in content
+
+
+# 工具同时提供同步与异步实现：
+# Agent 以 astream/ainvoke 运行时，同一步中的多个工具调用并发执行，单轮耗时取决于最慢的调用
+execute_cypher_query = StructuredTool.from_function(
+    func=_run_cypher,
+    coroutine=_arun_cypher,
+    name="execute_cypher_query",
+)
+
+search_knowledge_base = StructuredTool.from_function(
+    func=_search_knowledge_base,
+    coroutine=_asearch_knowledge_base,
+    name="search_knowledge_base",
+)
+
+hybrid_search = StructuredTool.from_function(
+    func=_hybrid_search,
+    coroutine=_ahybrid_search,
+    name="hybrid_search",
+)
+
+recall_tool_result = StructuredTool.from_function(
+    func=_recall_tool_result,
+    name="recall_tool_result",
+)
 
 
 def generate_graph_from_data(data_list):
@@ -0,0 +1,150 @@
+# warmup.py
+import asyncio
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+
+@dataclass
+class WarmupStep:
+    name: str
+    func: Callable[[], Optional[str]]   # 返回可选的说明文字 (如 "已缓存")
+    status: str = "pending"             # pending | running | done | failed
+    detail: str = ""
+    seconds: float = 0.0
+
+
+class Warmup:
+    """
+    启动预热：在后台线程中依次执行预热步骤，单步失败不影响后续步骤
+
+    状态可在任意线程中通过 snapshot() 读取，用于在侧边栏显示进度。
+    """
+
+    def __init__(self, steps: List[WarmupStep]):
+        self.steps = steps
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def start(self) -> "Warmup":
+        """启动后台线程 (重复调用无效)"""
+        with self._lock:
+            if self._thread is None:
+                self.started_at = time.time()
+                self._thread = threading.Thread(target=self.run, name="warmup", daemon=True)
+                self._thread.start()
+        return self
+
+    def run(self):
+        """顺序执行全部步骤 (后台线程入口，也可直接同步调用)"""
+        for step in self.steps:
+            with self._lock:
+                step.status = "running"
+            start = time.perf_counter()
+            try:
+                detail = step.func() or ""
+                status = "done"
+            except Exception as e:
+                detail, status = str(e), "failed"
+                print(f"[Warmup] ⚠️ {step.name} 失败: {e}")
+            with self._lock:
+                step.status, step.detail = status, detail
+                step.seconds = time.perf_counter() - start
+        with self._lock:
+            self.finished_at = time.time()
+        print(f"[Warmup] ✅ 预热结束，耗时 {self.finished_at - (self.started_at or self.finished_at):.1f}s")
+
+    @property
+    def done(self) -> bool:
+        return self.finished_at is not None
+
+    def snapshot(self) -> dict:
+        """
+        当前进度
+
+        Returns:
+            dict: {"done", "progress" (0-1), "current", "steps": [{"name", "status", "detail", "seconds"}]}
+        """
+        with self._lock:
+            steps = [{"name": s.name, "status": s.status, "detail": s.detail, "seconds": s.seconds}
+                     for s in self.steps]
+            done = self.finished_at is not None
+        finished = sum(s["status"] in ("done", "failed") for s in steps)
+        current = next((s["name"] for s in steps if s["status"] == "running"), None)
+        return {
+            "done": done,
+            "progress": finished / len(steps) if steps else 1.0,
+            "current": current,
+            "steps": steps,
+        }
+
+
+def _warm_models() -> str:
+    from tools import RETRIEVER, RERANKER
+    if RETRIEVER is None or RERANKER is None:
+        return "模型未加载，跳过"
+    # 首次推理会初始化计算内核，先各跑一次
+    RETRIEVER.encode(["预热"], normalize_embeddings=True)
+    RERANKER.predict([["预热", "预热"]])
+    return "检索/重排序模型已就绪"
+
+
+def _warm_pool() -> str:
+    from db import warm_pool, data_version
+    from config import DB_POOL_MIN
+    opened = warm_pool(max(DB_POOL_MIN, 2))
+    return f"{opened} 个连接，数据版本 {data_version()}"
+
+
+def _build_entity_index() -> str:
+    from config import ENTITY_LINKING_ENABLED
+    from tools import ENTITY_LINKER
+    if not ENTITY_LINKING_ENABLED:
+        return "未启用，跳过"
+    return ENTITY_LINKER.refresh()
+
+
+def _answer_question(agent, answer_cache, question: str) -> str:
+    """执行一次完整的 Agent 回合 (模型 + 工具调用)，结果写入答案缓存"""
+    from langchain_core.messages import AIMessage, ToolMessage
+    from memory import build_chat_context
+    from tools import is_tool_error
+
+    if answer_cache is not None and answer_cache.lookup(question) is not None:
+        return "已缓存"
+    result = asyncio.run(agent.ainvoke(build_chat_context(question, [], strategy="none")))
+    messages = result["messages"]
+    payloads = [{"name": m.name, "content": m.content} for m in messages if isinstance(m, ToolMessage)]
+    answer = messages[-1].content if messages and isinstance(messages[-1], AIMessage) else ""
+    if any(is_tool_error(p["content"]) for p in payloads):
+        return f"{len(payloads)} 次工具调用，有失败，未缓存"
+    if answer_cache is not None:
+        answer_cache.store(question, answer, payloads)
+    return f"{len(payloads)} 次工具调用，已缓存"
+
+
+def build_warmup(agent, answer_cache, questions: List[str], run_agent: bool = True) -> Warmup:
+    """
+    构建默认的预热步骤：模型推理 -> 数据库连接池 -> 实体词典 -> 逐个执行快捷问题并写入答案缓存
+
+    Args:
+        agent: create_agent 创建的 Agent
+        answer_cache: 语义答案缓存 (可为 None，此时快捷问题只用于预热工具与连接)
+        questions (list): 快捷问题
+        run_agent (bool): 是否执行快捷问题 (会消耗模型调用)
+
+    Returns:
+        Warmup: 未启动的预热对象
+    """
+    steps = [
+        WarmupStep("加载检索模型", _warm_models),
+        WarmupStep("建立数据库连接", _warm_pool),
+        WarmupStep("构建实体词典", _build_entity_index),
+    ]
+    if run_agent:
+        for q in questions:
+            steps.append(WarmupStep(f"快捷问题: {q}", lambda q=q: _answer_question(agent, answer_cache, q)))
+    return Warmup(steps)